@@ -0,0 +1,507 @@
+"""Benchmark the bot's event handlers against a fake, in-process Slack
+
+Replays a synthetic (or recorded, one JSON event per line) stream of RTM events
+through the handlers and reports throughput, handler latency, the API calls
+made per event and, optionally, memory allocations. With --ingest, events are
+sent over Socket Mode or the Events API instead, and acknowledgements timed.
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import random
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from slack_sdk.signature import SignatureVerifier
+
+from fakes import (
+    BOT_USER_ID,
+    TEAM_ID,
+    FakeAsyncWebClient,
+    FakeRTMClient,
+    FakeSlack,
+    FakeSocketModeServer,
+    FakeWebClient,
+)
+from producer_bot import async_bot, bot, dedup, ingest, scheduler
+from producer_bot.plugins import PLUGINS, startup_report
+from producer_bot.profiler import PROFILE
+
+TOKEN = "xoxb-benchmark"
+# Requests per minute for every method, when Slack's rate limits are ignored
+UNLIMITED = 1e9
+SIGNING_SECRET = "benchmark-secret"
+# Concurrent requests posting events to the Events API endpoint
+SENDERS = 8
+
+MESSAGES = [
+    "does anyone know where the buyers are?",
+    "i'm checking a box in clickops again",
+    "parked in the garage",
+    "wait for it",
+    "back to the office, no more isolation",
+    "that's a real deal :wave:",
+    "roll the dice",
+    "just chatting about lunch",
+    "nothing to see here",
+    "see you all on friday",
+    f"<@{BOT_USER_ID.lower()}> parrot status",
+]
+REACTIONS = ["thumbsup", "eyes", "tada", "wave", "rip", bot.BACKTRACK_EMOJI]
+EVENT_WEIGHTS = {
+    "message": 60,
+    "reaction_added": 20,
+    "reaction_removed": 5,
+    "user_typing": 15,
+}
+
+
+def synthetic_events(  # pylint: disable=too-many-locals
+    count: int, users: int, channels: int, seed: int
+) -> List[Dict]:
+    """A plausible mix of messages, reactions to recent messages and typing"""
+    rng = random.Random(seed)
+    user_ids = [f"U{number:04}" for number in range(users)]
+    # a few direct messages among the channels
+    channel_ids = [
+        f"{'D' if number % 10 == 9 else 'C'}{number:04}" for number in range(channels)
+    ]
+    started = time.time()
+    messages: List[Dict] = []
+    events = []
+    for number in range(count):
+        event_type = rng.choices(*zip(*EVENT_WEIGHTS.items()))[0]
+        user = rng.choice(user_ids)
+        channel = rng.choice(channel_ids)
+        timestamp = f"{started + number / 1000:.6f}"
+        if event_type == "message" or not messages:
+            event = {
+                "type": "message",
+                "channel": channel,
+                "user": user,
+                "text": rng.choice(MESSAGES),
+                "ts": timestamp,
+            }
+            messages.append(event)
+        elif event_type == "user_typing":
+            event = {"type": "user_typing", "channel": channel, "user": user}
+        else:
+            message = rng.choice(messages[-50:])
+            event = {
+                "type": event_type,
+                "user": user,
+                "reaction": rng.choice(REACTIONS),
+                "item": {
+                    "type": "message",
+                    "channel": message["channel"],
+                    "ts": message["ts"],
+                },
+                "event_ts": timestamp,
+            }
+        events.append(event)
+    return events
+
+
+def with_duplicates(events: List[Dict], fraction: float, seed: int) -> List[Dict]:
+    """Deliver a fraction of events again shortly after, as after a reconnect"""
+    rng = random.Random(seed)
+    replayed = list(events)
+    for position in sorted(rng.sample(range(len(events)), int(len(events) * fraction))):
+        replayed.insert(
+            min(len(replayed), position + rng.randint(1, 20)), events[position]
+        )
+    return replayed
+
+
+def recorded_events(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as events:
+        return [json.loads(line) for line in events if line.strip()]
+
+
+def percentile(values: List[float], percent: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Run:
+    """Timings from dispatching a stream of events"""
+
+    def __init__(self, slack: FakeSlack, rtm_client, web_client):
+        self.slack = slack
+        self.kwargs = {"rtm_client": rtm_client, "web_client": web_client}
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        # with --ingest, how long each event took to be acknowledged
+        self.acks: List[float] = []
+        self.ingest_stats: Counter = Counter()
+
+    def _failed(self, event_type: str, exception: Exception):
+        self.errors[event_type] += 1
+        logging.error(f"{event_type} handler failed: {exception!r}")
+
+    def dispatch(self, handler: Callable, event_type: str, data: Dict, loop):
+        """Run a handler the way the RTM client does, waiting for it to finish"""
+        started = time.perf_counter()
+        with self.slack.dispatching(event_type):
+            try:
+                if inspect.iscoroutinefunction(handler):
+                    loop.run_until_complete(handler(data=data, **self.kwargs))
+                else:
+                    handler(data=data, **self.kwargs)
+            except Exception as exception:  # pylint: disable=broad-except
+                self._failed(event_type, exception)
+        self.latencies[event_type].append(time.perf_counter() - started)
+
+    async def dispatch_async(self, handler: Callable, event_type: str, data: Dict):
+        started = time.perf_counter()
+        with self.slack.dispatching(event_type):
+            try:
+                if inspect.iscoroutinefunction(handler):
+                    await handler(data=data, **self.kwargs)
+                else:
+                    handler(data=data, **self.kwargs)
+            except Exception as exception:  # pylint: disable=broad-except
+                self._failed(event_type, exception)
+        self.latencies[event_type].append(time.perf_counter() - started)
+
+
+def split(event: Dict) -> Tuple[str, Dict]:
+    data = dict(event)
+    return data.pop("type"), data
+
+
+def run_sync(run: Run, handlers: Dict[str, Callable], events: List[Dict]):
+    loop = asyncio.new_event_loop()
+    try:
+        for event in events:
+            event_type, data = split(event)
+            if event_type in handlers and not dedup.DEDUP.duplicate(event_type, data):
+                run.dispatch(handlers[event_type], event_type, data, loop)
+    finally:
+        loop.close()
+
+
+async def run_async(run: Run, handlers: Dict[str, Callable], events: List[Dict]):
+    tasks = []
+    for event in events:
+        event_type, data = split(event)
+        handler = handlers.get(event_type)
+        if handler is None or dedup.DEDUP.duplicate(event_type, data):
+            continue
+        if hasattr(handler, "foreground"):
+            # what in_background would do, but keeping hold of the task to time it
+            tasks.append(
+                asyncio.ensure_future(
+                    run.dispatch_async(handler.foreground, event_type, data)
+                )
+            )
+        else:
+            await run.dispatch_async(handler, event_type, data)
+        # the RTM client waits on the websocket between events
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+
+def timed_handler(run: Run, event_type: str, handler: Callable) -> Callable:
+    """A handler which times itself, for the ingestor's workers to run"""
+    handler = getattr(handler, "foreground", handler)
+    if inspect.iscoroutinefunction(handler):
+
+        async def timed_async(data: Dict, **kwargs):  # pylint: disable=unused-argument
+            await run.dispatch_async(handler, event_type, data)
+
+        return timed_async
+
+    def timed(data: Dict, **kwargs):  # pylint: disable=unused-argument
+        run.dispatch(handler, event_type, data, None)
+
+    return timed
+
+
+def send_socket_mode(run: Run, ingestor: ingest.Ingestor, events: List[Dict]):
+    server = FakeSocketModeServer()
+    run.slack.socket_url = server.url
+    source = ingest.SocketModeSource(
+        ingestor, "xapp-benchmark", run.kwargs["web_client"]
+    )
+    source.start(block=False)
+    server.connected.wait(10)
+    for event in events:
+        server.send(event)
+    # the client receives and acknowledges on threads of its own
+    deadline = time.monotonic() + 30
+    while len(server.acked) < len(events) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    ingestor.join()
+    source.stop()
+    server.close()
+    run.acks = server.ack_latencies()
+
+
+def send_events_api(run: Run, ingestor: ingest.Ingestor, events: List[Dict]):
+    source = ingest.HttpEventsSource(ingestor, SIGNING_SECRET, port=0)
+    source.start(block=False)
+    url = f"http://127.0.0.1:{source.port}{ingest.EVENTS_PATH}"
+    signer = SignatureVerifier(SIGNING_SECRET)
+
+    def post(event: Dict) -> float:
+        body = json.dumps(
+            {"type": "event_callback", "team_id": TEAM_ID, "event": event}
+        ).encode()
+        timestamp = str(int(time.time()))
+        request = urllib.request.Request(
+            url,
+            body,
+            {
+                "Content-Type": "application/json",
+                "X-Slack-Request-Timestamp": timestamp,
+                "X-Slack-Signature": signer.generate_signature(
+                    timestamp=timestamp, body=body
+                ),
+            },
+        )
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request):
+                pass
+        except urllib.error.HTTPError:
+            # a 503 when the queue is full, counted by the ingestor
+            pass
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(SENDERS) as executor:
+        run.acks = list(executor.map(post, events))
+    ingestor.join()
+    source.stop()
+
+
+def run_ingest(run: Run, handlers: Dict[str, Callable], events: List[Dict], args):
+    ingestor = ingest.Ingestor(
+        {
+            event_type: timed_handler(run, event_type, handler)
+            for event_type, handler in handlers.items()
+        },
+        run.kwargs["web_client"],
+        run.kwargs["rtm_client"],
+        args.workers,
+        args.queue_size,
+    )
+    if args.ingest == "socket":
+        send_socket_mode(run, ingestor, events)
+    else:
+        send_events_api(run, ingestor, events)
+    run.ingest_stats = ingestor.stats
+
+
+def report(run: Run, seconds: float, allocations) -> Dict:
+    events = sum(len(latencies) for latencies in run.latencies.values())
+    results = {
+        "events": events,
+        "seconds": round(seconds, 3),
+        "events_per_second": round(events / seconds, 1) if seconds else None,
+        "rate_limited": sum(run.slack.rate_limited.values()),
+        "duplicates_dropped": dict(dedup.DEDUP.suppressed),
+        "by_event": {},
+    }
+    for event_type, latencies in sorted(run.latencies.items()):
+        calls = run.slack.calls.get(event_type, Counter())
+        results["by_event"][event_type] = {
+            "count": len(latencies),
+            "errors": run.errors[event_type],
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "api_calls_per_event": round(sum(calls.values()) / len(latencies), 2),
+            "api_calls": dict(calls.most_common()),
+        }
+    if run.acks:
+        results["ingest"] = {
+            "ack_p50_ms": round(percentile(run.acks, 50) * 1000, 3),
+            "ack_p99_ms": round(percentile(run.acks, 99) * 1000, 3),
+            **run.ingest_stats,
+        }
+    if allocations:
+        results["allocations"] = allocations
+    return results
+
+
+def print_report(results: Dict):
+    print(
+        f"{results['events']} events in {results['seconds']}s: "
+        f"{results['events_per_second']} events/s, "
+        f"{results['rate_limited']} calls rate limited, "
+        f"{sum(results['duplicates_dropped'].values())} duplicates dropped"
+    )
+    print(
+        f"{'event':<18}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'calls/event':>13}  calls"
+    )
+    for event_type, stats in results["by_event"].items():
+        calls = ", ".join(
+            f"{method}={count}" for method, count in stats["api_calls"].items()
+        )
+        print(
+            f"{event_type:<18}{stats['count']:>7}{stats['errors']:>8}"
+            f"{stats['p50_ms']:>10}{stats['p99_ms']:>10}"
+            f"{stats['api_calls_per_event']:>13}  {calls}"
+        )
+    if "ingest" in results:
+        stats = results["ingest"]
+        print(
+            f"Acknowledged in {stats['ack_p50_ms']} ms (p50), "
+            f"{stats['ack_p99_ms']} ms (p99); "
+            f"{stats.get('dropped', 0)} events dropped, "
+            f"{stats.get('failed', 0)} failed"
+        )
+    if "allocations" in results:
+        allocations = results["allocations"]
+        print(
+            f"Memory: {allocations['peak_kib']} KiB peak, "
+            f"{allocations['retained_kib']} KiB retained"
+        )
+        for site in allocations["top"]:
+            print(f"  {site}")
+
+
+def print_startup():
+    for plugin in PLUGINS.values():
+        plugin.load()
+    print(startup_report())
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument(
+        "--replay", help="a file of RTM events, one JSON object per line"
+    )
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--duplicates",
+        type=float,
+        default=0.0,
+        help="fraction of events delivered twice",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.01, help="seconds per API call"
+    )
+    parser.add_argument(
+        "--rate-limit-rate",
+        type=float,
+        default=0.0,
+        help="fraction of API calls answered with a 429",
+    )
+    parser.add_argument("--retry-after", type=float, default=0.01)
+    parser.add_argument(
+        "--slack-limits",
+        action="store_true",
+        help="pace calls to Slack's real rate limits",
+    )
+    parser.add_argument("--async", dest="run_async", action="store_true")
+    parser.add_argument(
+        "--ingest",
+        choices=["socket", "http"],
+        help="send events over Socket Mode or the Events API, to a worker pool",
+    )
+    parser.add_argument("--workers", type=int, default=ingest.INGEST_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=ingest.INGEST_QUEUE_SIZE)
+    parser.add_argument("--allocations", action="store_true")
+    parser.add_argument(
+        "--profile-rules",
+        action="store_true",
+        help="time every trigger rule on its own, and report the slowest",
+    )
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="report the startup time and every plugin's import cost, then exit",
+    )
+    return parser.parse_args()
+
+
+def measure(run: Run, handlers: Dict[str, Callable], events: List[Dict], args):
+    if args.allocations:
+        tracemalloc.start()
+    started = time.perf_counter()
+    if args.ingest:
+        run_ingest(run, handlers, events, args)
+    elif args.run_async:
+        asyncio.run(run_async(run, handlers, events))
+    else:
+        run_sync(run, handlers, events)
+    seconds = time.perf_counter() - started
+
+    if not args.allocations:
+        return seconds, None
+    snapshot = tracemalloc.take_snapshot()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, {
+        "peak_kib": round(peak / 1024, 1),
+        "retained_kib": round(retained / 1024, 1),
+        "top": [str(stat) for stat in snapshot.statistics("lineno")[:5]],
+    }
+
+
+def print_results(results: Dict, args):
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+    if args.profile_rules:
+        print(PROFILE.report())
+
+
+def quiet_logging():
+    logging.getLogger().setLevel(logging.WARNING)
+    # tracing may be configured, but there's nowhere to export spans to
+    logging.getLogger("opentelemetry").setLevel(logging.CRITICAL)
+    # 429s are counted in the results instead
+    logging.getLogger(scheduler.__name__).setLevel(logging.ERROR)
+
+
+def main():
+    args = parse_args()
+    if args.startup:
+        print_startup()
+        return
+
+    quiet_logging()
+    random.seed(args.seed)
+
+    if args.replay:
+        events = recorded_events(args.replay)
+    else:
+        events = synthetic_events(args.events, args.users, args.channels, args.seed)
+    events = with_duplicates(events, args.duplicates, args.seed)
+
+    slack = FakeSlack(args.latency, args.rate_limit_rate, args.retry_after, args.seed)
+    if not args.slack_limits:
+        scheduler.SCHEDULERS[TOKEN] = scheduler.OutboundScheduler(
+            limits={}, default_limit=UNLIMITED
+        )
+    run = Run(slack, FakeRTMClient(slack, TOKEN), FakeWebClient(slack, token=TOKEN))
+    handlers = dict(bot.HANDLERS)
+    if args.run_async:
+        async_bot.WEB_CLIENTS[TOKEN] = FakeAsyncWebClient(slack, token=TOKEN)
+        handlers.update(async_bot.HANDLERS)
+
+    if args.profile_rules:
+        bot.MATCHER.profile = PROFILE
+
+    seconds, allocations = measure(run, handlers, events, args)
+    print_results(report(run, seconds, allocations), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import asyncio
+import contextlib
+import contextvars
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+from aiohttp import WSMsgType, web
+
+from producer_bot.clients import ScheduledAsyncWebClient, ScheduledWebClient
+
+BOT_USER_ID = "UBOT"
+TEAM_ID = "TFAKE"
+
+# The event being handled, so API calls can be counted against it
+EVENT_TYPE: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "EVENT_TYPE", default=None
+)
+
+
+class FakeSlack:  # pylint: disable=too-many-instance-attributes
+    """An in-process stand-in for the Slack Web API
+
+    Answers the methods the bot uses with plausible responses, after `latency`
+    seconds, and fails a `rate_limit_rate` fraction of calls with a 429.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 0.01,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.calls: Dict[str, Counter] = defaultdict(Counter)
+        self.rate_limited: Counter = Counter()
+        self.event_type: Optional[str] = None
+        # where apps.connections.open sends Socket Mode clients
+        self.socket_url: Optional[str] = None
+        self._reactions: Dict[Tuple[str, str], Dict[str, set]] = defaultdict(dict)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def dispatching(self, event_type: str):
+        """Count the API calls made inside the block against an event type"""
+        # threads from the reactions executor don't see the context variable
+        self.event_type = event_type
+        token = EVENT_TYPE.set(event_type)
+        try:
+            yield
+        finally:
+            EVENT_TYPE.reset(token)
+
+    def _record(self, method: str):
+        event_type = EVENT_TYPE.get() or self.event_type or "other"
+        self.calls[event_type][method] += 1
+
+    def record(self, method: str):
+        """Count a call which doesn't go through the Web API (e.g. RTM typing)"""
+        with self._lock:
+            self._record(method)
+
+    def request(self, method: str, params: Dict[str, Any]) -> Tuple[int, Dict, Dict]:
+        """Handle an API call, returning the status, headers and body"""
+        with self._lock:
+            self._record(method)
+            if self._random.random() < self.rate_limit_rate:
+                self.rate_limited[method] += 1
+                return (
+                    429,
+                    {"Retry-After": str(self.retry_after)},
+                    {"ok": False, "error": "ratelimited"},
+                )
+            body = self._respond(method, params)
+        return 200, {}, {"ok": "error" not in body, **body}
+
+    def _respond(  # pylint: disable=too-many-return-statements
+        self, method: str, params: Dict[str, Any]
+    ):
+        if method == "auth.test":
+            return {"user_id": BOT_USER_ID, "team_id": TEAM_ID}
+        if method == "users.info":
+            user = params.get("user", "")
+            return {
+                "user": {
+                    "id": user,
+                    "is_bot": user == BOT_USER_ID,
+                    "profile": {"display_name": user.lower()},
+                }
+            }
+        if method == "conversations.info":
+            channel = params.get("channel", "")
+            info = {
+                "id": channel,
+                "is_im": channel.startswith("D"),
+                "is_private": not channel.startswith("C"),
+            }
+            # like Slack, DMs have no name
+            if not info["is_im"]:
+                info["name"] = channel.lower()
+            return {"channel": info}
+        if method in ("users.list", "conversations.list"):
+            return {"members" if method == "users.list" else "channels": []}
+        if method.startswith("reactions."):
+            return self._reaction(method, params)
+        if method == "chat.getPermalink":
+            return {
+                "permalink": f"https://fake.slack.com/archives/{params.get('channel')}"
+                f"/p{params.get('message_ts', '').replace('.', '')}"
+            }
+        if method in ("chat.postMessage", "chat.postEphemeral"):
+            return {"channel": params.get("channel"), "ts": f"{time.time():.6f}"}
+        if method == "apps.connections.open":
+            return {"url": self.socket_url}
+        return {}
+
+    def _reaction(  # pylint: disable=too-many-return-statements
+        self, method: str, params: Dict[str, Any]
+    ):
+        reactions = self._reactions[(params.get("channel"), params.get("timestamp"))]
+        name = params.get("name")
+        if method == "reactions.add":
+            if BOT_USER_ID in reactions.get(name, ()):
+                return {"error": "already_reacted"}
+            reactions.setdefault(name, set()).add(BOT_USER_ID)
+        elif method == "reactions.remove":
+            if BOT_USER_ID not in reactions.get(name, ()):
+                return {"error": "no_reaction"}
+            reactions[name].discard(BOT_USER_ID)
+        elif method == "reactions.get":
+            return {
+                "type": "message",
+                "message": {
+                    "reactions": [
+                        {"name": name, "users": sorted(users), "count": len(users)}
+                        for name, users in reactions.items()
+                        if users
+                    ]
+                },
+            }
+        return {}
+
+
+def _method(url: str) -> str:
+    return urlparse(url).path.rsplit("/", 1)[-1]
+
+
+def _params(url: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    params = dict(parse_qsl(urlparse(url).query))
+    for arg in ("params", "data", "json"):
+        if isinstance(args.get(arg), dict):
+            params.update(args[arg])
+    return params
+
+
+class FakeWebClient(ScheduledWebClient):
+    """A ScheduledWebClient which talks to a FakeSlack instead of Slack"""
+
+    def __init__(self, slack: FakeSlack, **kwargs):
+        super().__init__(**kwargs)
+        self.slack = slack
+
+    def _perform_urllib_http_request(self, *, url: str, args: Dict) -> Dict:
+        if self.slack.latency:
+            time.sleep(self.slack.latency)
+        status, headers, body = self.slack.request(_method(url), _params(url, args))
+        return {"status": status, "headers": headers, "body": json.dumps(body)}
+
+
+class FakeAsyncWebClient(ScheduledAsyncWebClient):
+    """A ScheduledAsyncWebClient which talks to a FakeSlack instead of Slack"""
+
+    def __init__(self, slack: FakeSlack, **kwargs):
+        super().__init__(**kwargs)
+        self.slack = slack
+
+    async def _request(self, *, http_verb, api_url, req_args) -> Dict:
+        if self.slack.latency:
+            await asyncio.sleep(self.slack.latency)
+        status, headers, body = self.slack.request(
+            _method(api_url), _params(api_url, req_args)
+        )
+        return {"data": body, "headers": headers, "status_code": status}
+
+
+class FakeRTMClient:
+    """Enough of an RTMClient for the event handlers"""
+
+    def __init__(self, slack: FakeSlack, token: str, ssl=None):
+        self.slack = slack
+        self.token = token
+        self.ssl = ssl
+
+    async def typing(self, channel: str):  # pylint: disable=unused-argument
+        self.slack.record("rtm.typing")
+
+
+class FakeSocketModeServer:  # pylint: disable=too-many-instance-attributes
+    """A Socket Mode endpoint which sends events and times their acknowledgements
+
+    Runs on its own event loop thread; point `FakeSlack.socket_url` at `url`.
+    """
+
+    def __init__(self):
+        self.sent: Dict[str, float] = {}
+        self.acked: Dict[str, float] = {}
+        self.connected = threading.Event()
+        self._ids = itertools.count()
+        self._socket: Optional[web.WebSocketResponse] = None
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self._loop.run_forever, name="fake-socket-mode", daemon=True
+        ).start()
+        self._runner = web.AppRunner(web.Application())
+        self.url = self._call(self._start())
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _start(self) -> str:
+        self._runner.app.router.add_get("/", self._connect)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        host, port = self._runner.addresses[0][:2]
+        return f"ws://{host}:{port}/"
+
+    async def _connect(self, request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        await socket.send_json({"type": "hello", "num_connections": 1})
+        self._socket = socket
+        self.connected.set()
+        async for message in socket:
+            if message.type == WSMsgType.TEXT:
+                envelope_id = json.loads(message.data).get("envelope_id")
+                if envelope_id:
+                    self.acked[envelope_id] = time.perf_counter()
+        return socket
+
+    def send(self, event: Dict):
+        """Send an event to the connected client, as the Events API would"""
+        envelope_id = f"envelope-{next(self._ids)}"
+        envelope = {
+            "envelope_id": envelope_id,
+            "type": "events_api",
+            "accepts_response_payload": False,
+            "retry_attempt": 0,
+            "payload": {"type": "event_callback", "team_id": TEAM_ID, "event": event},
+        }
+        self.sent[envelope_id] = time.perf_counter()
+        self._call(self._socket.send_json(envelope))
+
+    def ack_latencies(self):
+        """Seconds from sending each acknowledged event to its acknowledgement"""
+        return [
+            self.acked[envelope_id] - sent
+            for envelope_id, sent in self.sent.items()
+            if envelope_id in self.acked
+        ]
+
+    def close(self):
+        self._call(self._runner.cleanup())
+        self._loop.call_soon_threadsafe(self._loop.stop)
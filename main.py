@@ -1,7 +1,8 @@
 import os
 import producer_bot
 
-BOT = producer_bot.get_bot(os.environ["SLACK_API_TOKEN"])
-
+# only when run, as chart workers import this module again
 if __name__ == "__main__":
+    BOT = producer_bot.get_bot(os.environ["SLACK_API_TOKEN"])
+    producer_bot.serve_metrics()
     BOT.start()
@@ -1 +1,17 @@
-from .bot import get_bot
+# Nothing is imported until the bot is wanted, so a module of this package can
+# be imported on its own (e.g. by a chart worker) without starting anything
+
+
+def __getattr__(name):
+    if name == "get_bot":
+        # pylint: disable=import-outside-toplevel,unused-import
+        # imported first, so the startup time covers everything else
+        from .plugins import STARTED
+        from .bot import get_bot
+
+        return get_bot
+    if name == "serve_metrics":
+        from .metrics import serve_metrics  # pylint: disable=import-outside-toplevel
+
+        return serve_metrics
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,53 @@
+import os
+import re
+from typing import Callable, Dict, Optional
+
+from .features import Message
+from .matcher import Matcher
+from .throttle import THROTTLE
+
+ADMIN_DEBUG_CHANNEL = os.environ.get("ADMIN_DEBUG_CHANNEL", "")
+# Users who can send admin commands anywhere else too, e.g. "U0123,U0456"
+ADMIN_USERS = set(filter(None, os.environ.get("ADMIN_USERS", "").split(",")))
+
+# Commands for the admin channel (or admin users), and what they reply
+COMMANDS: Dict[str, Callable[[], str]] = {
+    "throttle status": THROTTLE.status_text,
+}
+
+# Admin commands are only ever @mentions, so no message needs scanning for them
+MATCHER = Matcher([])
+
+
+def command_for(message: Message) -> Optional[Callable[[], str]]:
+    """The command the message is, if it's from someone allowed to send it"""
+    if message.channel != ADMIN_DEBUG_CHANNEL and message.user not in ADMIN_USERS:
+        return None
+    # the whole message after the @mention, which a DM can leave out
+    return COMMANDS.get(re.sub(r"^<@[a-z0-9]+>", "", message.text).strip())
+
+
+def on_mention(message: Message):
+    respond = command_for(message)
+    if respond is None:
+        return
+
+    message.web_client.chat_postEphemeral(
+        channel=message.channel,
+        thread_ts=message.thread_ts,
+        user=message.user,
+        text=respond(),
+    )
+
+
+async def on_mention_async(message: Message):
+    respond = command_for(message)
+    if respond is None:
+        return
+
+    await message.web_client.chat_postEphemeral(
+        channel=message.channel,
+        thread_ts=message.thread_ts,
+        user=message.user,
+        text=respond(),
+    )
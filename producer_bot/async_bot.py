@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from functools import wraps
+from typing import Callable, Dict, Set
+
+import slack_sdk
+from slack_sdk.rtm import RTMClient
+
+from .bot import (
+    BACKTRACK_EMOJI,
+    PARROT,
+    ROUTER,
+    message_for,
+    reaction_args,
+    set_reaction_attributes,
+    tracer,
+)
+from .clients import ScheduledAsyncWebClient
+from .decorator import start_as_current_span
+from .enrichment import set_user_attributes_async
+from .events import EventHandlers
+from .reactions import remove_bot_reactions_async
+from .slack_helper import get_bot_user_id_async
+
+HANDLERS = EventHandlers()
+
+WEB_CLIENTS: Dict[str, ScheduledAsyncWebClient] = {}
+TASKS: Set[asyncio.Task] = set()
+
+
+def get_web_client(rtm_client: RTMClient) -> ScheduledAsyncWebClient:
+    """The AsyncWebClient sharing the RTM client's token"""
+    if rtm_client.token not in WEB_CLIENTS:
+        WEB_CLIENTS[rtm_client.token] = ScheduledAsyncWebClient(
+            token=rtm_client.token, ssl=rtm_client.ssl
+        )
+    return WEB_CLIENTS[rtm_client.token]
+
+
+def _task_done(task: asyncio.Task):
+    TASKS.discard(task)
+    if not task.cancelled() and task.exception():
+        logging.error(task.exception())
+
+
+def in_background(func: Callable) -> Callable:
+    """Run the handler as a task, so the RTM client can dispatch the next event"""
+
+    @wraps(func)
+    async def func_wrapper(**kwargs):
+        task = asyncio.ensure_future(func(**kwargs))
+        TASKS.add(task)
+        task.add_done_callback(_task_done)
+
+    # the handler itself, for callers which need to wait for it (e.g. benchmarks)
+    func_wrapper.foreground = func
+    return func_wrapper
+
+
+@HANDLERS.on("message")
+@in_background
+@start_as_current_span(tracer=tracer, span_name="on_message")
+async def on_message(
+    data: Dict, rtm_client: RTMClient, span, **kwargs
+):  # pylint: disable=unused-argument
+    # handle different structure of edited messages correctly
+    if data.get("subtype") == "message_replied":
+        span.set_attribute("app.message.type", "message_replied")
+        logging.debug("Skipping event as it's a message_replied event")
+        return
+
+    web_client = get_web_client(rtm_client)
+    span.set_attribute("app.channel", data["channel"])
+    span.set_attribute("app.timestamp", data["ts"])
+    set_user_attributes_async(span, web_client, data.get("user", ""))
+
+    bot_user_id = await get_bot_user_id_async(web_client)
+    await ROUTER.dispatch_async(message_for(web_client, data, bot_user_id))
+
+
+@HANDLERS.on("reaction_added")
+@in_background
+@start_as_current_span(tracer=tracer, span_name="reaction_added")
+async def on_reaction_added(
+    data: Dict, rtm_client: RTMClient, span, **kwargs
+):  # pylint: disable=unused-argument
+    web_client = get_web_client(rtm_client)
+    set_reaction_attributes(span, data)
+    set_user_attributes_async(span, web_client, data.get("user", ""))
+
+    if data["reaction"] == BACKTRACK_EMOJI:
+        for result in await remove_bot_reactions_async(web_client, data["item"]):
+            if not result.ok:
+                logging.error(
+                    f"Failed to remove reaction {result.name}: {result.error}"
+                )
+
+    try:
+        await PARROT.on_reaction_added_async(web_client, *reaction_args(data))
+    except slack_sdk.errors.SlackApiError as exception:
+        logging.error(exception)
+
+
+@HANDLERS.on("reaction_removed")
+@in_background
+@start_as_current_span(tracer=tracer, span_name="on_reaction_removed")
+async def on_reaction_removed(
+    data: Dict, rtm_client: RTMClient, span, **kwargs
+):  # pylint: disable=unused-argument
+    web_client = get_web_client(rtm_client)
+    set_reaction_attributes(span, data)
+    set_user_attributes_async(span, web_client, data.get("user", ""))
+
+    try:
+        await PARROT.on_reaction_removed_async(web_client, *reaction_args(data))
+    except slack_sdk.errors.SlackApiError as exception:
+        logging.error(exception)
+
+
+@HANDLERS.on("user_typing")
+@in_background
+@start_as_current_span(tracer=tracer, span_name="on_user_typing")
+async def on_user_typing(
+    data: Dict, rtm_client: RTMClient, span, **kwargs
+):  # pylint: disable=unused-argument
+    web_client = get_web_client(rtm_client)
+    span.set_attribute("app.channel", data["channel"])
+    set_user_attributes_async(span, web_client, data.get("user", ""))
+
+    try:
+        await PARROT.on_user_typing(rtm_client, data["channel"], data["user"])
+    except slack_sdk.errors.SlackApiError as exception:
+        logging.error(exception)
@@ -1,26 +1,35 @@
 import logging
 import os
 import ssl
-from typing import Dict
+import threading
+from typing import Dict, Tuple
 import slack_sdk
 from slack_sdk.rtm import RTMClient
 
 from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 
-from . import corrector, dice_roller, triggered_reactions
-from .parrot import Parrot
+from .admin import COMMANDS
+from .features import FeatureRouter, Message
+from .matcher import Matcher
+from .parrot import PARROT
+from .plugins import enabled_plugins, startup_report
 from .slack_helper import (
-    event_item_to_reactions_api,
-    get_bot_reactions,
     get_bot_user_id,
-    is_channel_im,
-    user_display_name,
+    invalidate_channel,
+    update_user,
 )
 from .version import get_version, get_instance_hash
+from .warmup import warm_caches
 from .decorator import start_as_current_span
+from .enrichment import set_user_attributes
+from .tracing import configure_tracing
+from .clients import ScheduledRTMClient, ScheduledWebClient
+from .events import EventHandlers, register
+from .ingest import INGESTION, EventClient, Ingestor, event_source
+from .reactions import remove_bot_reactions
+from .profiler import PROFILE, RULE_PROFILE_LOG_INTERVAL, RULE_PROFILING
+from .rules import RULES_FILE, RuleReloader
+from .ruleset import combined
 
 DEBUG_CHANNEL = os.environ.get("DEBUG_CHANNEL", "")
 ADMIN_DEBUG_CHANNEL = os.environ.get("ADMIN_DEBUG_CHANNEL", "")
@@ -28,34 +37,61 @@ ANNOUNCEMENT_CHANNEL = os.environ.get("ANNOUNCEMENT_CHANNEL", "")
 
 SLACK_API_TOKEN_USER = os.environ.get("SLACK_API_TOKEN_USER")
 
+# Handle messages and reactions with coroutines on an AsyncWebClient
+ASYNC_MODE = os.environ.get("ASYNC_MODE", "").lower() in ("1", "true", "yes")
+# Bulk load the user and channel caches when the bot first connects
+WARM_CACHES = os.environ.get("WARM_CACHES", "").lower() in ("1", "true", "yes")
+
 BACKTRACK_EMOJI = "no_entry_sign"
+# Events which mean a cached channel is out of date
+CHANNEL_CHANGE_EVENTS = (
+    "channel_rename",
+    "channel_archive",
+    "channel_unarchive",
+    "channel_left",
+    "group_rename",
+    "group_archive",
+    "group_unarchive",
+    "group_left",
+    "member_joined_channel",
+    "member_left_channel",
+)
+
 EMOJI_VERBIAGE = {
     "add": "added",
     "remove": "removed",
 }
 
-PARROT = Parrot(ADMIN_DEBUG_CHANNEL)
-
-# Initialize tracing and an exporter that can send data to Honeycomb
-HONEYCOMB_TOKEN = os.environ.get("HONEYCOMB_TOKEN")
-provider = TracerProvider()
-processor = BatchSpanProcessor(
-    OTLPSpanExporter(
-        endpoint="https://api.honeycomb.io/v1/traces",
-        headers={"x-honeycomb-team": HONEYCOMB_TOKEN},
-    )
-)
-provider.add_span_processor(processor)
-trace.set_tracer_provider(provider)
+# Every enabled plugin's rules compiled together, so each message is only scanned once
+MATCHER = Matcher(rule for plugin in enabled_plugins() for rule in plugin.matcher.rules)
+ROUTER = FeatureRouter(enabled_plugins())
+
+if RULE_PROFILING:
+    MATCHER.profile = PROFILE
+    if RULE_PROFILE_LOG_INTERVAL:
+        PROFILE.log_every(RULE_PROFILE_LOG_INTERVAL)
+
+# The rule tables can come from RULES_FILE instead, reloaded when it changes
+RELOADER = RuleReloader(enabled_plugins(), MATCHER, ROUTER)
+if RULES_FILE:
+    RELOADER.watch()
+COMMANDS["reload rules"] = RELOADER.reload
+COMMANDS["rule profile reset"] = PROFILE.reset
+COMMANDS["rule profile"] = PROFILE.report
+
+# Initialize tracing, sampling and exporting as configured in the environment
+configure_tracing()
 tracer = trace.get_tracer(__name__)
 
+HANDLERS = EventHandlers()
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s  %(module)s:%(funcName)s %(message)s",
 )
 
 
-@RTMClient.run_on(event="hello")
+@HANDLERS.on("hello")
 @start_as_current_span(tracer=tracer, span_name="on_hello")
 def on_hello(
     web_client: slack_sdk.WebClient, **kwargs
@@ -64,6 +100,11 @@ def on_hello(
 
     if on_hello.FIRST_CONNECT:
         on_hello.FIRST_CONNECT = False
+        logging.info(startup_report())
+        if WARM_CACHES:
+            threading.Thread(
+                target=warm_caches, args=(web_client,), name="warmup", daemon=True
+            ).start()
         web_client.chat_postMessage(
             channel=ADMIN_DEBUG_CHANNEL,
             text=f":hello-my-name-is: Bot version {get_version()} connected on {get_instance_hash()}",
@@ -73,7 +114,7 @@ def on_hello(
 on_hello.FIRST_CONNECT = True
 
 
-@RTMClient.run_on(event="goodbye")
+@HANDLERS.on("goodbye")
 @start_as_current_span(tracer=tracer, span_name="on_goodbye")
 def on_goodbye(**kwargs):  # pylint: disable=unused-argument
     logging.info(
@@ -81,7 +122,30 @@ def on_goodbye(**kwargs):  # pylint: disable=unused-argument
     )
 
 
-@RTMClient.run_on(event="message")
+def message_for(web_client, data: Dict, bot_user_id: str) -> Message:
+    """A message event as the features see it, with the rules it matches"""
+    text = data.get("text", "").lower()
+    return Message(
+        web_client=web_client,
+        data=data,
+        text=text,
+        matches=combined(MATCHER).match(text),
+        mentioned=text.startswith(f"<@{bot_user_id.lower()}>"),
+    )
+
+
+def set_reaction_attributes(span, data: Dict):
+    span.set_attribute("app.reaction", data["reaction"])
+    span.set_attribute("app.channel", data["item"]["channel"])
+    span.set_attribute("app.timestamp", data["item"]["ts"])
+
+
+def reaction_args(data: Dict) -> Tuple[str, str, str, str]:
+    """The reaction, channel, timestamp and user the parrot's handlers are given"""
+    return (data["reaction"], data["item"]["channel"], data["item"]["ts"], data["user"])
+
+
+@HANDLERS.on("message")
 @start_as_current_span(tracer=tracer, span_name="on_message")
 def on_message(
     data: Dict, web_client: slack_sdk.WebClient, span, **kwargs
@@ -92,120 +156,55 @@ def on_message(
         logging.debug("Skipping event as it's a message_replied event")
         return
 
-    text = data.get("text", "").lower()
-    channel = data["channel"]
-    timestamp = data["ts"]
-    user = data.get("user", "")
-
     span.set_attribute("app.channel", data["channel"])
     span.set_attribute("app.timestamp", data["ts"])
-    span.set_attribute("app.user", user)
-    if user:
-        span.set_attribute("app.user_display_name", user_display_name(web_client, user))
-
-    try:
-        triggered_reactions.handle_message(channel, timestamp, text, web_client)
-    except slack_sdk.errors.SlackApiError as exception:
-        logging.error(exception)
+    set_user_attributes(span, web_client, data.get("user", ""))
 
-    if "dice" in text:
-        try:
-            dice_roller.roll(channel, timestamp, web_client)
-        except slack_sdk.errors.SlackApiError as exception:
-            logging.error(exception)
+    ROUTER.dispatch(message_for(web_client, data, get_bot_user_id(web_client)))
 
-    try:
-        corrector.trigger(channel, timestamp, user, text, web_client)
-    except slack_sdk.errors.SlackApiError as exception:
-        logging.error(exception)
-
-    try:
-        if "bot_id" not in data:  # don't trigger on bots
-            bot_user_id = get_bot_user_id(web_client).lower()
-            if text.startswith(f"<@{bot_user_id}>") or is_channel_im(
-                channel, web_client
-            ):
-                PARROT.on_app_mention(
-                    web_client, text, channel, data.get("thread_ts", None), user
-                )
-            PARROT.on_message(web_client, text, channel, timestamp, user)
-    except slack_sdk.errors.SlackApiError as exception:
-        logging.error(exception)
 
-
-@RTMClient.run_on(event="reaction_added")
+@HANDLERS.on("reaction_added")
 @start_as_current_span(tracer=tracer, span_name="reaction_added")
 def on_reaction_added(
     data: Dict, web_client: slack_sdk.WebClient, span, **kwargs
 ):  # pylint: disable=unused-argument
-    span.set_attribute("app.reaction", data["reaction"])
-    span.set_attribute("app.channel", data["item"]["channel"])
-    span.set_attribute("app.timestamp", data["item"]["ts"])
-    span.set_attribute("app.user", data.get("user", ""))
-    if data.get("user", ""):
-        span.set_attribute(
-            "app.user_display_name", user_display_name(web_client, data.get("user", ""))
-        )
+    set_reaction_attributes(span, data)
+    set_user_attributes(span, web_client, data.get("user", ""))
 
     if data["reaction"] == BACKTRACK_EMOJI:
-        reactions_item, item_type = event_item_to_reactions_api(data["item"])
-        bot_id = get_bot_user_id(web_client)
-
-        bot_reactions = get_bot_reactions(web_client, bot_id, item_type, reactions_item)
-
-        for reaction in bot_reactions:
-            web_client.reactions_remove(name=reaction.get("name"), **reactions_item)
+        for result in remove_bot_reactions(web_client, data["item"]):
+            if not result.ok:
+                logging.error(
+                    f"Failed to remove reaction {result.name}: {result.error}"
+                )
 
     try:
-        PARROT.on_reaction_added(
-            web_client,
-            data["reaction"],
-            data["item"]["channel"],
-            data["item"]["ts"],
-            data["user"],
-        )
+        PARROT.on_reaction_added(web_client, *reaction_args(data))
     except slack_sdk.errors.SlackApiError as exception:
         logging.error(exception)
 
 
-@RTMClient.run_on(event="reaction_removed")
+@HANDLERS.on("reaction_removed")
 @start_as_current_span(tracer=tracer, span_name="on_reaction_removed")
 def on_reaction_removed(
     data: Dict, web_client: slack_sdk.WebClient, span, **kwargs
 ):  # pylint: disable=unused-argument
-    span.set_attribute("app.reaction", data["reaction"])
-    span.set_attribute("app.channel", data["item"]["channel"])
-    span.set_attribute("app.timestamp", data["item"]["ts"])
-    span.set_attribute("app.user", data.get("user", ""))
-    if data.get("user", ""):
-        span.set_attribute(
-            "app.user_display_name", user_display_name(web_client, data.get("user", ""))
-        )
+    set_reaction_attributes(span, data)
+    set_user_attributes(span, web_client, data.get("user", ""))
 
     try:
-        PARROT.on_reaction_removed(
-            web_client,
-            data["reaction"],
-            data["item"]["channel"],
-            data["item"]["ts"],
-            data["user"],
-        )
+        PARROT.on_reaction_removed(web_client, *reaction_args(data))
     except slack_sdk.errors.SlackApiError as exception:
         logging.error(exception)
 
 
-@RTMClient.run_on(event="user_typing")
+@HANDLERS.on("user_typing")
 @start_as_current_span(tracer=tracer, span_name="on_user_typing")
 async def on_user_typing(
     data: Dict, rtm_client: RTMClient, web_client: slack_sdk.WebClient, span, **kwargs
 ):  # pylint: disable=unused-argument
     span.set_attribute("app.channel", data["channel"])
-    span.set_attribute("app.user", data.get("user", ""))
-    if data.get("user", ""):
-        span.set_attribute(
-            "app.user_display_name",
-            user_display_name(web_client, data.get("user", "")),
-        )
+    set_user_attributes(span, web_client, data.get("user", ""))
 
     try:
         await PARROT.on_user_typing(rtm_client, data["channel"], data["user"])
@@ -213,7 +212,7 @@ async def on_user_typing(
         logging.error(exception)
 
 
-@RTMClient.run_on(event="emoji_changed")
+@HANDLERS.on("emoji_changed")
 def on_emoji_changed(
     data: Dict, web_client: slack_sdk.WebClient, **kwargs
 ):  # pylint: disable=unused-argument
@@ -235,7 +234,7 @@ def on_emoji_changed(
     )
 
 
-@RTMClient.run_on(event="channel_created")
+@HANDLERS.on("channel_created")
 def on_channel_created(
     data: Dict, web_client: slack_sdk.WebClient, **kwargs
 ):  # pylint: disable=unused-argument
@@ -246,17 +245,57 @@ def on_channel_created(
     )
 
     if SLACK_API_TOKEN_USER:
-        user_web_client = slack_sdk.WebClient(SLACK_API_TOKEN_USER)
+        user_web_client = ScheduledWebClient(SLACK_API_TOKEN_USER)
         user_web_client.conversations_invite(
             channel=data["channel"]["id"], users=[get_bot_user_id(web_client)]
         )
 
 
-def get_bot(token: str) -> RTMClient:
+@HANDLERS.on("user_change")
+@HANDLERS.on("team_join")
+def on_user_change(
+    data: Dict, web_client: slack_sdk.WebClient, **kwargs
+):  # pylint: disable=unused-argument
+    update_user(web_client, data["user"])
+
+
+def on_channel_change(
+    data: Dict, web_client: slack_sdk.WebClient, **kwargs
+):  # pylint: disable=unused-argument
+    channel = data["channel"]
+    if isinstance(channel, dict):
+        channel = channel["id"]
+
+    invalidate_channel(web_client, channel)
+
+
+for event in CHANNEL_CHANGE_EVENTS:
+    HANDLERS.on(event)(on_channel_change)
+
+
+def get_bot(token: str, run_async: bool = ASYNC_MODE, ingestion: str = INGESTION):
+    """The client which receives events for the bot, see INGESTION"""
+    handlers = dict(HANDLERS)
+    if run_async:
+        from .async_bot import (  # pylint: disable=import-outside-toplevel,cyclic-import
+            HANDLERS as ASYNC_HANDLERS,
+        )
+
+        handlers.update(ASYNC_HANDLERS)
+
     ssl_context = ssl.create_default_context()
     ssl_context.check_hostname = False
     ssl_context.verify_mode = ssl.CERT_NONE
 
-    rtm_client = RTMClient(token=token, ssl=ssl_context)
+    if ingestion != "rtm":
+        ingestor = Ingestor(
+            handlers,
+            ScheduledWebClient(token=token, ssl=ssl_context),
+            EventClient(token, ssl=ssl_context),
+        )
+        return event_source(ingestion, ingestor)
+
+    register(handlers)
+    rtm_client = ScheduledRTMClient(token=token, ssl=ssl_context)
 
     return rtm_client
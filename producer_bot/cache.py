@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    """Counters for a cache"""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    coalesced: int = 0
+
+
+class TTLCache:  # pylint: disable=too-many-instance-attributes
+    """A size-bounded LRU cache whose entries expire after a fixed time"""
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._timer = timer
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[Hashable, Future] = {}
+        self._loading_async: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.peek(key) is not MISSING
+
+    def peek(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Get a value without touching the stats or LRU order"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._timer():
+                return default
+            return entry[1]
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._timer():
+                del self._entries[key]
+                self.stats.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.stats.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (self._timer() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.stats.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Get a value, loading it on a miss
+
+        Concurrent misses for the same key share a single call to the loader.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        with self._lock:
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = self._loading[key] = Future()
+            else:
+                self.stats.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = loader()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as exception:
+            future.set_exception(exception)
+            raise
+        finally:
+            with self._lock:
+                del self._loading[key]
+
+    async def get_or_load_async(
+        self, key: Hashable, loader: Callable[[], Awaitable]
+    ) -> Any:
+        """Get a value, loading it on a miss, see get_or_load"""
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        future = self._loading_async.get(key)
+        if future is not None:
+            self.stats.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = self._loading_async[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await loader()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exception:
+            future.set_exception(exception)
+            # Only waiters should see the error, don't warn if there are none
+            future.exception()
+            raise
+        finally:
+            del self._loading_async[key]
+
+
+CacheSpec = namedtuple("CacheSpec", "maxsize ttl")
+
+
+class CacheRegistry:
+    """A separate set of caches for each workspace (team)
+
+    Lookups from one workspace can never be answered from, or evict entries of,
+    another workspace's caches. Each workspace's limits can be overridden.
+    """
+
+    def __init__(self, specs: Dict[str, CacheSpec]):
+        self.specs = specs
+        self._overrides: Dict[str, Dict[str, CacheSpec]] = {}
+        self._teams: Dict[str, Dict[str, TTLCache]] = {}
+        self._lock = threading.Lock()
+
+    def set_limits(self, team_id: str, name: str, spec: CacheSpec):
+        """Override a cache's limits for one workspace"""
+        with self._lock:
+            self._overrides.setdefault(team_id, {})[name] = spec
+            cache = self._teams.get(team_id, {}).get(name)
+            if cache is not None:
+                cache.maxsize, cache.ttl = spec
+
+    def configure(self, limits: Dict[str, Dict[str, Dict[str, float]]]):
+        """Override limits by workspace, e.g. {"T123": {"users": {"maxsize": 100}}}
+
+        Limits left out keep the cache's usual ones.
+        """
+        for team_id, caches in limits.items():
+            for name, spec in caches.items():
+                if name not in self.specs:
+                    raise ValueError(f"Unknown cache {name!r} for {team_id}")
+                unknown = set(spec) - set(CacheSpec._fields)
+                if unknown:
+                    raise ValueError(f"Unknown {name} cache limits {sorted(unknown)}")
+                self.set_limits(team_id, name, self.specs[name]._replace(**spec))
+
+    def for_team(self, team_id: str) -> Dict[str, TTLCache]:
+        with self._lock:
+            if team_id not in self._teams:
+                specs = {**self.specs, **self._overrides.get(team_id, {})}
+                self._teams[team_id] = {
+                    name: TTLCache(name, spec.maxsize, spec.ttl)
+                    for name, spec in specs.items()
+                }
+            return self._teams[team_id]
+
+    def stats(self) -> Dict[str, Dict[str, CacheStats]]:
+        with self._lock:
+            return {
+                team_id: {name: cache.stats for name, cache in caches.items()}
+                for team_id, caches in self._teams.items()
+            }
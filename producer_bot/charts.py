@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .cache import TTLCache
+
+CHART_WORKERS = int(os.environ.get("CHART_WORKERS", "2"))
+CHART_CACHE_SIZE = int(os.environ.get("CHART_CACHE_SIZE", "32"))
+CHART_CACHE_TTL = float(os.environ.get("CHART_CACHE_TTL", "86400"))
+
+
+def _use_agg():
+    # pylint: disable=import-outside-toplevel
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def chart_key(plot: Callable, data, options: Dict[str, Any]) -> str:
+    """A hash of the chart type, its options and the data being plotted"""
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    digest = hashlib.sha256(
+        f"{plot.__module__}.{plot.__qualname__}{sorted(options.items())!r}".encode()
+    )
+    digest.update(repr(list(data.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ChartService:
+    """Renders charts in worker processes, remembering them by their input
+
+    `plot` must be a module level function (so it can be sent to a worker) which
+    takes a data frame and returns the rendered chart, e.g. PNG bytes. Workers
+    import its module, which mustn't do anything else when imported. The same
+    chart of the same data is only ever rendered once, until it expires.
+    """
+
+    def __init__(self, workers: int = CHART_WORKERS, cache: Optional[TTLCache] = None):
+        self.workers = workers
+        self.cache = cache or TTLCache("charts", CHART_CACHE_SIZE, CHART_CACHE_TTL)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # started on first use, so the bot doesn't pay for idle workers
+        with self._lock:
+            if self._executor is None:
+                # spawned, as forking a process with threads running can leave
+                # the child holding a lock which is never released
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_use_agg,
+                )
+            return self._executor
+
+    def render(self, plot: Callable, data, **options) -> Any:
+        return self.cache.get_or_load(
+            chart_key(plot, data, options),
+            lambda: self._pool().submit(plot, data, **options).result(),
+        )
+
+    async def render_async(self, plot: Callable, data, **options) -> Any:
+        """Render a chart, see render, without blocking the event loop"""
+
+        async def load():
+            return await asyncio.wrap_future(self._pool().submit(plot, data, **options))
+
+        return await self.cache.get_or_load_async(chart_key(plot, data, options), load)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+CHARTS = ChartService()
@@ -0,0 +1,45 @@
+from functools import partial
+
+import slack_sdk
+from slack_sdk.rtm import RTMClient
+from slack_sdk.web.async_client import AsyncWebClient
+
+from .metrics import timed_request, timed_request_async
+from .scheduler import get_scheduler
+
+
+class ScheduledWebClient(slack_sdk.WebClient):
+    """A WebClient whose API calls go through the outbound scheduler, and are timed"""
+
+    def api_call(self, api_method: str, **kwargs):  # pylint: disable=arguments-differ
+        request = timed_request(
+            api_method, partial(super().api_call, api_method, **kwargs)
+        )
+        return get_scheduler(self.token).call(api_method, request, kwargs)
+
+
+class ScheduledAsyncWebClient(AsyncWebClient):
+    """An AsyncWebClient whose API calls go through the outbound scheduler"""
+
+    async def api_call(  # pylint: disable=arguments-differ
+        self, api_method: str, **kwargs
+    ):
+        request = timed_request_async(
+            api_method, partial(super().api_call, api_method, **kwargs)
+        )
+        return await get_scheduler(self.token).call_async(api_method, request, kwargs)
+
+
+class ScheduledRTMClient(RTMClient):
+    """An RTMClient which hands a ScheduledWebClient to its handlers"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._web_client = ScheduledWebClient(
+            token=self.token,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            ssl=self.ssl,
+            proxy=self.proxy,
+            headers=self.headers,
+        )
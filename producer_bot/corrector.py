@@ -1,7 +1,9 @@
-import re
 from collections import namedtuple
+from typing import FrozenSet, Iterator, Optional, Tuple
 
-from slack_sdk import WebClient
+from .features import Message
+from .matcher import Matcher, rule_id
+from .ruleset import matcher_for, table_for
 
 CorrectablePhrase = namedtuple(
     "CorrectablePhrase", "match message emoji name ephemeral"
@@ -47,23 +49,61 @@ CORRECT_PHRASES = frozenset(
 )
 
 
-def trigger(channel: str, timestamp: int, user: str, text: str, web_client: WebClient):
-    for phrase in CORRECT_PHRASES:
-        if re.search(phrase.match, text):
-            if phrase.ephemeral:
-                web_client.chat_postEphemeral(
-                    channel=channel,
-                    user=user,
-                    text=phrase.message,
-                    icon_emoji=phrase.emoji,
-                    username=phrase.name,
-                )
-            else:
-                web_client.chat_postMessage(
-                    channel=channel,
-                    thread_ts=timestamp,
-                    text=phrase.message,
-                    icon_emoji=phrase.emoji,
-                    username=phrase.name,
-                    unfurl_links=True,
-                )
+def rules_for(phrases) -> Iterator[Tuple[str, str]]:
+    return ((rule_id(__name__, phrase.match), phrase.match) for phrase in phrases)
+
+
+MATCHER = Matcher(rules_for(CORRECT_PHRASES))
+
+
+def corrections_for(
+    text: str, matches: Optional[FrozenSet[str]] = None
+) -> Iterator[CorrectablePhrase]:
+    if matches is None:
+        matches = matcher_for("corrector", MATCHER).match(text)
+
+    for phrase in table_for("corrector", CORRECT_PHRASES):
+        if rule_id(__name__, phrase.match) in matches:
+            yield phrase
+
+
+def on_message(message: Message):
+    for phrase in corrections_for(message.text, message.matches):
+        if phrase.ephemeral:
+            message.web_client.chat_postEphemeral(
+                channel=message.channel,
+                user=message.user,
+                text=phrase.message,
+                icon_emoji=phrase.emoji,
+                username=phrase.name,
+            )
+        else:
+            message.web_client.chat_postMessage(
+                channel=message.channel,
+                thread_ts=message.timestamp,
+                text=phrase.message,
+                icon_emoji=phrase.emoji,
+                username=phrase.name,
+                unfurl_links=True,
+            )
+
+
+async def on_message_async(message: Message):
+    for phrase in corrections_for(message.text, message.matches):
+        if phrase.ephemeral:
+            await message.web_client.chat_postEphemeral(
+                channel=message.channel,
+                user=message.user,
+                text=phrase.message,
+                icon_emoji=phrase.emoji,
+                username=phrase.name,
+            )
+        else:
+            await message.web_client.chat_postMessage(
+                channel=message.channel,
+                thread_ts=message.timestamp,
+                text=phrase.message,
+                icon_emoji=phrase.emoji,
+                username=phrase.name,
+                unfurl_links=True,
+            )
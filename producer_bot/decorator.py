@@ -1,15 +1,44 @@
+import inspect
+import time
 from functools import wraps
 from typing import Callable
 
-from opentelemetry import trace
+from .metrics import record_handler
 
 
 def start_as_current_span(tracer, span_name: str) -> Callable:
+    """Run the function in a span, and record how long it took in metrics"""
+
     def decorator(func: Callable):
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_func_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                with tracer.start_as_current_span(span_name) as span:
+                    try:
+                        result = await func(*args, **kwargs, span=span)
+                    except Exception as exception:
+                        record_handler(
+                            span_name, time.perf_counter() - started, exception
+                        )
+                        raise
+                record_handler(span_name, time.perf_counter() - started)
+                return result
+
+            return async_func_wrapper
+
         @wraps(func)
         def func_wrapper(*args, **kwargs):
+            started = time.perf_counter()
             with tracer.start_as_current_span(span_name) as span:
-                return func(*args, **kwargs, span=span)
+                try:
+                    result = func(*args, **kwargs, span=span)
+                except Exception as exception:
+                    record_handler(span_name, time.perf_counter() - started, exception)
+                    raise
+            record_handler(span_name, time.perf_counter() - started)
+            return result
 
         return func_wrapper
 
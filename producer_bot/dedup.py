@@ -0,0 +1,86 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+# How long (in seconds) an event is remembered, so it's dropped if delivered again
+DEDUP_WINDOW = float(os.environ.get("DEDUP_WINDOW", "600"))
+# The most events remembered at once, the oldest being forgotten first
+DEDUP_MAX_EVENTS = int(os.environ.get("DEDUP_MAX_EVENTS", "10000"))
+
+# (event type, channel, timestamp)
+EventKey = Tuple[str, str, str]
+
+
+def event_key(event_type: str, data: Dict) -> Optional[EventKey]:
+    """What identifies an event, or None for events which can't be told apart"""
+    item = data.get("item") or {}
+    channel = data.get("channel") or item.get("channel")
+    if isinstance(channel, dict):
+        channel = channel.get("id")
+    timestamp = data.get("ts") or data.get("event_ts")
+    if not channel or not timestamp:
+        return None
+
+    subtype = data.get("subtype")
+    return (f"{event_type}/{subtype}" if subtype else event_type, channel, timestamp)
+
+
+class SeenEvents:
+    """Recent events, so one delivered twice is only handled once
+
+    Slack can send an event again after an RTM reconnect, and the Events API
+    retries those it thinks weren't acknowledged. Events are remembered for
+    `window` seconds, and at most `maxsize` of them.
+    """
+
+    def __init__(self, window: float = DEDUP_WINDOW, maxsize: int = DEDUP_MAX_EVENTS):
+        self.window = window
+        self.maxsize = maxsize
+        # duplicates dropped, by event type
+        self.suppressed: Counter = Counter()
+        self._seen: "OrderedDict[EventKey, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _expire(self, now: float):
+        # oldest first, so stop at the first event still in the window
+        while self._seen:
+            key, seen = next(iter(self._seen.items()))
+            if now - seen < self.window:
+                return
+            del self._seen[key]
+
+    def duplicate(self, event_type: str, data: Dict) -> bool:
+        """Whether an event has been seen already, remembering it if not"""
+        key = event_key(event_type, data)
+        if key is None:
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key not in self._seen:
+                self._seen[key] = now
+                if len(self._seen) > self.maxsize:
+                    self._seen.popitem(last=False)
+                return False
+            self.suppressed[event_type] += 1
+
+        LOGGER.debug(f"Dropping a duplicate {event_type} event {key}")
+        return True
+
+    def forget(self, event_type: str, data: Dict):
+        """Forget an event which wasn't handled after all, so it will be if sent again"""
+        key = event_key(event_type, data)
+        with self._lock:
+            self._seen.pop(key, None)
+
+
+DEDUP = SeenEvents()
@@ -1,6 +1,8 @@
 from random import randint
+from typing import List
 
-from slack_sdk import WebClient
+from .features import Message
+from .matcher import Matcher, rule_id
 
 DICE_REACTIONS = [
     "zero",
@@ -14,6 +16,8 @@ DICE_REACTIONS = [
     "eight",
     "nine",
 ]
+DICE_RULE = rule_id(__name__, "dice")
+MATCHER = Matcher([(DICE_RULE, "dice")])
 
 
 def num2word(num: int):
@@ -25,12 +29,14 @@ def num2word(num: int):
         i += 1
 
 
-def roll(channel: str, timestamp: int, web_client: WebClient):
+def roll_emojis() -> List[str]:
     result = randint(1, 20)
-    emojis = num2word(result)
 
     if result == 11:  # handle duplicate emoji reaction
-        emojis = ["one", "one-again"]
+        return ["one", "one-again"]
 
-    for emoji in emojis:
-        web_client.reactions_add(channel=channel, timestamp=timestamp, name=emoji)
+    return list(num2word(result))
+
+
+def reactions(message: Message) -> List[List[str]]:  # pylint: disable=unused-argument
+    return [roll_emojis()]
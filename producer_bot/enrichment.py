@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+from typing import Hashable, Optional, Set
+
+import slack_sdk
+
+from .slack_helper import (
+    cached_user_display_name,
+    user_display_name,
+    user_display_name_async,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+# Names waiting to be looked up, beyond which more lookups are dropped
+MAX_PENDING_LOOKUPS = int(os.environ.get("MAX_PENDING_LOOKUPS", "100"))
+
+
+class NameResolver:
+    """Looks up users' names off the hot path, so later spans can use them
+
+    A span only gets a name which is already cached. A missing one is looked up
+    by a background thread (or task, in async mode), filling the cache for the
+    next event from that user. Each user is only looked up once at a time.
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING_LOOKUPS):
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending: Set[Hashable] = set()
+        self._queue: queue.Queue = queue.Queue()
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def _claim(self, key: Hashable) -> bool:
+        with self._lock:
+            if key in self._pending:
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.add(key)
+            return True
+
+    def _release(self, key: Hashable):
+        with self._lock:
+            self._pending.discard(key)
+
+    def resolve(self, web_client: slack_sdk.WebClient, user: str):
+        key = (web_client.token, user)
+        if not self._claim(key):
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._work, name="name-resolver", daemon=True
+                )
+                self._worker.start()
+        self._queue.put((key, web_client, user))
+
+    def _work(self):
+        while True:
+            key, web_client, user = self._queue.get()
+            try:
+                user_display_name(web_client, user)
+            except slack_sdk.errors.SlackApiError as exception:
+                LOGGER.warning(f"Failed to look up {user}: {exception}")
+            except Exception:  # pylint: disable=broad-except
+                # anything else, so this (only) worker keeps going
+                LOGGER.exception(f"Failed to look up {user}")
+            finally:
+                self._release(key)
+
+    def resolve_async(self, web_client, user: str):
+        """Look up a name in a task on the running event loop, see resolve"""
+        key = (web_client.token, user)
+        if not self._claim(key):
+            return
+        task = asyncio.ensure_future(self._resolve_async(key, web_client, user))
+        # the loop only keeps a weak reference to its tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resolve_async(self, key: Hashable, web_client, user: str):
+        try:
+            await user_display_name_async(web_client, user)
+        except slack_sdk.errors.SlackApiError as exception:
+            LOGGER.warning(f"Failed to look up {user}: {exception}")
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception(f"Failed to look up {user}")
+        finally:
+            self._release(key)
+
+
+RESOLVER = NameResolver()
+
+
+def set_user_attributes(span, web_client: slack_sdk.WebClient, user: str):
+    """Add a user, and their name if it's cached, to a span"""
+    span.set_attribute("app.user", user)
+    if not user or not span.is_recording():
+        return
+
+    name = cached_user_display_name(web_client, user)
+    if name is None:
+        RESOLVER.resolve(web_client, user)
+    else:
+        span.set_attribute("app.user_display_name", name)
+
+
+def set_user_attributes_async(span, web_client, user: str):
+    """Add a user to a span, see set_user_attributes, for an AsyncWebClient"""
+    span.set_attribute("app.user", user)
+    if not user or not span.is_recording():
+        return
+
+    name = cached_user_display_name(web_client, user)
+    if name is None:
+        RESOLVER.resolve_async(web_client, user)
+    else:
+        span.set_attribute("app.user_display_name", name)
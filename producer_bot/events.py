@@ -0,0 +1,60 @@
+import asyncio
+import inspect
+from functools import wraps
+from typing import Callable, Dict
+
+from slack_sdk.rtm import RTMClient
+
+from .dedup import DEDUP
+
+
+class EventHandlers(dict):
+    """RTM event handlers, keyed by event type"""
+
+    def on(self, event: str) -> Callable:  # pylint: disable=invalid-name
+        def decorator(callback: Callable):
+            self[event] = callback
+            return callback
+
+        return decorator
+
+
+def deduplicated(event: str, callback: Callable) -> Callable:
+    """A callback which ignores events it's been given already"""
+    if inspect.iscoroutinefunction(callback):
+
+        @wraps(callback)
+        async def async_wrapper(data: Dict, **kwargs):
+            if not DEDUP.duplicate(event, data):
+                await callback(data=data, **kwargs)
+
+        return async_wrapper
+
+    @wraps(callback)
+    def wrapper(data: Dict, **kwargs):
+        if not DEDUP.duplicate(event, data):
+            callback(data=data, **kwargs)
+
+    return wrapper
+
+
+def off_loop(callback: Callable) -> Callable:
+    """Run a blocking callback on a thread, rather than the RTM client's event loop
+
+    Blocking handlers wait for the outbound scheduler, and if that's waiting on
+    coroutines (in ASYNC_MODE) which can't run while the loop is blocked, it
+    never returns.
+    """
+    if inspect.iscoroutinefunction(callback):
+        return callback
+
+    @wraps(callback)
+    async def wrapper(**kwargs):
+        await asyncio.to_thread(callback, **kwargs)
+
+    return wrapper
+
+
+def register(handlers: Dict[str, Callable]):
+    for event, callback in handlers.items():
+        RTMClient.on(event=event, callback=off_loop(deduplicated(event, callback)))
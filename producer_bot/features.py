@@ -0,0 +1,212 @@
+import logging
+from dataclasses import dataclass, replace
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import slack_sdk
+
+from .reactions import add_reactions, add_reactions_async
+from .ruleset import matcher_for
+from .slack_helper import is_channel_im, is_channel_im_async
+from .throttle import THROTTLE, Throttle
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Message:
+    """A message event, as the features see it"""
+
+    web_client: Any
+    data: Dict
+    text: str  # lowercased
+    matches: FrozenSet[str]
+    mentioned: bool  # the message starts with an @mention of the bot
+
+    @property
+    def channel(self) -> str:
+        return self.data["channel"]
+
+    @property
+    def timestamp(self) -> str:
+        return self.data["ts"]
+
+    @property
+    def user(self) -> str:
+        return self.data.get("user", "")
+
+    @property
+    def from_bot(self) -> bool:
+        return "bot_id" in self.data
+
+    @property
+    def thread_ts(self) -> Optional[str]:
+        return self.data.get("thread_ts")
+
+
+@dataclass(frozen=True)
+class Feature:  # pylint: disable=too-many-instance-attributes
+    """Something a plugin does with messages, and when it could possibly apply
+
+    `handler` (and `handler_async`, for async mode) name functions of the plugin
+    module taking a Message. A `reactions` handler returns reaction chains instead,
+    which are added together with every other feature's.
+    """
+
+    handler: str
+    handler_async: Optional[str] = None
+    reactions: bool = False
+    triggered: bool = False  # only when one of the plugin's rules matches
+    mention: bool = False  # only when the bot is @mentioned, or in a DM
+    direct_message: bool = False  # only in a DM
+    channels: Optional[FrozenSet[str]] = None  # only in these channels
+    skip_bots: bool = False  # not for messages posted by bots
+    throttled: bool = False  # the plugin's rules have cooldowns, see Throttle
+
+
+# a plugin, its rules' IDs, and one of its features
+Route = Tuple[Any, FrozenSet[str], Feature]
+
+
+def _passes(feature: Feature, rule_ids: FrozenSet[str], message: Message) -> bool:
+    """The checks which don't need any API calls"""
+    return (
+        not (feature.skip_bots and message.from_bot)
+        and (feature.channels is None or message.channel in feature.channels)
+        and (not feature.triggered or not rule_ids.isdisjoint(message.matches))
+    )
+
+
+def _needs_direct_message(feature: Feature, message: Message) -> bool:
+    return feature.direct_message or (feature.mention and not message.mentioned)
+
+
+class FeatureRouter:
+    """Calls only the features which could possibly act on a message
+
+    Features are checked in order of cost: the bot, channel and rule checks are
+    free, a DM check is (at most) one cached lookup, made once per message and
+    only if a feature needs it. A plugin isn't loaded until one of its features
+    passes every check. Then the rules still cooling down are dropped from the
+    message's matches, so they neither load nor call anything. Only the rules of
+    features which passed are checked, so a message they'd ignore anyway doesn't
+    start a cooldown.
+    """
+
+    def __init__(self, plugins: Iterable[Any], throttle: Throttle = THROTTLE):
+        self.plugins = list(plugins)
+        self.throttle = throttle
+        self.refresh()
+
+    def refresh(self):
+        """Route by the plugins' current rules, e.g. once they've been reloaded"""
+        routes: List[Route] = []
+        for plugin in self.plugins:
+            matcher = matcher_for(plugin.name, plugin.matcher)
+            rule_ids = frozenset(rule.id for rule in matcher.rules)
+            routes.extend((plugin, rule_ids, feature) for feature in plugin.features)
+        throttled_rules = frozenset().union(
+            *(rule_ids for _, rule_ids, feature in routes if feature.throttled)
+        )
+        # one assignment, so the routes and throttled rules are always from one load
+        self.routing = (routes, throttled_rules)
+
+    def throttled(
+        self, message: Message, routes: List[Route]
+    ) -> Tuple[Message, List[Route]]:
+        """The message, without any matches for the routes' rules which are cooling
+        down, and the routes which still apply to it"""
+        rule_ids = message.matches & self.routing[1]
+        if rule_ids:
+            rule_ids &= frozenset().union(
+                *(
+                    route_rules
+                    for _, route_rules, feature in routes
+                    if feature.throttled
+                )
+            )
+        if not rule_ids:
+            return message, routes
+
+        allowed = self.throttle.allow(rule_ids, message.channel, message.user)
+        message = replace(message, matches=(message.matches - rule_ids) | allowed)
+        return message, [
+            (plugin, route_rules, feature)
+            for plugin, route_rules, feature in routes
+            if not feature.triggered or not route_rules.isdisjoint(message.matches)
+        ]
+
+    def _candidates(self, message: Message) -> List[Route]:
+        return [
+            route for route in self.routing[0] if _passes(route[2], route[1], message)
+        ]
+
+    def routes_for(self, message: Message) -> List[Route]:
+        candidates = self._candidates(message)
+        if any(_needs_direct_message(feature, message) for _, _, feature in candidates):
+            is_im = is_channel_im(message.channel, message.web_client)
+            candidates = [
+                route
+                for route in candidates
+                if is_im or not _needs_direct_message(route[2], message)
+            ]
+        return candidates
+
+    async def routes_for_async(self, message: Message) -> List[Route]:
+        candidates = self._candidates(message)
+        if any(_needs_direct_message(feature, message) for _, _, feature in candidates):
+            is_im = await is_channel_im_async(message.channel, message.web_client)
+            candidates = [
+                route
+                for route in candidates
+                if is_im or not _needs_direct_message(route[2], message)
+            ]
+        return candidates
+
+    def dispatch(self, message: Message):
+        message, routes = self.throttled(message, self.routes_for(message))
+        chains = [
+            chain
+            for plugin, _, feature in routes
+            if feature.reactions
+            for chain in getattr(plugin.load(), feature.handler)(message)
+        ]
+        for result in add_reactions(
+            message.web_client, message.channel, message.timestamp, chains
+        ):
+            if not result.ok:
+                LOGGER.error(f"Failed to add reaction {result.name}: {result.error}")
+
+        for plugin, _, feature in routes:
+            if feature.reactions:
+                continue
+            try:
+                getattr(plugin.load(), feature.handler)(message)
+            except slack_sdk.errors.SlackApiError as exception:
+                LOGGER.error(f"{plugin.name}.{feature.handler} failed: {exception}")
+
+    async def dispatch_async(self, message: Message):
+        message, routes = self.throttled(message, await self.routes_for_async(message))
+        chains = [
+            chain
+            for plugin, _, feature in routes
+            if feature.reactions
+            for chain in getattr(plugin.load(), feature.handler)(message)
+        ]
+        for result in await add_reactions_async(
+            message.web_client, message.channel, message.timestamp, chains
+        ):
+            if not result.ok:
+                LOGGER.error(f"Failed to add reaction {result.name}: {result.error}")
+
+        for plugin, _, feature in routes:
+            if feature.reactions:
+                continue
+            if feature.handler_async is None:
+                LOGGER.debug(f"{plugin.name}.{feature.handler} has no async version")
+                continue
+            try:
+                await getattr(plugin.load(), feature.handler_async)(message)
+            except slack_sdk.errors.SlackApiError as exception:
+                LOGGER.error(
+                    f"{plugin.name}.{feature.handler_async} failed: {exception}"
+                )
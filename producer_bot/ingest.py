@@ -0,0 +1,260 @@
+import asyncio
+import inspect
+import json
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+import slack_sdk
+from slack_sdk.signature import SignatureVerifier
+from slack_sdk.socket_mode import SocketModeClient
+from slack_sdk.socket_mode.request import SocketModeRequest
+from slack_sdk.socket_mode.response import SocketModeResponse
+
+from .dedup import DEDUP
+
+LOGGER = logging.getLogger(__name__)
+
+# How events reach the bot: "rtm" (the legacy RTM API), "socket" (Socket Mode)
+# or "http" (the Events API, posting to this process)
+INGESTION = os.environ.get("INGESTION", "rtm").lower()
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "4"))
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "1000"))
+# An app-level token (xapp-...) with connections:write, for Socket Mode
+SLACK_APP_TOKEN = os.environ.get("SLACK_APP_TOKEN", "")
+SLACK_SIGNING_SECRET = os.environ.get("SLACK_SIGNING_SECRET", "")
+EVENTS_PORT = int(os.environ.get("EVENTS_PORT", "3000"))
+EVENTS_PATH = "/slack/events"
+
+
+class EventClient:
+    """What handlers expect of an RTMClient, for events which came another way"""
+
+    def __init__(self, token: str, ssl=None):
+        self.token = token
+        self.ssl = ssl
+
+    async def typing(self, channel: str):
+        # typing indicators can only be sent over RTM
+        LOGGER.debug(f"Not sending a typing indicator to {channel}")
+
+
+class Ingestor:
+    """Runs the event handlers on a pool of workers, for events from any source
+
+    `submit` only queues an event, so a source can acknowledge it straight away.
+    The queue is bounded: when the workers can't keep up, new events are refused
+    (and counted) rather than piling up. Coroutine handlers all run on one event
+    loop, each worker waiting for its own, so at most `workers` events are ever
+    being handled at once.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        handlers: Dict[str, Callable],
+        web_client: slack_sdk.WebClient,
+        client,
+        workers: int = INGEST_WORKERS,
+        maxsize: int = INGEST_QUEUE_SIZE,
+    ):
+        self.handlers = handlers
+        self.kwargs = {"rtm_client": client, "web_client": web_client}
+        self.workers = workers
+        self.stats: Counter = Counter()
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._threads = [
+            threading.Thread(
+                target=self._loop.run_forever, name="ingest-loop", daemon=True
+            )
+        ] + [
+            threading.Thread(target=self._work, name=f"ingest-{number}", daemon=True)
+            for number in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, event: Dict) -> bool:
+        """Queue an event to be handled, returning False if the queue is full"""
+        if DEDUP.duplicate(event.get("type"), event):
+            # acknowledged, so it isn't sent yet again, but never handled
+            self.stats["duplicate"] += 1
+            return True
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # refused, so Slack's retry must be handled rather than dropped
+            DEDUP.forget(event.get("type"), event)
+            self.stats["dropped"] += 1
+            LOGGER.warning(f"Dropped a {event.get('type')} event, the queue is full")
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    def join(self):
+        """Wait until every queued event has been handled"""
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            event = self._queue.get()
+            try:
+                self.handle(event)
+            except Exception:  # pylint: disable=broad-except
+                self.stats["failed"] += 1
+                LOGGER.exception(f"Failed to handle a {event.get('type')} event")
+            finally:
+                self._queue.task_done()
+
+    def handle(self, event: Dict):
+        data = dict(event)
+        handler = self.handlers.get(data.pop("type", None))
+        if handler is None:
+            self.stats["unhandled"] += 1
+            return
+
+        # a worker waits for the handler anyway, rather than backgrounding it
+        handler = getattr(handler, "foreground", handler)
+        if inspect.iscoroutinefunction(handler):
+            asyncio.run_coroutine_threadsafe(
+                handler(data=data, **self.kwargs), self._loop
+            ).result()
+        else:
+            handler(data=data, **self.kwargs)
+        self.stats["handled"] += 1
+
+
+class SocketModeSource:
+    """Receives events over Socket Mode, acknowledging each before it's handled"""
+
+    def __init__(
+        self,
+        ingestor: Ingestor,
+        app_token: str = SLACK_APP_TOKEN,
+        web_client: Optional[slack_sdk.WebClient] = None,
+    ):
+        self.ingestor = ingestor
+        self.client = SocketModeClient(
+            app_token=app_token, web_client=web_client or slack_sdk.WebClient()
+        )
+        self.client.socket_mode_request_listeners.append(self._on_request)
+
+    def _on_request(self, client: SocketModeClient, request: SocketModeRequest):
+        client.send_socket_mode_response(
+            SocketModeResponse(envelope_id=request.envelope_id)
+        )
+        if request.type == "events_api":
+            self.ingestor.submit(request.payload["event"])
+
+    def start(self, block: bool = True):
+        self.ingestor.start()
+        self.client.connect()
+        self.ingestor.submit({"type": "hello"})
+        if block:
+            threading.Event().wait()
+
+    def stop(self):
+        self.client.close()
+
+
+def _payload(body: bytes) -> Optional[Dict]:
+    """A request's payload, or None if it isn't one the Events API would send"""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    malformed = not isinstance(payload, dict) or (
+        payload.get("type") == "event_callback"
+        and not isinstance(payload.get("event"), dict)
+    )
+    return None if malformed else payload
+
+
+class HttpEventsSource:
+    """Receives events posted by the Events API, acknowledging each once queued
+
+    Requests are checked against the app's signing secret, which must be set. When
+    the queue is full the event is refused with a 503, and Slack retries it later.
+    """
+
+    def __init__(
+        self,
+        ingestor: Ingestor,
+        signing_secret: str = SLACK_SIGNING_SECRET,
+        port: int = EVENTS_PORT,
+    ):
+        if not signing_secret:
+            # any request signed with an empty secret would pass
+            raise ValueError("SLACK_SIGNING_SECRET must be set to receive events")
+        self.ingestor = ingestor
+        self.verifier = SignatureVerifier(signing_secret)
+        self.server = ThreadingHTTPServer(("", port), self._request_handler())
+        self.port = self.server.server_address[1]
+
+    def respond(self, body: bytes) -> tuple:
+        """The status and response body for a request to the events endpoint"""
+        payload = _payload(body)
+        if payload is None:
+            return 400, b""
+        if payload.get("type") == "url_verification":
+            return 200, json.dumps({"challenge": payload.get("challenge")}).encode()
+        queued = payload.get("type") != "event_callback" or self.ingestor.submit(
+            payload["event"]
+        )
+        return 200 if queued else 503, b""
+
+    def _request_handler(self):
+        source = self
+
+        class EventsHandler(BaseHTTPRequestHandler):
+            def do_POST(self):  # pylint: disable=invalid-name
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path != EVENTS_PATH:
+                    status, response = 404, b""
+                elif not source.verifier.is_valid_request(body, dict(self.headers)):
+                    status, response = 401, b""
+                else:
+                    if "X-Slack-Retry-Num" in self.headers:
+                        source.ingestor.stats["retried"] += 1
+                    status, response = source.respond(body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                LOGGER.debug(format, *args)
+
+        return EventsHandler
+
+    def start(self, block: bool = True):
+        self.ingestor.start()
+        self.ingestor.submit({"type": "hello"})
+        LOGGER.info(f"Receiving events on port {self.port}{EVENTS_PATH}")
+        if block:
+            self.server.serve_forever()
+        else:
+            threading.Thread(
+                target=self.server.serve_forever, name="events", daemon=True
+            ).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def event_source(ingestion: str, ingestor: Ingestor):
+    """The Socket Mode or HTTP source for the ingestor"""
+    if ingestion == "socket":
+        return SocketModeSource(ingestor, web_client=ingestor.kwargs["web_client"])
+    if ingestion == "http":
+        return HttpEventsSource(ingestor)
+    raise ValueError(f"Unknown INGESTION {ingestion!r}")
@@ -0,0 +1,63 @@
+import re
+import time
+from collections import namedtuple
+from typing import FrozenSet, Iterable, Optional, Tuple
+
+from .profiler import RuleProfile
+
+Rule = namedtuple("Rule", "id pattern")
+
+NO_MATCHES: FrozenSet[str] = frozenset()
+
+
+class Matcher:
+    """Match a message against many trigger patterns at once
+
+    All patterns are compiled into a single alternation which is scanned once per
+    message. The vast majority of messages match nothing and stop there; only when
+    the combined scan hits are the individual (precompiled) patterns checked, so
+    overlapping matches are reported exactly as per-pattern `re.search` would.
+
+    With a `profile`, every pattern is checked and timed on its own instead.
+    """
+
+    profile: Optional[RuleProfile] = None
+
+    def __init__(self, rules: Iterable[Tuple[str, str]]):
+        self.rules = tuple(Rule(*rule) for rule in rules)
+        self._compiled = tuple(
+            (rule.id, re.compile(rule.pattern)) for rule in self.rules
+        )
+        self._combined = re.compile(
+            "|".join(f"(?:{rule.pattern})" for rule in self.rules) or r"(?!)"
+        )
+
+    def __add__(self, other: "Matcher") -> "Matcher":
+        return Matcher(self.rules + other.rules)
+
+    def match(self, text: str) -> FrozenSet[str]:
+        """Return the IDs of every rule matching the text"""
+        if self.profile is not None:
+            return self._profiled_match(text)
+        if not self._combined.search(text):
+            return NO_MATCHES
+
+        return frozenset(
+            rule_id for rule_id, pattern in self._compiled if pattern.search(text)
+        )
+
+    def _profiled_match(self, text: str) -> FrozenSet[str]:
+        matches = []
+        timings = []
+        for name, pattern in self._compiled:
+            started = time.perf_counter()
+            matched = pattern.search(text) is not None
+            timings.append((name, matched, time.perf_counter() - started))
+            if matched:
+                matches.append(name)
+        self.profile.record(timings)
+        return frozenset(matches) if matches else NO_MATCHES
+
+
+def rule_id(namespace: str, pattern: str) -> str:
+    return f"{namespace}:{pattern}"
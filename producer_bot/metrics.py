@@ -0,0 +1,275 @@
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import slack_sdk
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import (
+    ConsoleMetricExporter,
+    Histogram,
+    InMemoryMetricReader,
+    MetricReader,
+    MetricsData,
+    PeriodicExportingMetricReader,
+    Sum,
+)
+
+from .dedup import DEDUP
+from .slack_helper import cache_stats
+from .throttle import THROTTLE
+
+LOGGER = logging.getLogger(__name__)
+
+# Where metrics go: "none", "console", "otlp" or "prometheus"
+METRICS_EXPORTER = os.environ.get("METRICS_EXPORTER", "none").lower()
+# How often the console and OTLP exporters push, in seconds
+METRICS_INTERVAL = float(os.environ.get("METRICS_INTERVAL", "60"))
+# The local port serving /metrics, for the prometheus exporter
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+# The address serving /metrics; only this host can scrape it, unless e.g. "0.0.0.0"
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_ENDPOINT = os.environ.get(
+    "METRICS_ENDPOINT", "https://api.honeycomb.io/v1/metrics"
+)
+METRICS_DATASET = os.environ.get("METRICS_DATASET", "producer-bot-metrics")
+
+
+def error_code(exception: Exception) -> str:
+    """How an error is labelled, e.g. "ratelimited" or "channel_not_found" """
+    if isinstance(exception, slack_sdk.errors.SlackApiError):
+        return exception.response.get("error") or str(exception.response.status_code)
+    return type(exception).__name__
+
+
+def _escape(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(attributes: Dict, **extra) -> str:
+    labels = {**attributes, **extra}
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+def _prometheus_name(name: str, unit: str) -> str:
+    name = name.replace(".", "_").replace("-", "_")
+    suffix = {"ms": "milliseconds", "s": "seconds"}.get(unit)
+    return f"{name}_{suffix}" if suffix else name
+
+
+def _metric_lines(metric) -> Iterable[str]:
+    name = _prometheus_name(metric.name, metric.unit)
+    if metric.description:
+        yield f"# HELP {name} {metric.description}"
+    points = metric.data.data_points
+    if isinstance(metric.data, Histogram):
+        yield f"# TYPE {name} histogram"
+        for point in points:
+            cumulative = 0
+            for bound, count in zip(point.explicit_bounds, point.bucket_counts):
+                cumulative += count
+                yield f"{name}_bucket{_labels(point.attributes, le=bound)} {cumulative}"
+            yield f"{name}_bucket{_labels(point.attributes, le='+Inf')} {point.count}"
+            yield f"{name}_sum{_labels(point.attributes)} {point.sum}"
+            yield f"{name}_count{_labels(point.attributes)} {point.count}"
+    elif isinstance(metric.data, Sum) and metric.data.is_monotonic:
+        yield f"# TYPE {name} counter"
+        for point in points:
+            yield f"{name}_total{_labels(point.attributes)} {point.value}"
+    else:
+        yield f"# TYPE {name} gauge"
+        for point in points:
+            yield f"{name}{_labels(point.attributes)} {point.value}"
+
+
+def prometheus_text(data: Optional[MetricsData]) -> str:
+    """Metrics in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for resource_metrics in data.resource_metrics if data else ():
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                lines.extend(_metric_lines(metric))
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(
+    reader: InMemoryMetricReader, port: int, host: str = METRICS_HOST
+) -> ThreadingHTTPServer:
+    """Serve the reader's metrics on http://{host}:{port}/metrics"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text(reader.get_metrics_data()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            LOGGER.debug(format, *args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    LOGGER.info(f"Serving metrics on {host}:{server.server_address[1]}")
+    return server
+
+
+def metric_reader(exporter: str) -> Optional[MetricReader]:
+    if exporter == "prometheus":
+        # served by serve_metrics, once the bot starts
+        return InMemoryMetricReader()
+
+    if exporter == "console":
+        metric_exporter = ConsoleMetricExporter()
+    elif exporter == "otlp":
+        # pylint: disable=import-outside-toplevel
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import (
+            OTLPMetricExporter,
+        )
+
+        metric_exporter = OTLPMetricExporter(
+            endpoint=METRICS_ENDPOINT,
+            headers={
+                "x-honeycomb-team": os.environ.get("HONEYCOMB_TOKEN", ""),
+                "x-honeycomb-dataset": METRICS_DATASET,
+            },
+        )
+    else:
+        if exporter != "none":
+            LOGGER.warning(f"Unknown METRICS_EXPORTER {exporter!r}, not exporting")
+        return None
+    return PeriodicExportingMetricReader(
+        metric_exporter, export_interval_millis=int(METRICS_INTERVAL * 1000)
+    )
+
+
+# Without a reader, the global meter provider stays a no-op and recording is free
+READER = metric_reader(METRICS_EXPORTER)
+if READER is not None:
+    metrics.set_meter_provider(MeterProvider(metric_readers=[READER]))
+meter = metrics.get_meter(__name__)
+
+
+def serve_metrics() -> Optional[ThreadingHTTPServer]:
+    """Start serving /metrics, if they're exported to prometheus"""
+    if not isinstance(READER, InMemoryMetricReader):
+        return None
+    return serve_prometheus(READER, METRICS_PORT)
+
+
+HANDLER_DURATION = meter.create_histogram(
+    "handler.duration", unit="ms", description="Time spent in an event handler"
+)
+HANDLER_ERRORS = meter.create_counter(
+    "handler.errors", description="Event handlers which raised, by error"
+)
+API_DURATION = meter.create_histogram(
+    "slack.api.duration", unit="ms", description="Time per Slack API request"
+)
+API_REQUESTS = meter.create_counter(
+    "slack.api.requests",
+    description="Slack API requests, by method and error (ok when they succeeded)",
+)
+
+
+def _observe_caches(_options: CallbackOptions) -> Iterable[Observation]:
+    for team, caches in cache_stats().items():
+        for cache, stats in caches.items():
+            for operation, count in vars(stats).items():
+                yield Observation(
+                    count, {"cache": cache, "team": team, "operation": operation}
+                )
+
+
+meter.create_observable_counter(
+    "cache.operations",
+    callbacks=[_observe_caches],
+    description="Slack lookup cache hits, misses, evictions and so on",
+)
+
+
+def _observe_duplicates(_options: CallbackOptions) -> Iterable[Observation]:
+    for event_type, count in list(DEDUP.suppressed.items()):
+        yield Observation(count, {"event": event_type})
+
+
+meter.create_observable_counter(
+    "events.duplicates",
+    callbacks=[_observe_duplicates],
+    description="Events delivered again and dropped before any handler ran",
+)
+
+
+def _observe_throttle(_options: CallbackOptions) -> Iterable[Observation]:
+    for rule_id, count in list(THROTTLE.suppressed.items()):
+        yield Observation(count, {"rule": rule_id})
+
+
+meter.create_observable_counter(
+    "triggers.suppressed",
+    callbacks=[_observe_throttle],
+    description="Trigger rules left out of a message while cooling down",
+)
+
+
+def record_handler(name: str, seconds: float, exception: Optional[Exception] = None):
+    HANDLER_DURATION.record(seconds * 1000, {"handler": name, "ok": exception is None})
+    if exception is not None:
+        HANDLER_ERRORS.add(1, {"handler": name, "error": error_code(exception)})
+
+
+def record_api_call(method: str, seconds: float, error: str = "ok"):
+    API_DURATION.record(seconds * 1000, {"method": method, "ok": error == "ok"})
+    API_REQUESTS.add(1, {"method": method, "error": error})
+
+
+def timed_request(method: str, request: Callable) -> Callable:
+    """Wrap a request so each attempt at it is recorded"""
+
+    def timed():
+        started = time.perf_counter()
+        try:
+            response = request()
+        except Exception as exception:
+            record_api_call(
+                method, time.perf_counter() - started, error_code(exception)
+            )
+            raise
+        record_api_call(method, time.perf_counter() - started)
+        return response
+
+    return timed
+
+
+def timed_request_async(method: str, request: Callable[[], Awaitable]) -> Callable:
+    """Wrap a request so each attempt at it is recorded, see timed_request"""
+
+    async def timed():
+        started = time.perf_counter()
+        try:
+            response = await request()
+        except Exception as exception:
+            record_api_call(
+                method, time.perf_counter() - started, error_code(exception)
+            )
+            raise
+        record_api_call(method, time.perf_counter() - started)
+        return response
+
+    return timed
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Set, Tuple
+
+from .reactions import (
+    ReactionResult,
+    add_reactions,
+    add_reactions_async,
+    remove_reactions,
+    remove_reactions_async,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+# How long mirrored reactions wait, to be sent together or cancelled out
+MIRROR_WINDOW = float(os.environ.get("MIRROR_WINDOW", "2"))
+# The least time between typing indicators in a channel
+TYPING_INTERVAL = float(os.environ.get("TYPING_INTERVAL", "3"))
+
+# (channel, timestamp, reaction) and whether it's to be added (or removed)
+ReactionKey = Tuple[str, str, str]
+
+
+def _batches(pending: Dict[ReactionKey, bool], add: bool):
+    """Reaction names to add (or remove), per message"""
+    batches: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+    for (channel, timestamp, name), adding in pending.items():
+        if adding == add:
+            batches[(channel, timestamp)].append(name)
+    return batches.items()
+
+
+def _log_failures(results: List[ReactionResult]):
+    for result in results:
+        if not result.ok:
+            LOGGER.warning(f"Failed to mirror reaction {result.name}: {result.error}")
+
+
+class ReactionMirror:
+    """Copies reactions in batches, dropping any undone in the meantime
+
+    Changes wait up to `window` seconds. A reaction added then removed again (or
+    the other way around) in that time is never sent, and the rest are sent
+    together, concurrently. With no window, every change is sent straight away.
+
+    Changes are kept apart by the web client's token, so each workspace's are
+    sent with its own client.
+    """
+
+    def __init__(self, window: float = MIRROR_WINDOW):
+        self.window = window
+        self.stats: Counter = Counter()
+        self._pending: Dict[str, Dict[ReactionKey, bool]] = {}  # by token
+        self._scheduled: Set[str] = set()  # tokens with a flush on the way
+        self._lock = threading.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _change(self, token: str, key: ReactionKey, add: bool) -> bool:
+        """Record a change, returning True if a flush needs scheduling"""
+        with self._lock:
+            pending = self._pending.setdefault(token, {})
+            if pending.get(key, add) != add:
+                # the opposite change is still waiting, so neither needs sending
+                del pending[key]
+                self.stats["cancelled"] += 2
+            else:
+                pending[key] = add
+            if token in self._scheduled or not pending:
+                return False
+            self._scheduled.add(token)
+            return True
+
+    def _take(self, token: str) -> Dict[ReactionKey, bool]:
+        with self._lock:
+            pending = self._pending.pop(token, {})
+            self._scheduled.discard(token)
+            self.stats["sent"] += len(pending)
+            self.stats["batches"] += 1
+        return pending
+
+    def add(self, web_client, channel: str, timestamp: str, name: str):
+        self._schedule(web_client, (channel, timestamp, name), True)
+
+    def remove(self, web_client, channel: str, timestamp: str, name: str):
+        self._schedule(web_client, (channel, timestamp, name), False)
+
+    def _schedule(self, web_client, key: ReactionKey, add: bool):
+        if not self._change(web_client.token, key, add):
+            return
+        if self.window <= 0:
+            self.flush(web_client)
+            return
+        timer = threading.Timer(self.window, self.flush, args=(web_client,))
+        timer.daemon = True
+        timer.start()
+
+    def flush(self, web_client):
+        pending = self._take(web_client.token)
+        for (channel, timestamp), names in _batches(pending, add=True):
+            _log_failures(
+                add_reactions(web_client, channel, timestamp, [[n] for n in names])
+            )
+        for (channel, timestamp), names in _batches(pending, add=False):
+            item = {"type": "message", "channel": channel, "ts": timestamp}
+            _log_failures(remove_reactions(web_client, item, names))
+
+    async def add_async(self, web_client, channel: str, timestamp: str, name: str):
+        await self._schedule_async(web_client, (channel, timestamp, name), True)
+
+    async def remove_async(self, web_client, channel: str, timestamp: str, name: str):
+        await self._schedule_async(web_client, (channel, timestamp, name), False)
+
+    async def _schedule_async(self, web_client, key: ReactionKey, add: bool):
+        if not self._change(web_client.token, key, add):
+            return
+        if self.window <= 0:
+            await self.flush_async(web_client)
+            return
+        asyncio.get_running_loop().call_later(
+            self.window, self._start_flush, web_client
+        )
+
+    def _start_flush(self, web_client):
+        task = asyncio.ensure_future(self.flush_async(web_client))
+        # the loop only keeps a weak reference to its tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush_async(self, web_client):
+        pending = self._take(web_client.token)
+        adds = [
+            add_reactions_async(web_client, channel, timestamp, [[n] for n in names])
+            for (channel, timestamp), names in _batches(pending, add=True)
+        ]
+        removes = [
+            remove_reactions_async(
+                web_client,
+                {"type": "message", "channel": channel, "ts": timestamp},
+                names,
+            )
+            for (channel, timestamp), names in _batches(pending, add=False)
+        ]
+        for results in await asyncio.gather(*adds, *removes):
+            _log_failures(results)
+
+
+class TypingLimiter:
+    """Allows one typing indicator per channel every `interval` seconds
+
+    Only channels with an indicator in the last `interval` are remembered, oldest
+    first, so the rest can be dropped as soon as they're allowed again.
+    """
+
+    def __init__(self, interval: float = TYPING_INTERVAL):
+        self.interval = interval
+        self.stats: Counter = Counter()
+        self._last_sent: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, channel: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._last_sent:
+                oldest = next(iter(self._last_sent.values()))
+                if now - oldest < self.interval:
+                    break
+                self._last_sent.popitem(last=False)
+
+            if channel in self._last_sent:
+                self.stats["skipped"] += 1
+                return False
+            self._last_sent[channel] = now
+            self.stats["sent"] += 1
+            return True
@@ -1,15 +1,30 @@
+import asyncio
+import json
 import logging
+import os
 import re
+import time
 import urllib.parse
 from dataclasses import dataclass
 from random import random
-from typing import Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from random import choice
 
 from slack_sdk import WebClient
 from slack_sdk.rtm import RTMClient
+from slack_sdk.web.async_client import AsyncWebClient
 
-from .slack_helper import is_channel_im, is_user_a_bot
+from .features import Message
+from .matcher import Matcher, rule_id
+from .mirror import ReactionMirror, TypingLimiter
+from .ruleset import table_for
+from .slack_helper import (
+    is_channel_im,
+    is_channel_im_async,
+    is_user_a_bot,
+    is_user_a_bot_async,
+)
+from .state import MemoryStore, state_store
 
 TRIGGERED_EMOJI = {
     "wave": 0.1,
@@ -24,8 +39,34 @@ TRIGGERED_EMOJI = {
     "rip": 1,
     "dumpster-fire": 1,
 }
+
+
+def rules_for(emoji_chances: Dict[str, float]) -> Iterator[Tuple[str, str]]:
+    return (
+        (rule_id(__name__, emoji), re.escape(f":{emoji}:")) for emoji in emoji_chances
+    )
+
+
+def rule_chances(emoji_chances: Dict[str, float]) -> Dict[str, float]:
+    return {rule_id(__name__, emoji): chance for emoji, chance in emoji_chances.items()}
+
+
+MATCHER = Matcher(rules_for(TRIGGERED_EMOJI))
 MOCK_FREQUENCY = 5
 PARROT_LIMIT = 50
+# How long someone's parroted for, at most, in seconds
+PARROT_EXPIRY = float(os.environ.get("PARROT_EXPIRY", "86400"))
+# How many people emoji can have parroted at once; nominations aren't limited
+PARROT_MAX_TARGETS = int(os.environ.get("PARROT_MAX_TARGETS", "5"))
+
+# Keys in the state store: who's being parroted, and how many messages they've sent
+TARGET_KEY = "parrot:target:"
+COUNT_KEY = "parrot:count:{user}"
+# PARROT_MAX_TARGETS numbered slots, each held by someone emoji started parroting
+# until they expire, so replicas can't start more than that between them
+SLOT_KEY = "parrot:slot:"
+
+STOP_PHRASES = {"no!", "cut it out", "cut that out", "stop it", "enough!"}
 
 GREETINGS = [
     "Hi",
@@ -40,6 +81,26 @@ GREETINGS = [
 LOGGER = logging.getLogger(__name__)
 
 
+def mock_blocks(text: str) -> List[Dict]:
+    """Blocks for a mocking reply to a message"""
+    url = "https://mock.sam.wtf/" + urllib.parse.quote_plus(text)
+    return [
+        {
+            "type": "image",
+            "image_url": url,
+            "alt_text": text,
+        }
+    ]
+
+
+def triggered(matches: Iterable[str]) -> bool:
+    """Whether a message's emoji get someone parroted, rolling for each one"""
+    if not matches:
+        return False  # most messages
+    chances = rule_chances(table_for("parrot", TRIGGERED_EMOJI))
+    return any(random() <= chances[match] for match in matches if match in chances)
+
+
 @dataclass
 class MessageDetails:
     """Details of a message"""
@@ -48,17 +109,217 @@ class MessageDetails:
     timestamp: str
 
 
+@dataclass
+class Target:
+    """Someone being parroted"""
+
+    user: str
+    expires: float
+    nominated_by: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, user: str, value: str) -> "Target":
+        return cls(user=user, **json.loads(value))
+
+    def to_json(self) -> str:
+        return json.dumps({"expires": self.expires, "nominated_by": self.nominated_by})
+
+
+def reaction_outcome(target: Optional[Target], emoji: str) -> Optional[str]:
+    """What a reaction leads to: "mirror" it if its user's being parroted, "parrot"
+    them if its emoji got them parroted (rolling for it), or None"""
+    if target is not None:
+        return "mirror"
+    chance = table_for("parrot", TRIGGERED_EMOJI).get(emoji)
+    return "parrot" if chance is not None and random() <= chance else None
+
+
+def greeting_text(user: str) -> str:
+    return f"{choice(GREETINGS)} <@{user}> :partyparrot:"
+
+
+def parroting_text(user: str, nominating_user: Optional[str]) -> str:
+    message = f"Now parroting <@{user}>"
+    if nominating_user:
+        message = f"{message} - nominated by <@{nominating_user}>"
+    return message
+
+
+def asks_to_stop(text: str) -> bool:
+    return any(phrase in text for phrase in STOP_PHRASES)
+
+
+def stop_reply(user: str, stopped: Optional[List[str]]) -> str:
+    """The reply to someone asking to stop, given who was (or None if no one was
+    being parroted)"""
+    if stopped is None:
+        return f"<@{user}> I'm sorry but I'm not quite sure what you're talking about?"
+    return f"<@{user}> OK. :pouting_cat:"
+
+
+def stopped_text(victim: str, user: str) -> str:
+    return f"No longer parroting <@{victim}> :pouting_cat: (<@{user}> asked me to stop)"
+
+
+def nominee(text: str) -> Optional[str]:
+    """Who a mention nominates to be parroted, if anyone"""
+    match = re.search(r"parrot \<\@([a-z0-9]+)\>", text)
+    return match[1].upper() if match else None
+
+
+def nomination_text(victim: str, started: bool) -> str:
+    if not started:
+        return f":partyparrot: <@{victim}> is already being parroted"
+    return f":partyparrot: Watch out <@{victim}>, there's a parrot circling you"
+
+
+def mentioned_users(text: str) -> List[str]:
+    return [user.upper() for user in re.findall(r"<@([a-z0-9]+)>", text)]
+
+
+def status_text(targets: List[Target]) -> str:
+    if not targets:
+        return ":pouting_cat: Not parroting anyone right now"
+
+    def describe(target: Target) -> str:
+        minutes = max(0, int((target.expires - time.time()) // 60))
+        nominated = (
+            f"nominated by <@{target.nominated_by}>, " if target.nominated_by else ""
+        )
+        return f"<@{target.user}> ({nominated}{minutes} more minutes)"
+
+    return ":partyparrot: Currently parroting " + ", ".join(map(describe, targets))
+
+
 class Parrot:
-    """Parrot party troll mode"""
+    """Parrot party troll mode
+
+    Who's being parroted is kept in a state store, so it can survive restarts
+    and be shared by replicas of the bot. Any number of people can be parroted
+    at once, each with their own count and expiry; an event only costs one
+    lookup of its user, whoever else is being parroted. The async handlers make
+    their lookups off the event loop, unless the store is in memory.
+    """
 
-    user: Optional[str] = None
-    message_count: int = 0
     debug_channel: Optional[str]
 
-    def __init__(self, debug_channel: Optional[str]):
+    def __init__(self, debug_channel: Optional[str], store=None):
         """Initialise"""
-        self.user = None
         self.debug_channel = debug_channel
+        self.store = store or MemoryStore()
+        # the parroted users' reactions and typing are copied sparingly
+        self.mirror = ReactionMirror()
+        self.typing = TypingLimiter()
+
+    async def _call(self, method, *args):
+        """Call a method which uses the store, off the event loop if it blocks"""
+        if isinstance(self.store, MemoryStore):
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    def target(self, user: str) -> Optional[Target]:
+        """The user, if they're being parroted"""
+        value = self.store.get(TARGET_KEY + user)
+        if value is None:
+            return None
+        target = Target.from_json(user, value)
+        if target.expires <= time.time():
+            self._expire(user, value)
+            return None
+        return target
+
+    def _expire(self, user: str, value: str):
+        if self.store.compare_and_set(TARGET_KEY + user, value, None):
+            self.store.delete(COUNT_KEY.format(user=user))
+
+    def targets(self) -> List[Target]:
+        """Everyone being parroted, soonest to expire first"""
+        targets = []
+        for key, value in self.store.scan(TARGET_KEY).items():
+            target = Target.from_json(key[len(TARGET_KEY) :], value)
+            if target.expires > time.time():
+                targets.append(target)
+            else:
+                self._expire(target.user, value)
+        return sorted(targets, key=lambda target: target.expires)
+
+    def _claim_slot(self, target: Target) -> Optional[Tuple[str, str]]:
+        """Take a free slot for the target, returning its key and value"""
+        slots = self.store.scan(SLOT_KEY)
+        value = json.dumps([target.user, target.expires])
+        for number in range(PARROT_MAX_TARGETS):
+            key = f"{SLOT_KEY}{number}"
+            holder = slots.get(key)
+            if holder is not None and json.loads(holder)[1] > time.time():
+                continue
+            if self.store.compare_and_set(key, holder, value):
+                if holder is not None:
+                    self.target(json.loads(holder)[0])  # clear up after them
+                return key, value
+        return None
+
+    def _release_slot(self, user: str):
+        for key, value in self.store.scan(SLOT_KEY).items():
+            if json.loads(value)[0] == user:
+                self.store.compare_and_set(key, value, None)
+
+    def start_parroting(self, user: str, nominating_user: Optional[str] = None) -> bool:
+        """Start parroting a user, returning False if they already are, or if emoji
+        have already started parroting as many people as they can"""
+        current = self.store.get(TARGET_KEY + user)
+        if (
+            current is not None
+            and Target.from_json(user, current).expires > time.time()
+        ):
+            return False
+
+        target = Target(user, time.time() + PARROT_EXPIRY, nominating_user)
+        # nominations aren't limited
+        slot = None if nominating_user else self._claim_slot(target)
+        started = (bool(nominating_user) or slot is not None) and (
+            self.store.compare_and_set(TARGET_KEY + user, current, target.to_json())
+        )
+        if started:
+            self.store.delete(COUNT_KEY.format(user=user))
+        elif slot is not None:
+            # another replica started parroting them first
+            self.store.compare_and_set(*slot, None)
+        return started
+
+    def stop_parroting(self, user: str) -> bool:
+        """Stop parroting a user, returning False if they already weren't"""
+        value = self.store.get(TARGET_KEY + user)
+        if value is None or not self.store.compare_and_set(
+            TARGET_KEY + user, value, None
+        ):
+            return False
+        self.store.delete(COUNT_KEY.format(user=user))
+        self._release_slot(user)
+        return True
+
+    def count_message(self, user: str) -> int:
+        return self.store.incr(COUNT_KEY.format(user=user))
+
+    def count_parroted(self, user: str) -> Tuple[bool, bool]:
+        """Count a parroted user's message, returning whether to mock it, and
+        whether they've stopped being parroted as it was their last"""
+        message_count = self.count_message(user)
+        return message_count % MOCK_FREQUENCY == 0, (
+            message_count >= PARROT_LIMIT and self.stop_parroting(user)
+        )
+
+    def stop_asked(self, text: str) -> Optional[List[str]]:
+        """Stop parroting the people named in a mention, or everyone if no one
+        being parroted is, returning who was stopped (None if no one was being
+        parroted)"""
+        targets = self.targets()
+        if not targets:
+            return None
+
+        named = set(mentioned_users(text))
+        if any(target.user in named for target in targets):
+            targets = [target for target in targets if target.user in named]
+        return [target.user for target in targets if self.stop_parroting(target.user)]
 
     def write_log_entry(self, web_client: WebClient, message: str):
         """Write a message to the admin channel and log"""
@@ -76,17 +337,17 @@ class Parrot:
         user: str,
         nominating_user: Optional[str] = None,
         message_details: Optional[MessageDetails] = None,
-    ):
-        """Parrot a new user"""
-        message = f"Now parroting <@{user}>"
-        if nominating_user:
-            message = f"{message} - nominated by <@{nominating_user}>"
+    ) -> bool:
+        """Parrot a new user, returning False if they couldn't be"""
+        if not self.start_parroting(user, nominating_user):
+            return False
 
+        message = parroting_text(user, nominating_user)
         if message_details:
             web_client.chat_postMessage(
                 channel=message_details.channel,
                 thread_ts=message_details.timestamp,
-                text=f"{choice(GREETINGS)} <@{user}> :partyparrot:",
+                text=greeting_text(user),
             )
 
             permalink = web_client.chat_getPermalink(
@@ -94,49 +355,38 @@ class Parrot:
             ).data["permalink"]
             message = f"{message} ({permalink})"
         self.write_log_entry(web_client, message)
-        self.user = user
-        self.message_count = 0
+        return True
 
-    def on_message(
-        self,
-        web_client: WebClient,
-        text: str,
-        channel: str,
-        timestamp: str,
-        user: str,
-    ):
+    def on_message(self, message: Message):
         """Handle messages"""
+        web_client = message.web_client
+        user = message.user
+        target = self.target(user)
+        if target is None and not triggered(message.matches):
+            return
+
         if is_user_a_bot(web_client, user):
             return
 
-        for emoji, chance in TRIGGERED_EMOJI.items():
-            if f":{emoji}:" in text and random() <= chance and user != self.user:
-                self.parrot(
-                    web_client, user, message_details=MessageDetails(channel, timestamp)
-                )
-                return
+        if target is None:
+            self.parrot(
+                web_client,
+                user,
+                message_details=MessageDetails(message.channel, message.timestamp),
+            )
+            return
 
-        if user == self.user:
-            self.message_count += 1
-            if self.message_count % MOCK_FREQUENCY == 0:
-                url = "https://mock.sam.wtf/" + urllib.parse.quote_plus(text)
-                web_client.chat_postMessage(
-                    channel=channel,
-                    thread_ts=timestamp,
-                    blocks=[
-                        {
-                            "type": "image",
-                            "image_url": url,
-                            "alt_text": text,
-                        }
-                    ],
-                )
-            if self.message_count >= PARROT_LIMIT:
-                self.write_log_entry(
-                    web_client,
-                    f"No longer parroting <@{self.user}> :bongoblob:",
-                )
-                self.user = None
+        mock, stopped = self.count_parroted(user)
+        if mock:
+            web_client.chat_postMessage(
+                channel=message.channel,
+                thread_ts=message.timestamp,
+                blocks=mock_blocks(message.text),
+            )
+        if stopped:
+            self.write_log_entry(
+                web_client, f"No longer parroting <@{user}> :bongoblob:"
+            )
 
     def on_app_mention(
         self,
@@ -147,56 +397,36 @@ class Parrot:
         user: str,
     ):
         """Handle mentions"""
-        phrases = {"no!", "cut it out", "cut that out", "stop it", "enough!"}
-        for phrase in phrases:
-            if phrase in text:
-                if not self.user:
-                    web_client.chat_postMessage(
-                        channel=channel,
-                        thread_ts=timestamp,
-                        text=f"<@{user}> I'm sorry but I'm not quite sure what you're talking about?",
-                    )
-                    return
-
-                self.write_log_entry(
-                    web_client,
-                    f"No longer parroting <@{self.user}> :pouting_cat: (<@{user}> asked me to stop)",
-                )
-                self.user = None
-                web_client.chat_postMessage(
-                    channel=channel,
-                    thread_ts=timestamp,
-                    text=f"<@{user}> OK. :pouting_cat:",
-                )
-                break
-
-        if channel == self.debug_channel or is_channel_im(channel, web_client):
-            match = re.search(r"parrot \<\@([a-z0-9]+)\>", text)
-            if match:
-                victim = match[1].upper()
-                self.parrot(web_client, victim, user)
-                web_client.chat_postEphemeral(
-                    channel=channel,
-                    thread_ts=timestamp,
-                    user=user,
-                    text=f":partyparrot: Watch out <@{victim}>, there's a parrot circling you",
-                )
+        if asks_to_stop(text):
+            stopped = self.stop_asked(text)
+            for victim in stopped or []:
+                self.write_log_entry(web_client, stopped_text(victim, user))
+            web_client.chat_postMessage(
+                channel=channel, thread_ts=timestamp, text=stop_reply(user, stopped)
+            )
+            if stopped is None:
+                return
+
+        if channel != self.debug_channel and not is_channel_im(channel, web_client):
+            return
 
-            if "parrot status" in text:
-                if self.user:
-                    web_client.chat_postEphemeral(
-                        channel=channel,
-                        thread_ts=timestamp,
-                        user=user,
-                        text=f":partyparrot: Currently parroting <@{self.user}>",
-                    )
-                else:
-                    web_client.chat_postEphemeral(
-                        channel=channel,
-                        thread_ts=timestamp,
-                        user=user,
-                        text=":pouting_cat: Not parroting anyone right now",
-                    )
+        victim = nominee(text)
+        if victim:
+            started = self.parrot(web_client, victim, user)
+            web_client.chat_postEphemeral(
+                channel=channel,
+                thread_ts=timestamp,
+                user=user,
+                text=nomination_text(victim, started),
+            )
+
+        if "parrot status" in text:
+            web_client.chat_postEphemeral(
+                channel=channel,
+                thread_ts=timestamp,
+                user=user,
+                text=status_text(self.targets()),
+            )
 
     def on_reaction_added(
         self,
@@ -207,21 +437,17 @@ class Parrot:
         user: str,
     ):
         """Handle reactions added"""
+        outcome = reaction_outcome(self.target(user), emoji)
         # Don't parrot bots
-        if is_user_a_bot(web_client, user):
+        if outcome is None or is_user_a_bot(web_client, user):
             return
 
-        for check_emoji, chance in TRIGGERED_EMOJI.items():
-            if emoji == check_emoji and random() <= chance and user != self.user:
-                self.parrot(
-                    web_client, user, message_details=MessageDetails(channel, timestamp)
-                )
-                return  # don't parrot the parrot emoji itself
-
-        if user != self.user:
-            return
-
-        web_client.reactions_add(channel=channel, timestamp=timestamp, name=emoji)
+        if outcome == "parrot":
+            self.parrot(
+                web_client, user, message_details=MessageDetails(channel, timestamp)
+            )
+        else:
+            self.mirror.add(web_client, channel, timestamp, emoji)
 
     def on_reaction_removed(
         self,
@@ -232,14 +458,194 @@ class Parrot:
         user: str,
     ):
         """Handle reactions removed"""
-        if user != self.user:
+        if self.target(user) is None:
             return
 
-        web_client.reactions_remove(name=emoji, channel=channel, timestamp=timestamp)
+        self.mirror.remove(web_client, channel, timestamp, emoji)
 
     async def on_user_typing(self, rtm_client: RTMClient, channel: str, user: str):
         """Handle users typing"""
-        if user != self.user:
+        if await self._call(self.target, user) is None or not self.typing.allow(
+            channel
+        ):
             return
 
         await rtm_client.typing(channel=channel)
+
+    async def write_log_entry_async(self, web_client: AsyncWebClient, message: str):
+        """Write a message to the admin channel and log"""
+        if self.debug_channel:
+            await web_client.chat_postMessage(
+                channel=self.debug_channel,
+                text=f":partyparrot: {message}",
+                unfurl_links=True,
+            )
+        LOGGER.info(message)
+
+    async def parrot_async(
+        self,
+        web_client: AsyncWebClient,
+        user: str,
+        nominating_user: Optional[str] = None,
+        message_details: Optional[MessageDetails] = None,
+    ) -> bool:
+        """Parrot a new user, returning False if they couldn't be"""
+        if not await self._call(self.start_parroting, user, nominating_user):
+            return False
+
+        message = parroting_text(user, nominating_user)
+        if message_details:
+            await web_client.chat_postMessage(
+                channel=message_details.channel,
+                thread_ts=message_details.timestamp,
+                text=greeting_text(user),
+            )
+
+            permalink = (
+                await web_client.chat_getPermalink(
+                    channel=message_details.channel,
+                    message_ts=message_details.timestamp,
+                )
+            ).data["permalink"]
+            message = f"{message} ({permalink})"
+        await self.write_log_entry_async(web_client, message)
+        return True
+
+    async def on_message_async(self, message: Message):
+        """Handle messages"""
+        web_client = message.web_client
+        user = message.user
+        target = await self._call(self.target, user)
+        if target is None and not triggered(message.matches):
+            return
+
+        if await is_user_a_bot_async(web_client, user):
+            return
+
+        if target is None:
+            await self.parrot_async(
+                web_client,
+                user,
+                message_details=MessageDetails(message.channel, message.timestamp),
+            )
+            return
+
+        mock, stopped = await self._call(self.count_parroted, user)
+        if mock:
+            await web_client.chat_postMessage(
+                channel=message.channel,
+                thread_ts=message.timestamp,
+                blocks=mock_blocks(message.text),
+            )
+        if stopped:
+            await self.write_log_entry_async(
+                web_client, f"No longer parroting <@{user}> :bongoblob:"
+            )
+
+    async def on_app_mention_async(
+        self,
+        web_client: AsyncWebClient,
+        text: str,
+        channel: str,
+        timestamp: Optional[str],
+        user: str,
+    ):
+        """Handle mentions"""
+        if asks_to_stop(text):
+            stopped = await self._call(self.stop_asked, text)
+            for victim in stopped or []:
+                await self.write_log_entry_async(web_client, stopped_text(victim, user))
+            await web_client.chat_postMessage(
+                channel=channel, thread_ts=timestamp, text=stop_reply(user, stopped)
+            )
+            if stopped is None:
+                return
+
+        if channel != self.debug_channel and not await is_channel_im_async(
+            channel, web_client
+        ):
+            return
+
+        victim = nominee(text)
+        if victim:
+            started = await self.parrot_async(web_client, victim, user)
+            await web_client.chat_postEphemeral(
+                channel=channel,
+                thread_ts=timestamp,
+                user=user,
+                text=nomination_text(victim, started),
+            )
+
+        if "parrot status" in text:
+            await web_client.chat_postEphemeral(
+                channel=channel,
+                thread_ts=timestamp,
+                user=user,
+                text=status_text(await self._call(self.targets)),
+            )
+
+    async def on_reaction_added_async(
+        self,
+        web_client: AsyncWebClient,
+        emoji: str,
+        channel: str,
+        timestamp: str,
+        user: str,
+    ):
+        """Handle reactions added"""
+        outcome = reaction_outcome(await self._call(self.target, user), emoji)
+        # Don't parrot bots
+        if outcome is None or await is_user_a_bot_async(web_client, user):
+            return
+
+        if outcome == "parrot":
+            await self.parrot_async(
+                web_client, user, message_details=MessageDetails(channel, timestamp)
+            )
+        else:
+            await self.mirror.add_async(web_client, channel, timestamp, emoji)
+
+    async def on_reaction_removed_async(
+        self,
+        web_client: AsyncWebClient,
+        emoji: str,
+        channel: str,
+        timestamp: str,
+        user: str,
+    ):
+        """Handle reactions removed"""
+        if await self._call(self.target, user) is None:
+            return
+
+        await self.mirror.remove_async(web_client, channel, timestamp, emoji)
+
+
+PARROT = Parrot(os.environ.get("ADMIN_DEBUG_CHANNEL", ""), state_store())
+
+
+def on_mention(message: Message):
+    PARROT.on_app_mention(
+        message.web_client,
+        message.text,
+        message.channel,
+        message.thread_ts,
+        message.user,
+    )
+
+
+async def on_mention_async(message: Message):
+    await PARROT.on_app_mention_async(
+        message.web_client,
+        message.text,
+        message.channel,
+        message.thread_ts,
+        message.user,
+    )
+
+
+def on_message(message: Message):
+    PARROT.on_message(message)
+
+
+async def on_message_async(message: Message):
+    await PARROT.on_message_async(message)
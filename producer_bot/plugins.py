@@ -0,0 +1,137 @@
+import importlib
+import logging
+import os
+import resource
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .features import Feature
+from .matcher import Matcher, rule_id
+
+LOGGER = logging.getLogger(__name__)
+
+STARTED = time.monotonic()
+
+# Plugins which are off unless listed here, e.g. "reposter,vaccinations"
+ENABLED_PLUGINS = set(filter(None, os.environ.get("ENABLED_PLUGINS", "").split(",")))
+
+
+class Plugin:
+    """A feature module, and the rules which mean it has something to do
+
+    A plugin given its rules up front isn't imported until `load` is first called,
+    i.e. when one of its rules matches, so its dependencies cost nothing until
+    then. Without rules, the module is imported straight away and its `MATCHER`
+    is used; that's only for modules which are cheap to import.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        features: Sequence[Feature],
+        rules: Optional[Iterable[Tuple[str, str]]] = None,
+        enabled: bool = True,
+    ):
+        self.name = name
+        self.features = features
+        self.enabled = enabled
+        self.import_seconds: Optional[float] = None
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+        if rules is None:
+            self.matcher = self.load().MATCHER
+        else:
+            self.matcher = Matcher(rules)
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self) -> ModuleType:
+        with self._lock:
+            if self._module is None:
+                started = time.perf_counter()
+                self._module = importlib.import_module(f"{__package__}.{self.name}")
+                self.import_seconds = time.perf_counter() - started
+                LOGGER.debug(
+                    f"Loaded {self.name} in {self.import_seconds * 1000:.1f}ms"
+                )
+        return self._module
+
+
+VACCINATION_NUMBERS = r"(all|daily|total) (vax|vaccination) numbers"
+
+PLUGINS: Dict[str, Plugin] = {
+    plugin.name: plugin
+    for plugin in (
+        Plugin(
+            "triggered_reactions",
+            [Feature("reactions", reactions=True, triggered=True, throttled=True)],
+        ),
+        Plugin("dice_roller", [Feature("reactions", reactions=True, triggered=True)]),
+        Plugin(
+            "corrector",
+            [Feature("on_message", "on_message_async", triggered=True, throttled=True)],
+        ),
+        Plugin(
+            "reposter",
+            [Feature("on_message", "on_message_async", triggered=True, skip_bots=True)],
+            enabled="reposter" in ENABLED_PLUGINS,
+        ),
+        Plugin(
+            "admin",
+            [Feature("on_mention", "on_mention_async", mention=True, skip_bots=True)],
+        ),
+        Plugin(
+            "parrot",
+            [
+                Feature("on_mention", "on_mention_async", mention=True, skip_bots=True),
+                Feature("on_message", "on_message_async", skip_bots=True),
+            ],
+        ),
+        # pandas and matplotlib take longer to import than everything else together
+        Plugin(
+            "vaccinations",
+            [
+                Feature(
+                    "on_message",
+                    "on_message_async",
+                    triggered=True,
+                    mention=True,
+                    skip_bots=True,
+                )
+            ],
+            rules=[
+                (
+                    rule_id(f"{__package__}.vaccinations", VACCINATION_NUMBERS),
+                    VACCINATION_NUMBERS,
+                )
+            ],
+            enabled="vaccinations" in ENABLED_PLUGINS,
+        ),
+    )
+}
+
+
+def enabled_plugins() -> List[Plugin]:
+    return [plugin for plugin in PLUGINS.values() if plugin.enabled]
+
+
+def startup_report() -> str:
+    """How long the bot took to start, and what each plugin cost to import"""
+    # ru_maxrss is in KiB on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    imports = ", ".join(
+        (
+            f"{plugin.name} {plugin.import_seconds * 1000:.1f}ms"
+            if plugin.loaded
+            else f"{plugin.name} (not loaded)"
+        )
+        for plugin in PLUGINS.values()
+    )
+    return (
+        f"Started in {time.monotonic() - STARTED:.2f}s, "
+        f"max RSS {max_rss:.1f}MiB. Plugin imports: {imports}"
+    )
@@ -0,0 +1,82 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+# Time every trigger rule on its own, to find the slow (or never matching) ones
+RULE_PROFILING = os.environ.get("RULE_PROFILING", "").lower() in ("1", "true", "yes")
+# How often (in seconds) the rule profile is logged, 0 to only report it on demand
+RULE_PROFILE_LOG_INTERVAL = float(os.environ.get("RULE_PROFILE_LOG_INTERVAL", "0"))
+
+
+@dataclass
+class RuleStats:
+    evaluations: int = 0
+    matches: int = 0
+    seconds: float = 0.0
+
+
+class RuleProfile:
+    """How often each rule was evaluated and matched, and the time it took
+
+    Given to a Matcher, every rule is searched for on its own, skipping the
+    combined scan, so the cost of each one can be told apart.
+    """
+
+    def __init__(self):
+        self.rules: Dict[str, RuleStats] = defaultdict(RuleStats)
+        self._lock = threading.Lock()
+
+    def record(self, timings: Iterable[Tuple[str, bool, float]]):
+        """Record a message's (rule ID, matched, seconds) for each rule"""
+        with self._lock:
+            for rule_id, matched, seconds in timings:
+                stats = self.rules[rule_id]
+                stats.evaluations += 1
+                stats.matches += matched
+                stats.seconds += seconds
+
+    def reset(self) -> str:
+        with self._lock:
+            self.rules.clear()
+        return "Rule profile reset"
+
+    def report(self, limit: int = 10) -> str:
+        """The slowest rules, and those which never matched"""
+        with self._lock:
+            rules = {rule_id: RuleStats(**vars(s)) for rule_id, s in self.rules.items()}
+        if not rules:
+            return "No rules have been profiled, is RULE_PROFILING set?"
+
+        slowest = sorted(rules.items(), key=lambda rule: rule[1].seconds, reverse=True)
+        lines = [
+            f"`{rule_id}` {stats.seconds * 1000:.1f}ms over {stats.evaluations} "
+            f"messages ({stats.seconds / stats.evaluations * 1e6:.1f}µs each), "
+            f"{stats.matches} matches"
+            for rule_id, stats in slowest[:limit]
+        ]
+        never_matched = sorted(
+            rule_id for rule_id, stats in rules.items() if not stats.matches
+        )
+        if never_matched:
+            lines.append(f"Never matched: {', '.join(never_matched)}")
+        return "\n".join(lines)
+
+    def log_every(self, interval: float):
+        """Log the report every `interval` seconds, in the background"""
+        threading.Thread(
+            target=self._log, args=(interval,), name="rule-profile", daemon=True
+        ).start()
+
+    def _log(self, interval: float):
+        while True:
+            time.sleep(interval)
+            LOGGER.info(f"Rule profile:\n{self.report()}")
+
+
+PROFILE = RuleProfile()
@@ -0,0 +1,271 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import slack_sdk
+from slack_sdk.web.async_client import AsyncWebClient
+
+from .slack_helper import (
+    event_item_to_reactions_api,
+    get_bot_reactions,
+    get_bot_reactions_async,
+    get_bot_user_id,
+    get_bot_user_id_async,
+)
+from .state import STATE_STORE_URL
+
+MAX_CONCURRENT_REACTIONS = int(os.environ.get("MAX_CONCURRENT_REACTIONS", "4"))
+# How long the bot's own reactions are remembered, in seconds. Replicas sharing a
+# state store can't see each other's, so by default they always ask Slack instead
+BOT_REACTIONS_WINDOW = float(
+    os.environ.get(
+        "BOT_REACTIONS_WINDOW", "3600" if STATE_STORE_URL.startswith("memory:") else "0"
+    )
+)
+BOT_REACTIONS_SIZE = int(os.environ.get("BOT_REACTIONS_SIZE", "10000"))
+
+ReactionResult = namedtuple("ReactionResult", "name ok error")
+
+EXECUTOR = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_REACTIONS, thread_name_prefix="reactions"
+)
+
+
+class ReactionLog:
+    """The reactions the bot has added itself, for recent messages
+
+    Only messages posted within `window` seconds, and since this process started,
+    are covered: for those the log is a complete record, for anything else
+    `get` returns None and Slack has to be asked.
+
+    The log is kept in this process, so it's only complete when a single process
+    reacts for the bot. With no window, nothing is covered.
+    """
+
+    def __init__(self, window: float, maxsize: int):
+        self.window = window
+        self.maxsize = maxsize
+        self.started = time.time()
+        self._messages: "OrderedDict[Tuple[str, str], Set[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def covers(self, timestamp: str) -> bool:
+        return float(timestamp) > max(self.started, time.time() - self.window)
+
+    def _prune(self):
+        oldest = time.time() - self.window
+        while self._messages and (
+            len(self._messages) > self.maxsize
+            or float(next(iter(self._messages))[1]) < oldest
+        ):
+            _, timestamp = self._messages.popitem(last=False)[0]
+            # anything older than what we've dropped can't be trusted any more
+            self.started = max(self.started, float(timestamp))
+
+    def add(self, channel: str, timestamp: str, name: str):
+        if not self.covers(timestamp):
+            return
+        with self._lock:
+            self._messages.setdefault((channel, timestamp), set()).add(name)
+            self._prune()
+
+    def discard(self, channel: str, timestamp: str, name: str):
+        with self._lock:
+            self._messages.get((channel, timestamp), set()).discard(name)
+
+    def get(self, channel: str, timestamp: str) -> Optional[Set[str]]:
+        if not self.covers(timestamp):
+            return None
+        with self._lock:
+            return set(self._messages.get((channel, timestamp), set()))
+
+
+BOT_REACTIONS = ReactionLog(BOT_REACTIONS_WINDOW, BOT_REACTIONS_SIZE)
+
+
+def _unique_chains(chains: Iterable[Sequence[str]]) -> List[List[str]]:
+    """Drop reactions already requested by an earlier chain, and empty chains"""
+    seen = set()
+    unique = []
+    for chain in chains:
+        chain = [name for name in chain if name not in seen]
+        seen.update(chain)
+        if chain:
+            unique.append(chain)
+    return unique
+
+
+def _result(name: str, channel: str, timestamp: str, error: Optional[str] = None):
+    # already_reacted means the bot's reaction is there, so it still needs recording
+    if error in (None, "already_reacted"):
+        BOT_REACTIONS.add(channel, timestamp, name)
+    return ReactionResult(name, error is None, error)
+
+
+def _add_chain(
+    web_client: slack_sdk.WebClient, channel: str, timestamp: str, chain: List[str]
+) -> List[ReactionResult]:
+    results = []
+    for name in chain:
+        try:
+            web_client.reactions_add(channel=channel, timestamp=timestamp, name=name)
+            results.append(_result(name, channel, timestamp))
+        except slack_sdk.errors.SlackApiError as exception:
+            results.append(
+                _result(name, channel, timestamp, exception.response["error"])
+            )
+    return results
+
+
+async def _add_chain_async(
+    web_client: AsyncWebClient,
+    channel: str,
+    timestamp: str,
+    chain: List[str],
+    semaphore: asyncio.Semaphore,
+) -> List[ReactionResult]:
+    results = []
+    async with semaphore:
+        for name in chain:
+            try:
+                await web_client.reactions_add(
+                    channel=channel, timestamp=timestamp, name=name
+                )
+                results.append(_result(name, channel, timestamp))
+            except slack_sdk.errors.SlackApiError as exception:
+                results.append(
+                    _result(name, channel, timestamp, exception.response["error"])
+                )
+    return results
+
+
+def add_reactions(
+    web_client: slack_sdk.WebClient,
+    channel: str,
+    timestamp: str,
+    chains: Iterable[Sequence[str]],
+) -> List[ReactionResult]:
+    """Add every reaction a message should get
+
+    Each chain is added in order (e.g. `one` before `one-again`), while separate
+    chains are sent concurrently, at most MAX_CONCURRENT_REACTIONS at a time.
+    """
+    futures = [
+        EXECUTOR.submit(_add_chain, web_client, channel, timestamp, chain)
+        for chain in _unique_chains(chains)
+    ]
+    return [result for future in futures for result in future.result()]
+
+
+async def add_reactions_async(
+    web_client: AsyncWebClient,
+    channel: str,
+    timestamp: str,
+    chains: Iterable[Sequence[str]],
+) -> List[ReactionResult]:
+    """Add every reaction a message should get, see add_reactions"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REACTIONS)
+    chain_results = await asyncio.gather(
+        *(
+            _add_chain_async(web_client, channel, timestamp, chain, semaphore)
+            for chain in _unique_chains(chains)
+        )
+    )
+    return [result for results in chain_results for result in results]
+
+
+def _removed(item: Dict, name: str, error: Optional[str] = None) -> ReactionResult:
+    if error in (None, "no_reaction") and "channel" in item:
+        BOT_REACTIONS.discard(item["channel"], item["ts"], name)
+    return ReactionResult(name, error is None, error)
+
+
+def _remove(web_client: slack_sdk.WebClient, item: Dict, name: str):
+    reactions_item, _ = event_item_to_reactions_api(item)
+    try:
+        web_client.reactions_remove(name=name, **reactions_item)
+        return _removed(item, name)
+    except slack_sdk.errors.SlackApiError as exception:
+        return _removed(item, name, exception.response["error"])
+
+
+async def _remove_async(
+    web_client: AsyncWebClient, item: Dict, name: str, semaphore: asyncio.Semaphore
+):
+    reactions_item, _ = event_item_to_reactions_api(item)
+    async with semaphore:
+        try:
+            await web_client.reactions_remove(name=name, **reactions_item)
+            return _removed(item, name)
+        except slack_sdk.errors.SlackApiError as exception:
+            return _removed(item, name, exception.response["error"])
+
+
+def remove_reactions(
+    web_client: slack_sdk.WebClient, item: Dict, names: Iterable[str]
+) -> List[ReactionResult]:
+    """Remove the bot's reactions from an item, concurrently"""
+    futures = [EXECUTOR.submit(_remove, web_client, item, name) for name in names]
+    return [future.result() for future in futures]
+
+
+async def remove_reactions_async(
+    web_client: AsyncWebClient, item: Dict, names: Iterable[str]
+) -> List[ReactionResult]:
+    """Remove the bot's reactions from an item, see remove_reactions"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REACTIONS)
+    return list(
+        await asyncio.gather(
+            *(_remove_async(web_client, item, name, semaphore) for name in names)
+        )
+    )
+
+
+def _logged_bot_reactions(item: Dict) -> Optional[Set[str]]:
+    if item.get("type") != "message":
+        return None
+    return BOT_REACTIONS.get(item["channel"], item["ts"])
+
+
+def remove_bot_reactions(
+    web_client: slack_sdk.WebClient, item: Dict
+) -> List[ReactionResult]:
+    """Remove every reaction the bot added to an item (from a reaction event)
+
+    Recent messages are answered from BOT_REACTIONS; only older ones need a
+    reactions.get call to find the bot's reactions.
+    """
+    names = _logged_bot_reactions(item)
+    if names is None:
+        reactions_item, item_type = event_item_to_reactions_api(item)
+        bot_id = get_bot_user_id(web_client)
+        names = [
+            reaction.get("name")
+            for reaction in get_bot_reactions(
+                web_client, bot_id, item_type, reactions_item
+            )
+        ]
+
+    return remove_reactions(web_client, item, names)
+
+
+async def remove_bot_reactions_async(
+    web_client: AsyncWebClient, item: Dict
+) -> List[ReactionResult]:
+    """Remove every reaction the bot added to an item, see remove_bot_reactions"""
+    names = _logged_bot_reactions(item)
+    if names is None:
+        reactions_item, item_type = event_item_to_reactions_api(item)
+        bot_id = await get_bot_user_id_async(web_client)
+        names = [
+            reaction.get("name")
+            for reaction in await get_bot_reactions_async(
+                web_client, bot_id, item_type, reactions_item
+            )
+        ]
+
+    return await remove_reactions_async(web_client, item, names)
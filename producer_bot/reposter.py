@@ -1,10 +1,14 @@
 import re
 from collections import namedtuple
-from typing import Dict
+from typing import Dict, FrozenSet, Iterator, Optional, Tuple
 
 from slack_sdk import WebClient
+from slack_sdk.web.async_client import AsyncWebClient
 
-from .slack_helper import channel_name
+from .features import Message
+from .matcher import Matcher, rule_id
+from .ruleset import matcher_for, table_for
+from .slack_helper import channel_name, channel_name_async
 
 RepostablePhrase = namedtuple(
     "RepostablePhrase", "match channel description emoji ephemeral"
@@ -28,6 +32,13 @@ WATCH_EMOJIS: Dict[str, RepostablePhrase] = {
 EXCLUDE_CHANNEL_NAME = r"firehose$"
 
 
+def rules_for(phrases) -> Iterator[Tuple[str, str]]:
+    return ((rule_id(__name__, phrase.match), phrase.match) for phrase in phrases)
+
+
+MATCHER = Matcher(rules_for(REPOST_PHRASES))
+
+
 def repost(
     channel: str,
     timestamp: str,
@@ -52,25 +63,92 @@ def repost(
     ).data["permalink"]
 
 
-def trigger(channel: str, timestamp: str, user: str, text: str, web_client: WebClient):
-    name = channel_name(channel, web_client)
-    if re.search(EXCLUDE_CHANNEL_NAME, name):
-        return
+def reposts_for(
+    channel: str, text: str, matches: Optional[FrozenSet[str]] = None
+) -> Iterator[RepostablePhrase]:
+    if matches is None:
+        matches = matcher_for("reposter", MATCHER).match(text)
 
-    for phrase in REPOST_PHRASES:
+    for phrase in table_for("reposter", REPOST_PHRASES):
         if phrase.channel == channel:
             continue  # don't try and repost in the same channel
 
-        if re.search(phrase.match, text):
-            permalink = repost(channel, timestamp, phrase, web_client)
+        if rule_id(__name__, phrase.match) in matches:
+            yield phrase
+
+
+def repost_message(phrase: RepostablePhrase, user: str, permalink: str) -> str:
+    return (
+        f":{phrase.emoji}: hey <@{user}>, since your message was about *{phrase.description}*, "
+        f"I went ahead and <{permalink}|reposted it> to <#{phrase.channel}> for you."
+    )
+
+
+def on_message(message: Message):
+    channel = message.channel
+    web_client = message.web_client
+    name = channel_name(channel, web_client)
+    # DMs have no name
+    if not name or re.search(EXCLUDE_CHANNEL_NAME, name):
+        return
+
+    for phrase in reposts_for(channel, message.text, message.matches):
+        permalink = repost(channel, message.timestamp, phrase, web_client)
+
+        reply = repost_message(phrase, message.user, permalink)
+        if phrase.ephemeral:
+            web_client.chat_postEphemeral(
+                channel=channel, user=message.user, text=reply
+            )
+        else:
+            web_client.chat_postMessage(
+                channel=channel, thread_ts=message.timestamp, text=reply
+            )
+
+
+async def repost_async(
+    channel: str,
+    timestamp: str,
+    phrase: RepostablePhrase,
+    web_client: AsyncWebClient,
+):
+    permalink = (
+        await web_client.chat_getPermalink(channel=channel, message_ts=timestamp)
+    ).data["permalink"]
 
-            message = (
-                f":{phrase.emoji}: hey <@{user}>, since your message was about *{phrase.description}*, "
-                f"I went ahead and <{permalink}|reposted it> to <#{phrase.channel}> for you."
+    # Copy the message
+    posted_message = await web_client.chat_postMessage(
+        channel=phrase.channel,
+        text=f":{phrase.emoji}: {permalink}",
+        unfurl_links=True,
+    )
+
+    # Tell the poster about it
+    return (
+        await web_client.chat_getPermalink(
+            channel=posted_message.data["channel"],
+            message_ts=posted_message.data["ts"],
+        )
+    ).data["permalink"]
+
+
+async def on_message_async(message: Message):
+    channel = message.channel
+    web_client = message.web_client
+    name = await channel_name_async(channel, web_client)
+    # DMs have no name
+    if not name or re.search(EXCLUDE_CHANNEL_NAME, name):
+        return
+
+    for phrase in reposts_for(channel, message.text, message.matches):
+        permalink = await repost_async(channel, message.timestamp, phrase, web_client)
+
+        reply = repost_message(phrase, message.user, permalink)
+        if phrase.ephemeral:
+            await web_client.chat_postEphemeral(
+                channel=channel, user=message.user, text=reply
+            )
+        else:
+            await web_client.chat_postMessage(
+                channel=channel, thread_ts=message.timestamp, text=reply
             )
-            if phrase.ephemeral:
-                web_client.chat_postEphemeral(channel=channel, user=user, text=message)
-            else:
-                web_client.chat_postMessage(
-                    channel=channel, thread_ts=timestamp, text=message
-                )
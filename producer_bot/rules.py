@@ -0,0 +1,274 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import tomllib
+from collections import Counter
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from . import corrector, parrot, reposter, ruleset, triggered_reactions
+from .corrector import CorrectablePhrase
+from .matcher import Matcher
+from .reposter import RepostablePhrase
+from .ruleset import RuleSet
+
+try:
+    import yaml
+except ImportError:
+    # PyYAML is optional, only needed for a YAML rule file
+    yaml = None
+
+LOGGER = logging.getLogger(__name__)
+
+# A JSON, TOML or YAML file of rule tables, replacing the built-in ones
+RULES_FILE = os.environ.get("RULES_FILE", "")
+# How often (in seconds) the rule file is checked for changes
+RULES_CHECK_INTERVAL = float(os.environ.get("RULES_CHECK_INTERVAL", "30"))
+
+
+class RuleError(ValueError):
+    """A rule file which can't be used"""
+
+
+# The matcher joins every rule into one pattern, which renumbers their groups, so
+# rules can't refer back to a group, name one, or set flags for the whole pattern.
+# Escaped backslashes are matched too, only so that they're skipped.
+UNCOMBINABLE = re.compile(r"\\\\|(\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\))")
+
+
+def _pattern(entry: Dict, where: str) -> str:
+    pattern = _string(entry, "match", where)
+    try:
+        re.compile(pattern)
+    except re.error as exception:
+        raise RuleError(f"{where}: can't compile {pattern!r}: {exception}") from None
+    for found in UNCOMBINABLE.finditer(pattern):
+        if found.group(1):
+            raise RuleError(
+                f"{where}: {pattern!r} can't use {found.group(1)!r}, as the rules are"
+                " matched together"
+            )
+    return pattern
+
+
+def _string(entry: Dict, field: str, where: str) -> str:
+    value = entry.get(field)
+    if not isinstance(value, str) or not value:
+        raise RuleError(f"{where}: {field} must be a string")
+    return value
+
+
+def _flag(entry: Dict, field: str, where: str) -> bool:
+    value = entry.get(field, False)
+    if not isinstance(value, bool):
+        raise RuleError(f"{where}: {field} must be true or false")
+    return value
+
+
+def _entries(section: str, entries: Any) -> Iterable[Tuple[str, Dict]]:
+    if not isinstance(entries, list) or not all(
+        isinstance(entry, dict) for entry in entries
+    ):
+        raise RuleError(f"{section} must be a list of rules")
+    return ((f"{section}[{number}]", entry) for number, entry in enumerate(entries))
+
+
+def parse_phrases(entries: Any) -> List[Tuple[str, Any]]:
+    """e.g. [{"match": "pizza", "emoji": "pineapple"}], emoji may be a list"""
+    phrases = []
+    for where, entry in _entries("triggered_reactions", entries):
+        emoji = entry.get("emoji")
+        if not (
+            isinstance(emoji, str)
+            or (
+                isinstance(emoji, list)
+                and emoji
+                and all(isinstance(name, str) for name in emoji)
+            )
+        ):
+            raise RuleError(f"{where}: emoji must be a string or a list of them")
+        phrases.append((_pattern(entry, where), emoji))
+    return phrases
+
+
+def parse_corrections(entries: Any) -> FrozenSet[CorrectablePhrase]:
+    return frozenset(
+        CorrectablePhrase(
+            match=_pattern(entry, where),
+            message=_string(entry, "message", where),
+            emoji=_string(entry, "emoji", where),
+            name=_string(entry, "name", where),
+            ephemeral=_flag(entry, "ephemeral", where),
+        )
+        for where, entry in _entries("corrector", entries)
+    )
+
+
+def parse_reposts(entries: Any) -> FrozenSet[RepostablePhrase]:
+    return frozenset(
+        RepostablePhrase(
+            match=_pattern(entry, where),
+            channel=_string(entry, "channel", where),
+            description=_string(entry, "description", where),
+            emoji=_string(entry, "emoji", where),
+            ephemeral=_flag(entry, "ephemeral", where),
+        )
+        for where, entry in _entries("reposter", entries)
+    )
+
+
+def parse_emoji_chances(entries: Any) -> Dict[str, float]:
+    """e.g. {"rip": 1, "wave": 0.1}"""
+    if not isinstance(entries, dict):
+        raise RuleError("parrot must map emoji to the chance they start parroting")
+    for emoji, chance in entries.items():
+        if not isinstance(chance, (int, float)) or not 0 <= chance <= 1:
+            raise RuleError(f"parrot.{emoji}: chance must be between 0 and 1")
+    return {emoji: float(chance) for emoji, chance in entries.items()}
+
+
+@dataclass(frozen=True)
+class Table:
+    """A plugin's rule table, and how to read it from the rule file"""
+
+    module: Any  # the plugin module, with rules_for
+    parse: Callable[[Any], Any]
+    default: Any  # the built-in table, for when the file leaves it out
+
+
+# JSON and TOML decoding errors are ValueErrors
+DECODE_ERRORS = (ValueError,) if yaml is None else (ValueError, yaml.YAMLError)
+
+# Sections of the rule file, by plugin
+TABLES = {
+    "triggered_reactions": Table(
+        triggered_reactions, parse_phrases, triggered_reactions.PHRASES
+    ),
+    "corrector": Table(corrector, parse_corrections, corrector.CORRECT_PHRASES),
+    "reposter": Table(reposter, parse_reposts, reposter.REPOST_PHRASES),
+    "parrot": Table(parrot, parse_emoji_chances, parrot.TRIGGERED_EMOJI),
+}
+
+
+def _decode(extension: str, rule_file) -> Any:
+    if extension == ".json":
+        return json.load(rule_file)
+    if extension == ".toml":
+        return tomllib.load(rule_file)
+    if extension in (".yaml", ".yml"):
+        if yaml is None:
+            raise RuleError("PyYAML isn't installed, so YAML can't be read")
+        return yaml.safe_load(rule_file)
+    raise RuleError(f"Unknown rule file type {extension!r}")
+
+
+def read_rule_file(path: str) -> Dict[str, Any]:
+    """The rule tables in a file, by the plugin they're for"""
+    with open(path, "rb") as rule_file:
+        try:
+            data = _decode(os.path.splitext(path)[1].lower(), rule_file)
+        except RuleError:
+            raise
+        except DECODE_ERRORS as exception:
+            raise RuleError(f"Can't parse {path}: {exception}") from None
+
+    if not isinstance(data, dict):
+        raise RuleError(f"{path} must map plugin names to their rules")
+    unknown = set(data) - set(TABLES)
+    if unknown:
+        raise RuleError(f"Unknown rule tables: {', '.join(sorted(unknown))}")
+    return data
+
+
+class RuleReloader:
+    """Loads the rule tables from a file, and swaps them in whenever it changes
+
+    Everything is parsed, checked and compiled into a new RuleSet, which is then
+    published with a single assignment, so a file with a bad rule is rejected and
+    the current rules keep working, and no event sees a mix of old and new rules.
+    Tables left out of the file go back to the built-in ones.
+    """
+
+    def __init__(
+        self, plugins: Iterable[Any], matcher: Matcher, router, path: str = RULES_FILE
+    ):
+        self.plugins = list(plugins)
+        self.matcher = matcher
+        self.router = router
+        self.path = path
+        self.stats: Counter = Counter()
+        self._mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _compile(self, data: Dict[str, Any]) -> RuleSet:
+        tables = {
+            name: table.parse(data[name]) if name in data else table.default
+            for name, table in TABLES.items()
+        }
+        try:
+            matchers = {
+                name: Matcher(table.module.rules_for(tables[name]))
+                for name, table in TABLES.items()
+            }
+            # every enabled plugin's rules, as the bot scans messages for them
+            combined = Matcher(
+                rule
+                for plugin in self.plugins
+                for rule in matchers.get(plugin.name, plugin.matcher).rules
+            )
+        except re.error as exception:
+            raise RuleError(f"Can't compile the rules together: {exception}") from None
+        combined.profile = self.matcher.profile
+        return RuleSet(
+            tables=MappingProxyType(tables),
+            matchers=MappingProxyType(matchers),
+            matcher=combined,
+        )
+
+    def reload(self) -> str:
+        """Load the rule file, returning what happened"""
+        if not self.path:
+            return "There's no RULES_FILE to load rules from"
+
+        with self._lock:
+            try:
+                self._mtime = os.stat(self.path).st_mtime_ns
+                rules = self._compile(read_rule_file(self.path))
+            except (OSError, RuleError) as exception:
+                self.stats["rejected"] += 1
+                message = (
+                    f"Kept the current rules, {self.path} was rejected: {exception}"
+                )
+                LOGGER.error(message)
+                return message
+
+            ruleset.LOADED = rules
+            self.router.refresh()
+            self.stats["loaded"] += 1
+
+        message = f"Loaded {len(rules.matcher.rules)} rules from {self.path}"
+        LOGGER.info(message)
+        return message
+
+    def changed(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime_ns != self._mtime
+        except OSError:
+            return False
+
+    def watch(self, interval: float = RULES_CHECK_INTERVAL):
+        """Load the rule file now, then again whenever it changes"""
+        self.reload()
+        threading.Thread(
+            target=self._watch, args=(interval,), name="rules", daemon=True
+        ).start()
+
+    def _watch(self, interval: float):
+        while True:
+            time.sleep(interval)
+            if self.changed():
+                self.reload()
@@ -0,0 +1,39 @@
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional
+
+from .matcher import Matcher
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    """Rules loaded from a file: each plugin's table and matcher, and all of them
+
+    A reload builds a whole new RuleSet and publishes it with one assignment, so
+    nothing ever sees some plugins' new rules alongside others' old ones.
+    """
+
+    tables: Mapping[str, Any]  # by plugin name
+    matchers: Mapping[str, Matcher]  # by plugin name
+    matcher: Matcher  # every enabled plugin's rules, as the bot scans messages
+
+
+# None until a rule file is loaded, so every plugin has its built-in rules
+LOADED: Optional[RuleSet] = None
+
+
+def table_for(plugin: str, default: Any) -> Any:
+    """A plugin's rule table, `default` being its built-in one"""
+    rules = LOADED
+    return default if rules is None else rules.tables.get(plugin, default)
+
+
+def matcher_for(plugin: str, default: Matcher) -> Matcher:
+    """A plugin's matcher, for the rule table it's using"""
+    rules = LOADED
+    return default if rules is None else rules.matchers.get(plugin, default)
+
+
+def combined(default: Matcher) -> Matcher:
+    """Every enabled plugin's rules together"""
+    rules = LOADED
+    return default if rules is None else rules.matcher
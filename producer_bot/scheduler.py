@@ -0,0 +1,323 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import slack_sdk
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_IN_FLIGHT = int(os.environ.get("SLACK_MAX_IN_FLIGHT", "10"))
+MAX_RETRIES = int(os.environ.get("SLACK_MAX_RETRIES", "3"))
+
+INTERACTIVE = 0
+LOOKUP = 1
+COSMETIC = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", LOOKUP: "lookup", COSMETIC: "cosmetic"}
+
+# Requests per minute, from https://api.slack.com/docs/rate-limits
+TIER_1 = 1
+TIER_2 = 20
+TIER_3 = 50
+TIER_4 = 100
+
+METHOD_LIMITS = {
+    "auth.test": TIER_4,
+    "chat.getPermalink": TIER_4,
+    "chat.postEphemeral": TIER_4,
+    "chat.postMessage": 60,  # roughly one message per second, per channel
+    "conversations.info": TIER_3,
+    "conversations.invite": TIER_3,
+    "conversations.list": TIER_2,
+    "files.upload": TIER_2,
+    "reactions.add": TIER_3,
+    "reactions.get": TIER_3,
+    "reactions.remove": TIER_2,
+    "rtm.connect": TIER_1,
+    "users.info": TIER_4,
+    "users.list": TIER_2,
+}
+DEFAULT_LIMIT = TIER_3
+
+# Limits which Slack applies per channel, rather than per workspace
+PER_CHANNEL_METHODS = {"chat.postMessage"}
+
+METHOD_PRIORITIES = {
+    "chat.postEphemeral": INTERACTIVE,
+    "chat.postMessage": INTERACTIVE,
+    "files.upload": INTERACTIVE,
+    "reactions.add": COSMETIC,
+    "reactions.remove": COSMETIC,
+}
+DEFAULT_PRIORITY = LOOKUP
+
+MAX_BUCKETS = 1000
+
+
+class TokenBucket:
+    """Allows `rate` requests per minute, with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate / 60
+        self.capacity = capacity or max(1.0, rate / 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        """Take a token, or return how long to wait before trying again"""
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, now: float, seconds: float):
+        """Slack asked us to back off (Retry-After)"""
+        self.paused_until = max(self.paused_until, now + seconds)
+        # allow a single request as soon as the pause is over
+        self.tokens = 1.0
+        self.updated = self.paused_until
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+@dataclass
+class SchedulerStats:
+    """Counters for outbound requests"""
+
+    requests: int = 0
+    rate_limited: int = 0
+    failed: int = 0
+    in_flight: int = 0
+    queued: Dict[str, int] = field(
+        default_factory=lambda: {name: 0 for name in PRIORITY_NAMES.values()}
+    )
+    wait_seconds: Dict[str, float] = field(
+        default_factory=lambda: {name: 0.0 for name in PRIORITY_NAMES.values()}
+    )
+    max_wait_seconds: Dict[str, float] = field(
+        default_factory=lambda: {name: 0.0 for name in PRIORITY_NAMES.values()}
+    )
+
+
+def retry_after(exception: slack_sdk.errors.SlackApiError) -> Optional[float]:
+    """Seconds to wait if the error was a rate limit, otherwise None"""
+    if exception.response.status_code != 429:
+        return None
+    return float(exception.response.headers.get("Retry-After", 1))
+
+
+def request_channel(kwargs: Dict) -> Optional[str]:
+    for arg in ("params", "json", "data"):
+        if isinstance(kwargs.get(arg), dict) and "channel" in kwargs[arg]:
+            return kwargs[arg]["channel"]
+    return None
+
+
+class OutboundScheduler:  # pylint: disable=too-many-instance-attributes
+    """Paces outbound Slack API calls to stay within Slack's rate limits
+
+    Each method (or method and channel, for chat.postMessage) has a token bucket
+    sized to its rate-limit tier. Calls wait for a token rather than failing, and a
+    429 pauses the method's bucket for Retry-After before the call is retried.
+
+    At most `max_in_flight` calls run at once; when calls are queued for a slot,
+    interactive replies go before lookups, and lookups before cosmetic reactions,
+    whether they're blocking or async calls.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        limits: Optional[Dict[str, float]] = None,
+        default_limit: float = DEFAULT_LIMIT,
+    ):
+        self.max_in_flight = max_in_flight
+        self.limits = METHOD_LIMITS if limits is None else limits
+        self.default_limit = default_limit
+        self.stats = SchedulerStats()
+        self._buckets: Dict[Any, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._slots = threading.Condition(self._lock)
+        self._waiters: List = []
+        self._sequence = itertools.count()
+
+    def _bucket(self, method: str, channel: Optional[str]) -> TokenBucket:
+        key = (method, channel) if method in PER_CHANNEL_METHODS else method
+        if key not in self._buckets:
+            if len(self._buckets) >= MAX_BUCKETS:
+                now = time.monotonic()
+                for idle_key in [k for k, b in self._buckets.items() if b.is_idle(now)]:
+                    del self._buckets[idle_key]
+            self._buckets[key] = TokenBucket(
+                self.limits.get(method, self.default_limit)
+            )
+        return self._buckets[key]
+
+    def _reserve(self, method: str, channel: Optional[str]) -> float:
+        with self._lock:
+            return self._bucket(method, channel).reserve(time.monotonic())
+
+    def _pause(self, method: str, channel: Optional[str], seconds: float):
+        with self._lock:
+            self.stats.rate_limited += 1
+            self._bucket(method, channel).pause(time.monotonic(), seconds)
+        LOGGER.warning(f"Rate limited on {method}, retrying in {seconds}s")
+
+    def _queue(self, priority: int):
+        with self._lock:
+            self.stats.queued[PRIORITY_NAMES[priority]] += 1
+
+    def _dequeue(self, priority: int, waited: float):
+        name = PRIORITY_NAMES[priority]
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.queued[name] -= 1
+            self.stats.wait_seconds[name] += waited
+            self.stats.max_wait_seconds[name] = max(
+                self.stats.max_wait_seconds[name], waited
+            )
+
+    def _waiter(self, priority: int, future=None, loop=None) -> Optional[List]:
+        """Take a slot, or queue for one, returning the queued waiter"""
+        # sync and async callers queue together, so priorities hold across both
+        if self.stats.in_flight < self.max_in_flight and not self._waiters:
+            self.stats.in_flight += 1
+            return None
+        # [priority, sequence, future, loop, granted a slot]; no future if blocking
+        waiter = [priority, next(self._sequence), future, loop, False]
+        heapq.heappush(self._waiters, waiter)
+        return waiter
+
+    def _grant(self):
+        """Hand free slots to the waiters first in line (with the lock held)"""
+        while self._waiters and self.stats.in_flight < self.max_in_flight:
+            waiter = heapq.heappop(self._waiters)
+            waiter[4] = True
+            self.stats.in_flight += 1
+            if waiter[2] is None:
+                self._slots.notify_all()
+            else:
+                waiter[3].call_soon_threadsafe(_resolve, waiter[2])
+
+    def _acquire_slot(self, priority: int):
+        with self._slots:
+            waiter = self._waiter(priority)
+            while waiter is not None and not waiter[4]:
+                self._slots.wait()
+
+    def _release_slot(self):
+        with self._slots:
+            self.stats.in_flight -= 1
+            self._grant()
+
+    async def _acquire_slot_async(self, priority: int):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            waiter = self._waiter(priority, future, loop)
+        if waiter is None:
+            return
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter[4]:
+                    # handed a slot after all, give it back
+                    self.stats.in_flight -= 1
+                    self._grant()
+                else:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+            raise
+
+    def call(self, method: str, request: Callable[[], Any], kwargs: Dict) -> Any:
+        """Make a blocking API call once the rate limits allow it"""
+        channel = request_channel(kwargs)
+        priority = METHOD_PRIORITIES.get(method, DEFAULT_PRIORITY)
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            self._queue(priority)
+            try:
+                while (delay := self._reserve(method, channel)) > 0:
+                    time.sleep(delay)
+                self._acquire_slot(priority)
+            finally:
+                self._dequeue(priority, time.monotonic() - started)
+
+            try:
+                return request()
+            except slack_sdk.errors.SlackApiError as exception:
+                wait = retry_after(exception)
+                if wait is None or attempt >= MAX_RETRIES:
+                    self.stats.failed += 1
+                    raise
+                self._pause(method, channel, wait)
+                attempt += 1
+            finally:
+                self._release_slot()
+
+    async def call_async(
+        self, method: str, request: Callable[[], Awaitable], kwargs: Dict
+    ) -> Any:
+        """Make an API call once the rate limits allow it"""
+        channel = request_channel(kwargs)
+        priority = METHOD_PRIORITIES.get(method, DEFAULT_PRIORITY)
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            self._queue(priority)
+            try:
+                while (delay := self._reserve(method, channel)) > 0:
+                    await asyncio.sleep(delay)
+                await self._acquire_slot_async(priority)
+            finally:
+                self._dequeue(priority, time.monotonic() - started)
+
+            try:
+                return await request()
+            except slack_sdk.errors.SlackApiError as exception:
+                wait = retry_after(exception)
+                if wait is None or attempt >= MAX_RETRIES:
+                    self.stats.failed += 1
+                    raise
+                self._pause(method, channel, wait)
+                attempt += 1
+            finally:
+                self._release_slot()
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+SCHEDULERS: Dict[str, OutboundScheduler] = {}
+# so threads asking at once for a new token's scheduler share the same one
+SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_scheduler(token: str) -> OutboundScheduler:
+    """Slack's limits are per workspace and app, so share a scheduler per token"""
+    with SCHEDULERS_LOCK:
+        if token not in SCHEDULERS:
+            SCHEDULERS[token] = OutboundScheduler()
+        return SCHEDULERS[token]
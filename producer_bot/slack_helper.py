@@ -1,10 +1,29 @@
+import json
+import os
 from copy import deepcopy
-from functools import lru_cache
-from typing import Dict
+from typing import Dict, Optional
 
 import slack_sdk
-
-from .helpers import BlackBox
+from slack_sdk.web.async_client import AsyncWebClient
+
+from .cache import CacheRegistry, CacheSpec, CacheStats, TTLCache
+
+CACHES = CacheRegistry(
+    {
+        "users": CacheSpec(
+            maxsize=int(os.environ.get("USER_CACHE_SIZE", "5000")),
+            ttl=float(os.environ.get("USER_CACHE_TTL", "3600")),
+        ),
+        "channels": CacheSpec(
+            maxsize=int(os.environ.get("CHANNEL_CACHE_SIZE", "2000")),
+            ttl=float(os.environ.get("CHANNEL_CACHE_TTL", "3600")),
+        ),
+    }
+)
+# JSON limits for particular workspaces, e.g. {"T0123": {"users": {"maxsize": 20000}}}
+CACHES.configure(json.loads(os.environ.get("TEAM_CACHE_LIMITS", "") or "{}"))
+# auth.test results per token: which user and workspace a client acts as
+AUTH_CACHE = TTLCache("auth", maxsize=16, ttl=86400)
 
 
 def event_item_to_reactions_api(item: Dict) -> Dict:
@@ -15,8 +34,17 @@ def event_item_to_reactions_api(item: Dict) -> Dict:
     return reaction, item_type
 
 
+def auth(web_client: slack_sdk.WebClient) -> Dict:
+    return AUTH_CACHE.get_or_load(web_client.token, lambda: web_client.auth_test().data)
+
+
+def caches_for(web_client: slack_sdk.WebClient) -> Dict[str, TTLCache]:
+    """The caches of the workspace the client belongs to"""
+    return CACHES.for_team(auth(web_client).get("team_id"))
+
+
 def get_bot_user_id(web_client: slack_sdk.WebClient) -> str:
-    return __cached_get_bot_user_id(BlackBox(web_client))
+    return auth(web_client).get("user_id")
 
 
 def is_user_a_bot(web_client: slack_sdk.WebClient, user: str) -> bool:
@@ -24,7 +52,7 @@ def is_user_a_bot(web_client: slack_sdk.WebClient, user: str) -> bool:
         # Slackbot doesn't look like a bot in the API for some reason
         return True
 
-    user_info = __cached_get_users_info(user, BlackBox(web_client))
+    user_info = __cached_get_users_info(user, web_client)
 
     return user_info.get("is_bot", False)
 
@@ -34,40 +62,68 @@ def user_display_name(web_client: slack_sdk.WebClient, user: str) -> str:
         # Slackbot doesn't look like a bot in the API for some reason
         return "Slackbot"
 
-    user_info = __cached_get_users_info(user, BlackBox(web_client))
+    user_info = __cached_get_users_info(user, web_client)
 
     return user_info.get("profile", {}).get("display_name", "unknown")
 
 
-def is_channel_private(channel: str, web_client: slack_sdk.WebClient) -> bool:
-    return __cached_conversations_info(channel, BlackBox(web_client)).get(
-        "is_private", True
+def cached_user_display_name(web_client, user: str) -> Optional[str]:
+    """A user's display name if it's already cached, without ever calling Slack"""
+    if user == "USLACKBOT":
+        return "Slackbot"
+
+    auth_info = AUTH_CACHE.peek(web_client.token, None)
+    user_info = (
+        None
+        if auth_info is None
+        else CACHES.for_team(auth_info.get("team_id"))["users"].peek(user, None)
     )
+    if user_info is None:
+        return None
+
+    return user_info.get("profile", {}).get("display_name", "unknown")
+
+
+def is_channel_private(channel: str, web_client: slack_sdk.WebClient) -> bool:
+    return __cached_conversations_info(channel, web_client).get("is_private", True)
 
 
 def is_channel_im(channel: str, web_client: slack_sdk.WebClient) -> bool:
-    return __cached_conversations_info(channel, BlackBox(web_client)).get(
-        "is_im", False
-    )
+    return __cached_conversations_info(channel, web_client).get("is_im", False)
 
 
 def channel_name(channel: str, web_client: slack_sdk.WebClient) -> bool:
-    return __cached_conversations_info(channel, BlackBox(web_client)).get("name", False)
+    return __cached_conversations_info(channel, web_client).get("name", False)
 
 
-@lru_cache(maxsize=None)
-def __cached_get_bot_user_id(web_client: BlackBox) -> str:
-    return web_client.contents.auth_test().get("user_id")
+def __cached_conversations_info(channel: str, web_client: slack_sdk.WebClient):
+    return caches_for(web_client)["channels"].get_or_load(
+        channel,
+        lambda: web_client.conversations_info(channel=channel).get("channel", {}),
+    )
 
 
-@lru_cache(maxsize=None)
-def __cached_conversations_info(channel: str, web_client: BlackBox):
-    return web_client.contents.conversations_info(channel=channel).get("channel", {})
+def __cached_get_users_info(user: str, web_client: slack_sdk.WebClient):
+    return caches_for(web_client)["users"].get_or_load(
+        user, lambda: web_client.users_info(user=user).get("user", {})
+    )
 
 
-@lru_cache(maxsize=None)
-def __cached_get_users_info(user: str, web_client: BlackBox):
-    return web_client.contents.users_info(user=user).get("user", {})
+def update_user(web_client: slack_sdk.WebClient, user_info: Dict):
+    """Replace a cached user with a fresh copy, e.g. from a user_change event"""
+    caches_for(web_client)["users"].set(user_info["id"], user_info)
+
+
+def invalidate_user(web_client: slack_sdk.WebClient, user: str):
+    caches_for(web_client)["users"].invalidate(user)
+
+
+def invalidate_channel(web_client: slack_sdk.WebClient, channel: str):
+    caches_for(web_client)["channels"].invalidate(channel)
+
+
+def cache_stats() -> Dict[str, Dict[str, CacheStats]]:
+    return {**CACHES.stats(), "*": {AUTH_CACHE.name: AUTH_CACHE.stats}}
 
 
 def get_bot_reactions(
@@ -78,3 +134,77 @@ def get_bot_reactions(
     reactions = reaction_response.get(item_type).get("reactions")
 
     return filter(lambda reaction: bot_user_id in reaction.get("users", []), reactions)
+
+
+async def auth_async(web_client: AsyncWebClient) -> Dict:
+    async def load():
+        return (await web_client.auth_test()).data
+
+    return await AUTH_CACHE.get_or_load_async(web_client.token, load)
+
+
+async def caches_for_async(web_client: AsyncWebClient) -> Dict[str, TTLCache]:
+    """The caches of the workspace the client belongs to"""
+    return CACHES.for_team((await auth_async(web_client)).get("team_id"))
+
+
+async def get_bot_user_id_async(web_client: AsyncWebClient) -> str:
+    return (await auth_async(web_client)).get("user_id")
+
+
+async def is_user_a_bot_async(web_client: AsyncWebClient, user: str) -> bool:
+    if user == "USLACKBOT":
+        # Slackbot doesn't look like a bot in the API for some reason
+        return True
+
+    user_info = await __async_cached_get_users_info(user, web_client)
+
+    return user_info.get("is_bot", False)
+
+
+async def user_display_name_async(web_client: AsyncWebClient, user: str) -> str:
+    if user == "USLACKBOT":
+        # Slackbot doesn't look like a bot in the API for some reason
+        return "Slackbot"
+
+    user_info = await __async_cached_get_users_info(user, web_client)
+
+    return user_info.get("profile", {}).get("display_name", "unknown")
+
+
+async def is_channel_im_async(channel: str, web_client: AsyncWebClient) -> bool:
+    channel_info = await __async_cached_conversations_info(channel, web_client)
+
+    return channel_info.get("is_im", False)
+
+
+async def channel_name_async(channel: str, web_client: AsyncWebClient) -> str:
+    channel_info = await __async_cached_conversations_info(channel, web_client)
+
+    return channel_info.get("name", False)
+
+
+async def __async_cached_conversations_info(channel: str, web_client: AsyncWebClient):
+    async def load():
+        return (await web_client.conversations_info(channel=channel)).get("channel", {})
+
+    caches = await caches_for_async(web_client)
+    return await caches["channels"].get_or_load_async(channel, load)
+
+
+async def __async_cached_get_users_info(user: str, web_client: AsyncWebClient):
+    async def load():
+        return (await web_client.users_info(user=user)).get("user", {})
+
+    caches = await caches_for_async(web_client)
+    return await caches["users"].get_or_load_async(user, load)
+
+
+async def get_bot_reactions_async(
+    web_client: AsyncWebClient, bot_user_id: str, item_type: str, item: Dict
+):
+    reaction_response = await web_client.reactions_get(**item)
+
+    reactions = reaction_response.get(item_type).get("reactions")
+
+    return filter(lambda reaction: bot_user_id in reaction.get("users", []), reactions)
@@ -0,0 +1,226 @@
+import logging
+import os
+import sqlite3
+import threading
+import urllib.parse
+from typing import Dict, Optional
+
+try:
+    import redis
+except ImportError:
+    # redis is optional, only needed for a redis:// state store
+    redis = None
+
+LOGGER = logging.getLogger(__name__)
+
+# e.g. "memory://", "sqlite:///state.db" or "redis://localhost:6379/0"
+STATE_STORE_URL = os.environ.get("STATE_STORE_URL", "memory://")
+SQLITE_TIMEOUT = 5.0
+
+# Sets KEYS[1] to ARGV[4] (or deletes it, when ARGV[3] is "1") only if it's
+# currently ARGV[2] (or missing, when ARGV[1] is "1")
+COMPARE_AND_SET_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+local matches
+if ARGV[1] == '1' then
+    matches = current == false
+else
+    matches = current == ARGV[2]
+end
+if matches then
+    if ARGV[3] == '1' then
+        redis.call('DEL', KEYS[1])
+    else
+        redis.call('SET', KEYS[1], ARGV[4])
+    end
+    return 1
+end
+return 0
+"""
+
+
+class MemoryStore:
+    """State kept in this process, and lost when it stops
+
+    Every state store has the same methods. `compare_and_set` and `incr` are
+    atomic, so state shared between processes stays consistent; a value of
+    None means the key doesn't exist.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        return self._values.get(key)
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._values[key] = value
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def compare_and_set(
+        self, key: str, expected: Optional[str], value: Optional[str]
+    ) -> bool:
+        """Set (or, given None, delete) a key only if it's still `expected`"""
+        with self._lock:
+            if self._values.get(key) != expected:
+                return False
+            if value is None:
+                self._values.pop(key, None)
+            else:
+                self._values[key] = value
+            return True
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        """Add to a counter, which starts at 0, and return its new value"""
+        with self._lock:
+            value = int(self._values.get(key, 0)) + amount
+            self._values[key] = str(value)
+            return value
+
+    def scan(self, prefix: str) -> Dict[str, str]:
+        """Every key starting with a prefix, and its value"""
+        with self._lock:
+            return {
+                key: value
+                for key, value in self._values.items()
+                if key.startswith(prefix)
+            }
+
+
+class SQLiteStore:
+    """State in a SQLite database, shared by every process on the machine"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # autocommit, with explicit transactions where they're needed
+        self._connection = sqlite3.connect(
+            path, timeout=SQLITE_TIMEOUT, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT value FROM state WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _set(self, key: str, value: Optional[str]):
+        if value is None:
+            self._connection.execute("DELETE FROM state WHERE key = ?", (key,))
+        else:
+            self._connection.execute(
+                "INSERT INTO state (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._set(key, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._set(key, None)
+
+    def compare_and_set(
+        self, key: str, expected: Optional[str], value: Optional[str]
+    ) -> bool:
+        with self._lock, self._connection:
+            # take the write lock up front, so no other process can change the key
+            self._connection.execute("BEGIN IMMEDIATE")
+            if self._get(key) != expected:
+                return False
+            self._set(key, value)
+            return True
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            value = int(self._get(key) or 0) + amount
+            self._set(key, str(value))
+            return value
+
+    def scan(self, prefix: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(
+                self._connection.execute(
+                    "SELECT key, value FROM state WHERE substr(key, 1, ?) = ?",
+                    (len(prefix), prefix),
+                )
+            )
+
+
+class RedisStore:
+    """State in Redis, or anything which speaks its protocol, shared by replicas"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._compare_and_set = self._client.register_script(COMPARE_AND_SET_SCRIPT)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: str):
+        self._client.set(key, value)
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+    def compare_and_set(
+        self, key: str, expected: Optional[str], value: Optional[str]
+    ) -> bool:
+        return bool(
+            self._compare_and_set(
+                keys=[key],
+                args=[
+                    "1" if expected is None else "0",
+                    expected or "",
+                    "1" if value is None else "0",
+                    value or "",
+                ],
+            )
+        )
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return self._client.incrby(key, amount)
+
+    def scan(self, prefix: str) -> Dict[str, str]:
+        # our prefixes have no glob characters to escape
+        keys = list(self._client.scan_iter(match=f"{prefix}*"))
+        if not keys:
+            return {}
+        values = self._client.mget(keys)
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+
+def state_store(url: str = STATE_STORE_URL):
+    """The state store for a URL, see STATE_STORE_URL"""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme == "sqlite":
+        # sqlite:///relative.db, or sqlite:////absolute/path.db
+        path = parsed.path[1:] if parsed.path.startswith("/") else parsed.path
+        return SQLiteStore(path)
+    if parsed.scheme in ("redis", "rediss", "unix"):
+        if redis is None:
+            # state kept in memory wouldn't be shared, which replicas rely on
+            raise RuntimeError(f"redis isn't installed, so {url!r} can't be used")
+        return RedisStore(url)
+    if parsed.scheme != "memory":
+        LOGGER.warning(f"Unknown state store {url!r}, keeping state in memory")
+    return MemoryStore()
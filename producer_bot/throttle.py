@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, FrozenSet, Hashable, Iterable
+
+# Seconds before a rule can fire again: anywhere, in the same channel, and for
+# the same user. 0 turns that cooldown off.
+THROTTLE_RULE_COOLDOWN = float(os.environ.get("THROTTLE_RULE_COOLDOWN", "0"))
+THROTTLE_CHANNEL_COOLDOWN = float(os.environ.get("THROTTLE_CHANNEL_COOLDOWN", "0"))
+THROTTLE_USER_COOLDOWN = float(os.environ.get("THROTTLE_USER_COOLDOWN", "0"))
+
+
+class Cooldown:
+    """When each key last fired, forgetting any which have cooled down
+
+    Every key waits the same time, so they cool down in the order they fired
+    and only the oldest ever need checking.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._fired: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._fired)
+
+    def expire(self, now: float):
+        while self._fired:
+            key, fired = next(iter(self._fired.items()))
+            if now - fired < self.seconds:
+                return
+            del self._fired[key]
+
+    def cooling(self, key: Hashable) -> bool:
+        return key in self._fired
+
+    def fire(self, key: Hashable, now: float):
+        if self.seconds > 0:
+            self._fired[key] = now
+            self._fired.move_to_end(key)
+
+    def remaining(self, now: float) -> Dict[Hashable, float]:
+        """Seconds until each key can fire again"""
+        return {key: self.seconds - (now - fired) for key, fired in self._fired.items()}
+
+
+class Throttle:
+    """Cooldowns for trigger rules, per rule, per channel and per user
+
+    A rule which fired recently (in the channel, or for the user) is left out of
+    a message's matches, so nothing is posted or reacted for it, and counted.
+    """
+
+    def __init__(
+        self,
+        rule: float = THROTTLE_RULE_COOLDOWN,
+        channel: float = THROTTLE_CHANNEL_COOLDOWN,
+        user: float = THROTTLE_USER_COOLDOWN,
+    ):
+        self.cooldowns = {
+            "rule": Cooldown(rule),
+            "channel": Cooldown(channel),
+            "user": Cooldown(user),
+        }
+        # triggers left out, by rule
+        self.suppressed: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(rule_id: str, channel: str, user: str) -> Dict[str, Hashable]:
+        return {"rule": rule_id, "channel": (rule_id, channel), "user": (rule_id, user)}
+
+    def allow(self, rule_ids: Iterable[str], channel: str, user: str) -> FrozenSet[str]:
+        """The rules which can fire, starting their cooldowns"""
+        now = time.monotonic()
+        allowed = set()
+        with self._lock:
+            for cooldown in self.cooldowns.values():
+                cooldown.expire(now)
+            for rule_id in rule_ids:
+                keys = self._keys(rule_id, channel, user)
+                if any(
+                    cooldown.cooling(keys[scope])
+                    for scope, cooldown in self.cooldowns.items()
+                ):
+                    self.suppressed[rule_id] += 1
+                    continue
+                for scope, cooldown in self.cooldowns.items():
+                    cooldown.fire(keys[scope], now)
+                allowed.add(rule_id)
+        return frozenset(allowed)
+
+    def state(self) -> Dict[str, Dict[Hashable, float]]:
+        """Seconds left on every running cooldown, by scope"""
+        now = time.monotonic()
+        with self._lock:
+            for cooldown in self.cooldowns.values():
+                cooldown.expire(now)
+            return {
+                scope: cooldown.remaining(now)
+                for scope, cooldown in self.cooldowns.items()
+            }
+
+    def status_text(self) -> str:
+        state = self.state()
+        lines = [
+            f"*{scope}* ({self.cooldowns[scope].seconds:g}s): "
+            f"{len(remaining)} cooling down"
+            for scope, remaining in state.items()
+        ]
+        for rule_id, count in self.suppressed.most_common(10):
+            lines.append(f"`{rule_id}` suppressed {count} times")
+        return "\n".join(lines)
+
+
+THROTTLE = Throttle()
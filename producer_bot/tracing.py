@@ -0,0 +1,141 @@
+import logging
+import os
+from typing import Dict, Optional, Sequence
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SpanExporter,
+)
+from opentelemetry.sdk.trace.sampling import (
+    ALWAYS_OFF,
+    ALWAYS_ON,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace import Link, SpanKind
+from opentelemetry.util.types import Attributes
+
+LOGGER = logging.getLogger(__name__)
+
+HONEYCOMB_TOKEN = os.environ.get("HONEYCOMB_TOKEN")
+# Where spans go: "otlp", "console" or "none". OTLP needs a Honeycomb token, or
+# an endpoint of your own.
+TRACING_ENDPOINT = os.environ.get("TRACING_ENDPOINT")
+TRACING_EXPORTER = os.environ.get(
+    "TRACING_EXPORTER", "otlp" if HONEYCOMB_TOKEN or TRACING_ENDPOINT else "none"
+).lower()
+# "always_on", "always_off", "ratio", "parent_ratio" or "rules"
+TRACING_SAMPLER = os.environ.get("TRACING_SAMPLER", "rules").lower()
+TRACING_SAMPLE_RATIO = float(os.environ.get("TRACING_SAMPLE_RATIO", "1.0"))
+# Ratios for particular spans, for the "rules" sampler, e.g. "on_user_typing=0.01"
+TRACING_SAMPLE_RULES = os.environ.get(
+    "TRACING_SAMPLE_RULES", "on_user_typing=0.01,on_reaction_removed=0.1"
+)
+TRACING_MAX_QUEUE_SIZE = int(os.environ.get("TRACING_MAX_QUEUE_SIZE", "2048"))
+TRACING_MAX_BATCH_SIZE = int(os.environ.get("TRACING_MAX_BATCH_SIZE", "512"))
+TRACING_EXPORT_DELAY = float(os.environ.get("TRACING_EXPORT_DELAY", "5"))
+
+HONEYCOMB_ENDPOINT = "https://api.honeycomb.io/v1/traces"
+
+
+def parse_rules(rules: str) -> Dict[str, float]:
+    """Span names and their sample ratios, from "name=ratio,name=ratio" """
+    parsed = {}
+    for rule in filter(None, (rule.strip() for rule in rules.split(","))):
+        name, _, ratio = rule.partition("=")
+        parsed[name.strip()] = float(ratio)
+    return parsed
+
+
+class RuleSampler(Sampler):
+    """Samples each span name at its own ratio, and everything else at `default`"""
+
+    def __init__(self, rules: Dict[str, float], default: float = 1.0):
+        self.rules = {name: TraceIdRatioBased(ratio) for name, ratio in rules.items()}
+        self.default = TraceIdRatioBased(default)
+
+    def should_sample(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        parent_context: Optional[Context],
+        trace_id: int,
+        name: str,
+        kind: Optional[SpanKind] = None,
+        attributes: Attributes = None,
+        links: Optional[Sequence[Link]] = None,
+        trace_state=None,
+    ) -> SamplingResult:
+        return self.rules.get(name, self.default).should_sample(
+            parent_context, trace_id, name, kind, attributes, links, trace_state
+        )
+
+    def get_description(self) -> str:
+        rules = ",".join(
+            f"{name}={sampler.rate}" for name, sampler in self.rules.items()
+        )
+        return f"RuleSampler{{{rules},default={self.default.rate}}}"
+
+
+def sampler(name: str, ratio: float, rules: Dict[str, float]) -> Sampler:
+    samplers = {
+        "always_on": lambda: ALWAYS_ON,
+        "always_off": lambda: ALWAYS_OFF,
+        "ratio": lambda: TraceIdRatioBased(ratio),
+        "parent_ratio": lambda: ParentBased(TraceIdRatioBased(ratio)),
+        # child spans follow the decision made for the handler's span
+        "rules": lambda: ParentBased(RuleSampler(rules, ratio)),
+    }
+    if name not in samplers:
+        LOGGER.warning(f"Unknown TRACING_SAMPLER {name!r}, sampling everything")
+        return ALWAYS_ON
+    return samplers[name]()
+
+
+def span_exporter(name: str) -> Optional[SpanExporter]:
+    if name == "console":
+        return ConsoleSpanExporter()
+    if name == "otlp":
+        # pylint: disable=import-outside-toplevel
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        return OTLPSpanExporter(
+            endpoint=TRACING_ENDPOINT or HONEYCOMB_ENDPOINT,
+            headers={"x-honeycomb-team": HONEYCOMB_TOKEN} if HONEYCOMB_TOKEN else {},
+        )
+    if name != "none":
+        LOGGER.warning(f"Unknown TRACING_EXPORTER {name!r}, not tracing")
+    return None
+
+
+def configure_tracing() -> Optional[TracerProvider]:
+    """Set up the global tracer provider from the environment
+
+    With nowhere to export to, the provider is left as the API's no-op one, so
+    spans cost next to nothing and aren't recording.
+    """
+    exporter = span_exporter(TRACING_EXPORTER)
+    if exporter is None:
+        return None
+
+    provider = TracerProvider(
+        sampler=sampler(
+            TRACING_SAMPLER, TRACING_SAMPLE_RATIO, parse_rules(TRACING_SAMPLE_RULES)
+        )
+    )
+    provider.add_span_processor(
+        BatchSpanProcessor(
+            exporter,
+            max_queue_size=TRACING_MAX_QUEUE_SIZE,
+            max_export_batch_size=min(TRACING_MAX_BATCH_SIZE, TRACING_MAX_QUEUE_SIZE),
+            schedule_delay_millis=TRACING_EXPORT_DELAY * 1000,
+        )
+    )
+    trace.set_tracer_provider(provider)
+    return provider
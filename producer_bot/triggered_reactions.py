@@ -1,6 +1,8 @@
-import re
+from typing import FrozenSet, Iterator, List, Optional, Tuple
 
-from slack_sdk import WebClient
+from .features import Message
+from .matcher import Matcher, rule_id
+from .ruleset import matcher_for, table_for
 
 PHRASES = [
     (r"buyers?", "back"),
@@ -38,13 +40,26 @@ PHRASES = [
 ]
 
 
-def handle_message(channel: str, timestamp: int, text: str, web_client: WebClient):
-    for phrase, emoji_to_add in PHRASES:
-        if re.search(phrase, text):
+def rules_for(phrases) -> Iterator[Tuple[str, str]]:
+    return ((rule_id(__name__, phrase), phrase) for phrase, _ in phrases)
+
+
+MATCHER = Matcher(rules_for(PHRASES))
+
+
+def reactions_for(
+    text: str, matches: Optional[FrozenSet[str]] = None
+) -> Iterator[List[str]]:
+    if matches is None:
+        matches = matcher_for("triggered_reactions", MATCHER).match(text)
+
+    for phrase, emoji_to_add in table_for("triggered_reactions", PHRASES):
+        if rule_id(__name__, phrase) in matches:
             if not isinstance(emoji_to_add, list):
                 emoji_to_add = [emoji_to_add]
 
-            for emoji in emoji_to_add:
-                web_client.reactions_add(
-                    channel=channel, timestamp=timestamp, name=emoji
-                )
+            yield emoji_to_add
+
+
+def reactions(message: Message) -> Iterator[List[str]]:
+    return reactions_for(message.text, message.matches)
@@ -0,0 +1,107 @@
+# Vaccination charts, rendered in the chart workers. They import this module to
+# unpickle the plots, so it mustn't do anything else when imported.
+from io import BytesIO
+from typing import Iterable
+
+import matplotlib.dates as mdates
+import pandas as pd
+from matplotlib.figure import Figure
+
+
+def render_png(figure: Figure) -> bytes:
+    """Save a figure as a PNG, in memory"""
+    png = BytesIO()
+    figure.savefig(png, format="png")
+    return png.getvalue()
+
+
+def plot_cumulative_doses(vaccination_data: pd.DataFrame):
+    """Plot the cumulative vaccination dose info"""
+    cumsum = vaccination_data.cumsum()
+    figure = Figure(figsize=(15, 5))
+    ax = figure.add_subplot()
+    cumsum.plot(
+        ax=ax,
+        title="Cumulative vaccinations over time",
+        xlabel="Date",
+        ylabel="Total Vaccinated (million)",
+    )
+    ax.xaxis.set_major_locator(mdates.WeekdayLocator(byweekday=mdates.MO))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%b %d"))
+
+    # Add annotation of the final number
+    for key in vaccination_data.keys():
+        ax.annotate(
+            f"{cumsum[key].max():,}",
+            xy=(1, cumsum[key].max()),
+            xytext=(8, 0),
+            xycoords=("axes fraction", "data"),
+            textcoords="offset points",
+        )
+
+    figure.set_facecolor("white")
+    figure.tight_layout()
+
+    return (
+        render_png(figure),
+        vaccination_data.last_valid_index(),
+        {
+            key: value[vaccination_data.last_valid_index()]
+            for key, value in vaccination_data.items()
+        },
+    )
+
+
+def plot_daily_doses(
+    vaccination_data: pd.DataFrame, rolling_states: Iterable[str] = ("VIC",)
+):
+    """Plot the daily doses and trend line"""
+    include_keys = vaccination_data.keys()
+    vaccination_data = vaccination_data.copy()
+    for key in rolling_states:
+        vaccination_data[f"{key} 7-day"] = (
+            vaccination_data[key].rolling(7).mean().round()
+        )
+        vaccination_data[f"{key} 3-day"] = (
+            vaccination_data[key].rolling(3).mean().round()
+        )
+
+    thirty_day_vax = vaccination_data[vaccination_data.last_valid_index() - 30 :]
+
+    figure = Figure(figsize=(15, 5))
+    ax = figure.add_subplot()
+    thirty_day_vax[include_keys].plot(
+        ax=ax,
+        kind="area",
+        stacked=False,
+        title="Vaccinations per day",
+        xlabel="Date",
+        ylabel="Number Vaccinated",
+    )
+
+    for key in rolling_states:
+        for period in ["3", "7"]:
+            thirty_day_vax[f"{key} {period}-day"].plot.line(ax=ax, marker="o")
+            final_val = int(
+                thirty_day_vax[f"{key} {period}-day"][thirty_day_vax.last_valid_index()]
+            )
+            ax.annotate(
+                f"{final_val:,}",
+                xy=(1, final_val),
+                xytext=(8, 0),
+                xycoords=("axes fraction", "data"),
+                textcoords="offset points",
+            )
+
+    figure.set_facecolor("white")
+    ax.legend()
+    figure.tight_layout()
+
+    return (
+        render_png(figure),
+        thirty_day_vax.last_valid_index(),
+        {
+            key: thirty_day_vax[key][thirty_day_vax.last_valid_index()]
+            for key in include_keys
+        },
+    )
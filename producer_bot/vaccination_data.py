@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import ssl
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from typing import Callable, Dict, Iterable, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # pylint: disable=unused-import
+
+    CACHE_FORMAT = "feather"
+except ImportError:
+    # pyarrow is optional, without it the cache is pickled instead
+    CACHE_FORMAT = "pickle"
+
+LOGGER = logging.getLogger(__name__)
+
+VACCINATION_CACHE_DIR = os.environ.get(
+    "VACCINATION_CACHE_DIR", os.path.join(".cache", "vaccinations")
+)
+VACCINATION_CACHE_TTL = float(os.environ.get("VACCINATION_CACHE_TTL", "3600"))
+# How many of the latest cached days are parsed again, as their figures get revised
+VACCINATION_REFRESH_DAYS = int(os.environ.get("VACCINATION_REFRESH_DAYS", "7"))
+MAX_CONCURRENT_FETCHES = 4
+
+REPORT_URL = "https://covidlive.com.au/report/daily-vaccinations/{state}"
+DATE_FORMAT = "%d %b %y"
+# The first day of the rollout has no net change ("-")
+FIRST_DAY = "15 Feb 21"
+
+# Returns the report page for a state, e.g. "vic"
+Fetcher = Callable[[str], str]
+
+
+def fetch_report(state: str) -> str:
+    """Download a state's daily vaccinations report from covidlive"""
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+
+    with urllib.request.urlopen(
+        REPORT_URL.format(state=state), context=ssl_context, timeout=30
+    ) as response:
+        return response.read().decode("utf-8")
+
+
+class FixtureFetcher:
+    """Reads report pages saved to a directory, e.g. `{directory}/vic.html`"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def __call__(self, state: str) -> str:
+        with open(
+            os.path.join(self.directory, f"{state}.html"), encoding="utf-8"
+        ) as report:
+            return report.read()
+
+
+def parse_report(html: str, known_dates: Optional[pd.Index] = None) -> pd.Series:
+    """The net doses per day from a report page, skipping dates already known"""
+    table = pd.read_html(StringIO(html), attrs={"class": "DAILY-VACCINATIONS"})[0]
+    if known_dates is not None and len(known_dates):
+        # compare the dates as text, so only new rows have to be parsed
+        table = table[~table["DATE"].isin(known_dates.strftime(DATE_FORMAT))]
+
+    net = table["NET"].mask(table["DATE"] == FIRST_DAY, "0")
+    return pd.Series(
+        pd.to_numeric(net).to_numpy(),
+        index=pd.to_datetime(table["DATE"], format=DATE_FORMAT),
+        name="NET",
+    )
+
+
+class VaccinationCache:
+    """Daily doses per state, kept on disk between requests
+
+    A state's report is only downloaded again once its cache file is older than
+    `ttl` seconds, and then only the rows for new dates, and the last
+    `refresh_days` cached ones (which may have been revised), are parsed.
+    States are fetched concurrently.
+    """
+
+    def __init__(
+        self,
+        directory: str = VACCINATION_CACHE_DIR,
+        ttl: float = VACCINATION_CACHE_TTL,
+        fetcher: Fetcher = fetch_report,
+        refresh_days: int = VACCINATION_REFRESH_DAYS,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.fetcher = fetcher
+        self.refresh_days = refresh_days
+        self._locks: Dict[str, threading.Lock] = {}
+
+    def _path(self, state: str) -> str:
+        return os.path.join(self.directory, f"{state}.{CACHE_FORMAT}")
+
+    def _load(self, state: str) -> Optional[pd.Series]:
+        path = self._path(state)
+        if not os.path.exists(path):
+            return None
+        if CACHE_FORMAT == "pickle":
+            return pd.read_pickle(path)
+
+        frame = pd.read_feather(path)
+        return pd.Series(
+            frame["NET"].to_numpy(), index=pd.DatetimeIndex(frame["DATE"]), name="NET"
+        )
+
+    def _save(self, state: str, doses: pd.Series):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(state)
+        # write then rename, so a reader never sees half a file
+        partial = f"{path}.{threading.get_ident()}.tmp"
+        if CACHE_FORMAT == "pickle":
+            doses.to_pickle(partial)
+        else:
+            pd.DataFrame({"DATE": doses.index, "NET": doses.to_numpy()}).to_feather(
+                partial
+            )
+        os.replace(partial, path)
+
+    def _is_fresh(self, state: str) -> bool:
+        return os.path.getmtime(self._path(state)) + self.ttl > time.time()
+
+    def doses(self, state: str) -> pd.Series:
+        """Net doses per day for one state"""
+        with self._locks.setdefault(state, threading.Lock()):
+            cached = self._load(state)
+            if cached is not None and self._is_fresh(state):
+                return cached
+
+            try:
+                html = self.fetcher(state)
+            except OSError as exception:
+                if cached is None:
+                    raise
+                LOGGER.warning(f"Using stale {state} vaccinations: {exception}")
+                return cached
+
+            if cached is None:
+                new = doses = parse_report(html)
+            else:
+                settled = cached.index[: max(0, len(cached) - self.refresh_days)]
+                new = parse_report(html, settled)
+                doses = pd.concat([cached.drop(new.index, errors="ignore"), new])
+            doses = doses.sort_index()
+            self._save(state, doses)
+            LOGGER.info(f"Fetched {len(new)} recent days of {state} vaccinations")
+            return doses
+
+    def get(self, states: Iterable[str]) -> pd.DataFrame:
+        """Net doses per day, with a column per state (e.g. VIC)"""
+        states = list(states)
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(len(states), MAX_CONCURRENT_FETCHES))
+        ) as executor:
+            doses = list(executor.map(self.doses, states))
+
+        data_frame = pd.DataFrame(
+            {state.upper(): state_doses for state, state_doses in zip(states, doses)}
+        ).sort_index()
+        data_frame.index = data_frame.index.to_period("D")
+        return data_frame
+
+    async def get_async(self, states: Iterable[str]) -> pd.DataFrame:
+        """Net doses per day, see get, without blocking the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.get, list(states)
+        )
@@ -1,145 +1,76 @@
 import re
 import ssl
 from datetime import date, time
-from typing import Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
-import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from slack_sdk import WebClient
 
+from .charts import CHARTS
+from .features import Message
+from .vaccination_charts import plot_cumulative_doses, plot_daily_doses
+from .vaccination_data import VaccinationCache
+
 ssl._create_default_https_context = ssl._create_unverified_context
 
+VACCINATIONS = VaccinationCache()
+
 
 def get_vaccination_data(
-    states: list = ["vic"], include_aus: bool = True
+    states: Iterable[str] = ("vic",), include_aus: bool = True
 ) -> pd.DataFrame:
     """Get vaccination data"""
     if include_aus:
-        states.append("aus")
-
-    data_frame: pd.DataFrame = pd.DataFrame()
-    for state in states:
-        vaccinations = pd.read_html(
-            f"https://covidlive.com.au/report/daily-vaccinations/{state}",
-            attrs={"class": "DAILY-VACCINATIONS"},
-            index_col="DATE",
-        )[0]
-
-        vaccinations.at["15 Feb 21", "NET"] = 0
-        vaccinations.index = pd.to_datetime(vaccinations.index, format="%d %b %y")
-
-        if data_frame.empty:
-            data_frame = vaccinations.sort_index()
-            del data_frame["VAR"]
-            del data_frame["NET"]
-            del data_frame["DOSES"]
-
-        data_frame[state.upper()] = pd.to_numeric(vaccinations["NET"])
-        # data_frame[f"{state.upper()} Total"] = vaccinations["DOSES"]
-
-    data_frame.index = data_frame.index.to_period()
-
-    return data_frame
-
+        states = [*states, "aus"]
 
-def plot_cumulative_doses(vaccination_data: pd.DataFrame):
-    """Plot the cumulative vaccination dose info"""
-    cumsum = vaccination_data.cumsum()
-    ax = cumsum.plot(
-        figsize=(15, 5),
-        title="Cumulative vaccinations over time",
-        xlabel="Date",
-        ylabel="Total Vaccinated (million)",
-    )
-    ax.xaxis.set_major_locator(mdates.WeekdayLocator(byweekday=mdates.MO))
-    ax.xaxis.set_major_formatter(mdates.DateFormatter("%b %d"))
-
-    # Add annotation of the final number
-    for key in vaccination_data.keys():
-        plt.annotate(
-            "{:,}".format(cumsum[key].max()),
-            xy=(1, cumsum[key].max()),
-            xytext=(8, 0),
-            xycoords=("axes fraction", "data"),
-            textcoords="offset points",
-        )
-
-    ax.figure.set_facecolor("white")
+    return VACCINATIONS.get(states)
 
-    plt.tight_layout()
-    # ax.figure.savefig("vaccinations_over_time.svg")
-    ax.figure.savefig("vaccinations_over_time.png")
-
-    return (
-        "vaccinations_over_time.png",
-        vaccination_data.last_valid_index(),
-        {
-            key: value[vaccination_data.last_valid_index()]
-            for key, value in vaccination_data.items()
-        },
-    )
 
+async def get_vaccination_data_async(
+    states: Iterable[str] = ("vic",), include_aus: bool = True
+) -> pd.DataFrame:
+    """Get vaccination data, without blocking the event loop"""
+    if include_aus:
+        states = [*states, "aus"]
+
+    return await VACCINATIONS.get_async(states)
+
+
+# (plot, file name, title) of each chart
+Chart = Tuple[Callable[[pd.DataFrame], Any], str, str]
+DAILY_CHART: Chart = (
+    plot_daily_doses,
+    "vaccinations_per_day.png",
+    "Vaccination data for",
+)
+TOTAL_CHART: Chart = (
+    plot_cumulative_doses,
+    "vaccinations_over_time.png",
+    "Total Vaccinations as of",
+)
+CHARTS_FOR = {
+    "daily": [DAILY_CHART],
+    "total": [TOTAL_CHART],
+    "all": [DAILY_CHART, TOTAL_CHART],
+}
+
+
+def charts_requested(text: str) -> List[Chart]:
+    """The charts a message asks for, if any"""
+    match = re.search(r"(all|daily|total) (vax|vaccination) numbers", text)
+    return CHARTS_FOR[match[1]] if match else []
 
-def plot_daily_doses(vaccination_data: pd.DataFrame, rolling_states: list = ["VIC"]):
-    """Plot the daily doses and trend line"""
-    include_keys = vaccination_data.keys()
-    for key in rolling_states:
-        vaccination_data[f"{key} 7-day"] = (
-            vaccination_data[key].rolling(7).mean().round()
-        )
-        vaccination_data[f"{key} 3-day"] = (
-            vaccination_data[key].rolling(3).mean().round()
-        )
 
-    thirty_day_vax = vaccination_data[vaccination_data.last_valid_index() - 30 :]
-
-    # include_aus = "AUS" in vaccination_data
-    # if include_aus:
-    #     for key in include_keys:
-    #         if key != "AUS":
-    #             vaccination_data["AUS"] = vaccination_data["AUS"].subtract(
-    #                 vaccination_data[key]
-    #             )
-
-    ax = thirty_day_vax[include_keys].plot(
-        kind="area",
-        stacked=False,
-        figsize=(15, 5),
-        title="Vaccinations per day",
-        xlabel="Date",
-        ylabel="Number Vaccinated",
-    )
+def reply_thread(text: str, thread_ts: Optional[str], ts: str) -> Optional[str]:
+    """Where to reply: in a new thread if asked, otherwise where it was asked"""
+    return ts if "thread" in text else thread_ts
 
-    for key in rolling_states:
-        for period in ["3", "7"]:
-            thirty_day_vax[f"{key} {period}-day"].plot.line(ax=ax, marker="o")
-            final_val = int(
-                thirty_day_vax[f"{key} {period}-day"][thirty_day_vax.last_valid_index()]
-            )
-            plt.annotate(
-                "{:,}".format(final_val),
-                xy=(1, final_val),
-                xytext=(8, 0),
-                xycoords=("axes fraction", "data"),
-                textcoords="offset points",
-            )
-
-    ax.figure.set_facecolor("white")
-    ax.legend()
-
-    plt.tight_layout()
-    # ax.figure.savefig("vaccinations_per_day.svg")
-    ax.figure.savefig("vaccinations_per_day.png")
 
+def chart_comment(title: str, period: pd.Period, last_figure: Dict) -> str:
     return (
-        "vaccinations_per_day.png",
-        thirty_day_vax.last_valid_index(),
-        {
-            key: thirty_day_vax[key][thirty_day_vax.last_valid_index()]
-            for key in include_keys
-        },
+        f"{title} {period.to_timestamp().strftime('%A, %B %-d, %Y')}: \n"
+        + "\n".join([f" - {key}: {value:,}" for key, value in last_figure.items()])
     )
 
 
@@ -151,40 +82,45 @@ def on_app_mention(
     ts: str,
 ):
     """Trigger event when the app is mentioned"""
-    match = re.search(r"(all|daily|total) (vax|vaccination) numbers", text)
-    if not match:
+    charts = charts_requested(text)
+    if not charts:
         return
 
-    vaccination_data = get_vaccination_data(["vic"])
-
-    post_type = match[1]
-    timestamp = ts if "thread" in text else thread_ts
-    if post_type in ("daily", "all"):
-        (filename, period, last_figure) = plot_daily_doses(
-            vaccination_data.sort_index()
-        )
-        message = (
-            f"Vaccination data for {period.to_timestamp().strftime('%A, %B %-d, %Y')}: \n"
-            + "\n".join([f" - {key}: {value:,}" for key, value in last_figure.items()])
-        )
+    vaccination_data = get_vaccination_data(["vic"]).sort_index()
+    for plot, filename, title in charts:
+        (png, period, last_figure) = CHARTS.render(plot, vaccination_data)
         web_client.files_upload(
             channels=channel,
-            thread_ts=timestamp,
-            file=filename,
-            initial_comment=message,
+            thread_ts=reply_thread(text, thread_ts, ts),
+            file=png,
+            filename=filename,
+            initial_comment=chart_comment(title, period, last_figure),
         )
 
-    if post_type in ("total", "all"):
-        (filename, period, last_figure) = plot_cumulative_doses(
-            vaccination_data.sort_index()
-        )
-        message = (
-            f"Total Vaccinations as of {period.to_timestamp().strftime('%A, %B %-d, %Y')}: \n"
-            + "\n".join([f" - {key}: {value:,}" for key, value in last_figure.items()])
-        )
-        web_client.files_upload(
-            channels=channel,
-            thread_ts=timestamp,
-            file=filename,
-            initial_comment=message,
+
+def on_message(message: Message):
+    on_app_mention(
+        message.web_client,
+        message.text,
+        message.channel,
+        message.thread_ts,
+        message.timestamp,
+    )
+
+
+async def on_message_async(message: Message):
+    """Trigger event when the app is mentioned"""
+    charts = charts_requested(message.text)
+    if not charts:
+        return
+
+    vaccination_data = (await get_vaccination_data_async(["vic"])).sort_index()
+    for plot, filename, title in charts:
+        (png, period, last_figure) = await CHARTS.render_async(plot, vaccination_data)
+        await message.web_client.files_upload(
+            channels=message.channel,
+            thread_ts=reply_thread(message.text, message.thread_ts, message.timestamp),
+            file=png,
+            filename=filename,
+            initial_comment=chart_comment(title, period, last_figure),
         )
@@ -0,0 +1,66 @@
+import logging
+import time
+from typing import Callable, Dict, Iterator, List
+
+import slack_sdk
+
+from .cache import TTLCache
+from .slack_helper import caches_for
+
+LOGGER = logging.getLogger(__name__)
+
+PAGE_SIZE = 200
+
+
+def paginate(method: Callable, key: str, **kwargs) -> Iterator[List[Dict]]:
+    """Yield each page of a cursor-paginated Slack method
+
+    The web client's scheduler paces the requests to the method's rate limit, and
+    retries them when Slack asks it to back off.
+    """
+    cursor = None
+    while True:
+        response = method(limit=PAGE_SIZE, cursor=cursor, **kwargs)
+        yield response.get(key, [])
+
+        cursor = response.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return
+
+
+def warm_cache(cache: TTLCache, method: Callable, key: str, **kwargs) -> int:
+    count = 0
+    for page_number, page in enumerate(paginate(method, key, **kwargs), 1):
+        for item in page:
+            if count >= cache.maxsize:
+                LOGGER.info(f"The {cache.name} cache is full, stopping warm-up")
+                return count
+            cache.set(item["id"], item)
+            count += 1
+        LOGGER.info(f"Warming {cache.name} cache: {count} loaded ({page_number} pages)")
+    return count
+
+
+def warm_caches(web_client: slack_sdk.WebClient) -> Dict[str, int]:
+    """Bulk load the user and channel caches, so the first events don't pay for lookups"""
+    started = time.monotonic()
+    counts: Dict[str, int] = {}
+    try:
+        caches = caches_for(web_client)
+        counts["users"] = warm_cache(caches["users"], web_client.users_list, "members")
+        counts["channels"] = warm_cache(
+            caches["channels"],
+            web_client.conversations_list,
+            "channels",
+            types="public_channel,private_channel,mpim,im",
+            exclude_archived=True,
+        )
+    except Exception:  # pylint: disable=broad-except
+        # it runs in a thread of its own, so nothing else would log this
+        LOGGER.exception(f"Cache warm-up failed, after loading {counts}")
+        return counts
+
+    LOGGER.info(
+        f"Cache warm-up finished in {time.monotonic() - started:.1f}s: {counts}"
+    )
+    return counts
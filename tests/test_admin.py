@@ -0,0 +1,63 @@
+import pytest
+
+from producer_bot import admin
+from producer_bot.features import Message
+
+
+class WebClient:
+    def __init__(self):
+        self.posted = []
+
+    def chat_postEphemeral(self, **kwargs):  # pylint: disable=invalid-name
+        self.posted.append(kwargs)
+
+
+@pytest.fixture(autouse=True)
+def fixture_commands(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_DEBUG_CHANNEL", "CADMIN")
+    monkeypatch.setattr(admin, "ADMIN_USERS", {"UADMIN"})
+    monkeypatch.setattr(
+        admin,
+        "COMMANDS",
+        {"rule profile": lambda: "profile", "rule profile reset": lambda: "reset"},
+    )
+
+
+def mention(text, channel="CADMIN", user="U1"):
+    return Message(
+        web_client=WebClient(),
+        data={"channel": channel, "ts": "1.0", "user": user},
+        text=text,
+        matches=frozenset(),
+        mentioned=text.startswith("<@"),
+    )
+
+
+@pytest.mark.parametrize(
+    "text, reply",
+    [
+        ("<@ubot> rule profile", "profile"),
+        ("<@ubot> rule profile reset", "reset"),
+        ("<@ubot>   rule profile reset ", "reset"),
+        ("rule profile", "profile"),
+    ],
+)
+def test_whole_command(text, reply):
+    message = mention(text)
+    admin.on_mention(message)
+    assert [post["text"] for post in message.web_client.posted] == [reply]
+
+
+@pytest.mark.parametrize(
+    "text", ["<@ubot> show me the rule profile", "<@ubot> rule profile please"]
+)
+def test_not_a_command(text):
+    message = mention(text)
+    admin.on_mention(message)
+    assert not message.web_client.posted
+
+
+def test_only_in_the_admin_channel_or_from_admins():
+    # e.g. anyone in a DM
+    assert admin.command_for(mention("rule profile", channel="D1")) is None
+    assert admin.command_for(mention("rule profile", channel="D1", user="UADMIN"))
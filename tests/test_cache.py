@@ -0,0 +1,202 @@
+import asyncio
+import threading
+
+import pytest
+
+from producer_bot.cache import MISSING, CacheRegistry, CacheSpec, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_expiry():
+    clock = Clock()
+    cache = TTLCache("test", maxsize=10, ttl=5, timer=clock)
+    cache.set("key", "value")
+    clock.now = 4.9
+    assert cache.get("key") == "value"
+    clock.now = 5
+    assert cache.get("key") is MISSING
+    assert cache.stats.hits == 1
+    assert cache.stats.expirations == 1
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = TTLCache("test", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.stats.evictions == 1
+
+
+def test_peek_leaves_stats_and_order():
+    cache = TTLCache("test", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.peek("a") == 1
+    cache.set("c", 3)
+    assert "a" not in cache
+    assert cache.stats.hits == cache.stats.misses == 0
+
+
+def test_get_or_load_is_single_flight():
+    cache = TTLCache("test", maxsize=10, ttl=60)
+    loading = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        loading.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    owner = threading.Thread(
+        target=lambda: results.append(cache.get_or_load("key", loader))
+    )
+    owner.start()
+    loading.wait(5)
+    waiters = [
+        threading.Thread(
+            target=lambda: results.append(cache.get_or_load("key", loader))
+        )
+        for _ in range(5)
+    ]
+    for waiter in waiters:
+        waiter.start()
+    while cache.stats.coalesced < 5:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in [owner, *waiters]:
+        thread.join(5)
+
+    assert results == ["value"] * 6
+    assert len(calls) == 1
+    assert cache.get("key") == "value"
+
+
+def test_get_or_load_error_is_not_cached():
+    cache = TTLCache("test", maxsize=10, ttl=60)
+
+    def fail():
+        raise ValueError("nope")
+
+    with pytest.raises(ValueError):
+        cache.get_or_load("key", fail)
+    assert cache.get_or_load("key", lambda: "value") == "value"
+
+
+def test_get_or_load_async_is_single_flight():
+    cache = TTLCache("test", maxsize=10, ttl=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(
+            *(cache.get_or_load_async("key", loader) for _ in range(5))
+        )
+
+    assert asyncio.run(main()) == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.stats.coalesced == 4
+
+
+def test_cancelled_waiter_leaves_the_load():
+    cache = TTLCache("test", maxsize=10, ttl=60)
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        owner = asyncio.ensure_future(cache.get_or_load_async("key", loader))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_load_async("key", loader))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await owner
+
+    assert asyncio.run(main()) == "value"
+    assert cache.get("key") == "value"
+
+
+def test_cancelled_load_can_be_retried():
+    cache = TTLCache("test", maxsize=10, ttl=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        owner = asyncio.ensure_future(cache.get_or_load_async("key", loader))
+        await asyncio.sleep(0)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        # nothing is left loading, so the next miss loads again
+        return await cache.get_or_load_async("key", loader)
+
+    assert asyncio.run(main()) == "value"
+    assert len(calls) == 2
+
+
+def registry():
+    return CacheRegistry({"users": CacheSpec(10, 60), "channels": CacheSpec(5, 30)})
+
+
+def test_registry_keeps_teams_apart():
+    caches = registry()
+    caches.for_team("T1")["users"].set("U1", "one")
+    assert caches.for_team("T1")["users"].get("U1") == "one"
+    assert caches.for_team("T2")["users"].get("U1") is MISSING
+    assert caches.for_team("T1") is caches.for_team("T1")
+    assert set(caches.stats()) == {"T1", "T2"}
+
+
+def test_registry_limits_before_and_after_a_team_has_caches():
+    caches = registry()
+    caches.set_limits("T1", "users", CacheSpec(2, 5))
+    assert (
+        caches.for_team("T1")["users"].maxsize,
+        caches.for_team("T1")["users"].ttl,
+    ) == (2, 5)
+
+    # an empty cache is still updated
+    users = caches.for_team("T2")["users"]
+    caches.set_limits("T2", "users", CacheSpec(3, 6))
+    assert (users.maxsize, users.ttl) == (3, 6)
+    assert caches.for_team("T3")["users"].maxsize == 10
+
+
+def test_registry_configure():
+    caches = registry()
+    caches.configure({"T1": {"users": {"maxsize": 100}}})
+    assert caches.for_team("T1")["users"].maxsize == 100
+    assert caches.for_team("T1")["users"].ttl == 60
+    assert caches.for_team("T1")["channels"].maxsize == 5
+
+
+@pytest.mark.parametrize(
+    "limits", [{"T1": {"emoji": {"maxsize": 1}}}, {"T1": {"users": {"size": 1}}}]
+)
+def test_registry_configure_rejects(limits):
+    with pytest.raises(ValueError):
+        registry().configure(limits)
@@ -0,0 +1,69 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from producer_bot.charts import ChartService, chart_key
+from producer_bot.vaccination_charts import plot_cumulative_doses, plot_daily_doses
+
+
+def doses(days=40, start="2021-02-15") -> pd.DataFrame:
+    index = pd.period_range(start, periods=days, freq="D")
+    return pd.DataFrame(
+        {"VIC": range(100, 100 + days), "AUS": range(500, 500 + days)}, index=index
+    )
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """Renders in a thread, counting the charts it's asked for"""
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+def service() -> ChartService:
+    charts = ChartService(workers=1)
+    charts._executor = CountingExecutor()  # pylint: disable=protected-access
+    return charts
+
+
+def test_chart_key():
+    key = chart_key(plot_daily_doses, doses(), {})
+    assert chart_key(plot_daily_doses, doses(), {}) == key
+    assert chart_key(plot_cumulative_doses, doses(), {}) != key
+    assert chart_key(plot_daily_doses, doses(), {"rolling_states": ["AUS"]}) != key
+    assert chart_key(plot_daily_doses, doses(start="2021-02-16"), {}) != key
+    changed = doses()
+    changed.iloc[-1, 0] += 1
+    assert chart_key(plot_daily_doses, changed, {}) != key
+
+
+def test_charts_are_only_rendered_once():
+    charts = service()
+    png, period, last_figure = charts.render(plot_daily_doses, doses())
+    assert png.startswith(b"\x89PNG")
+    assert str(period) == "2021-03-26"
+    assert last_figure == {"VIC": 139, "AUS": 539}
+
+    assert charts.render(plot_daily_doses, doses())[0] == png
+    assert asyncio.run(charts.render_async(plot_daily_doses, doses()))[0] == png
+    assert charts._executor.submitted == 1  # pylint: disable=protected-access
+
+    charts.render(plot_cumulative_doses, doses())
+    assert charts._executor.submitted == 2  # pylint: disable=protected-access
+    charts.shutdown()
+
+
+def test_renders_in_a_worker_process():
+    charts = ChartService(workers=1)
+    try:
+        png, _, last_figure = charts.render(plot_cumulative_doses, doses(days=3))
+    finally:
+        charts.shutdown()
+    assert png.startswith(b"\x89PNG")
+    assert last_figure == {"VIC": 102, "AUS": 502}
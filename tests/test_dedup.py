@@ -0,0 +1,74 @@
+import pytest
+
+from producer_bot import dedup
+from producer_bot.dedup import SeenEvents, event_key
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(dedup.time, "monotonic", lambda: clock[0])
+    return clock
+
+
+MESSAGE = {"channel": "C1", "ts": "1.0", "text": "hi"}
+
+
+def test_event_key():
+    assert event_key("message", MESSAGE) == ("message", "C1", "1.0")
+    assert event_key("message", {**MESSAGE, "subtype": "message_changed"}) == (
+        "message/message_changed",
+        "C1",
+        "1.0",
+    )
+    assert event_key(
+        "reaction_added", {"item": {"channel": "C1"}, "event_ts": "2.0"}
+    ) == ("reaction_added", "C1", "2.0")
+    assert event_key("channel_created", {"channel": {"id": "C2"}, "ts": "3.0"}) == (
+        "channel_created",
+        "C2",
+        "3.0",
+    )
+    assert event_key("hello", {}) is None
+
+
+def test_duplicate(clock):  # pylint: disable=unused-argument
+    seen = SeenEvents(window=60)
+    assert not seen.duplicate("message", MESSAGE)
+    assert seen.duplicate("message", dict(MESSAGE))
+    assert not seen.duplicate("message", {**MESSAGE, "ts": "2.0"})
+    assert not seen.duplicate("message", {**MESSAGE, "subtype": "message_changed"})
+    assert seen.suppressed == {"message": 1}
+
+
+def test_events_without_a_key_are_never_duplicates():
+    seen = SeenEvents(window=60)
+    assert not seen.duplicate("hello", {})
+    assert not seen.duplicate("hello", {})
+    assert len(seen) == 0
+
+
+def test_window(clock):
+    seen = SeenEvents(window=60)
+    seen.duplicate("message", MESSAGE)
+    clock[0] = 59
+    assert seen.duplicate("message", MESSAGE)
+    clock[0] = 60
+    assert not seen.duplicate("message", MESSAGE)
+
+
+def test_maxsize(clock):  # pylint: disable=unused-argument
+    seen = SeenEvents(window=60, maxsize=2)
+    for timestamp in ("1.0", "2.0", "3.0"):
+        seen.duplicate("message", {**MESSAGE, "ts": timestamp})
+    assert len(seen) == 2
+    # the oldest was forgotten
+    assert not seen.duplicate("message", MESSAGE)
+
+
+def test_forget(clock):  # pylint: disable=unused-argument
+    seen = SeenEvents(window=60)
+    seen.duplicate("message", MESSAGE)
+    seen.forget("message", MESSAGE)
+    assert not seen.duplicate("message", MESSAGE)
+    seen.forget("hello", {})
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from producer_bot import enrichment
+from producer_bot.enrichment import (
+    NameResolver,
+    set_user_attributes,
+    set_user_attributes_async,
+)
+
+CLIENT = SimpleNamespace(token="xoxb-test")
+
+
+class Span:
+    def __init__(self, recording=True):
+        self.attributes = {}
+        self.recording = recording
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def is_recording(self):
+        return self.recording
+
+
+@pytest.fixture(name="names")
+def fixture_names(monkeypatch):
+    """Names in the cache, and the lookups made for the rest"""
+    names = {"U1": "Sam"}
+    lookups = []
+    looked_up = threading.Event()
+
+    def user_display_name(web_client, user):  # pylint: disable=unused-argument
+        lookups.append(user)
+        looked_up.set()
+        if user == "UBROKEN":
+            raise RuntimeError("no such user")
+        names[user] = user.lower()
+        return names[user]
+
+    async def user_display_name_async(web_client, user):
+        return user_display_name(web_client, user)
+
+    monkeypatch.setattr(
+        enrichment, "cached_user_display_name", lambda web_client, user: names.get(user)
+    )
+    monkeypatch.setattr(enrichment, "user_display_name", user_display_name)
+    monkeypatch.setattr(enrichment, "user_display_name_async", user_display_name_async)
+    monkeypatch.setattr(enrichment, "RESOLVER", NameResolver())
+    return SimpleNamespace(cached=names, lookups=lookups, looked_up=looked_up)
+
+
+def wait_for_lookups(resolver: NameResolver):
+    # pylint: disable-next=protected-access
+    while resolver._pending:
+        time.sleep(0.001)
+
+
+def test_cached_names_are_added_straight_away(names):
+    span = Span()
+    set_user_attributes(span, CLIENT, "U1")
+    assert span.attributes == {"app.user": "U1", "app.user_display_name": "Sam"}
+    assert not names.lookups
+
+
+def test_missing_names_are_looked_up_for_later(names):
+    span = Span()
+    set_user_attributes(span, CLIENT, "U2")
+    assert span.attributes == {"app.user": "U2"}
+    assert names.looked_up.wait(5)
+    wait_for_lookups(enrichment.RESOLVER)
+
+    span = Span()
+    set_user_attributes(span, CLIENT, "U2")
+    assert span.attributes["app.user_display_name"] == "u2"
+    assert names.lookups == ["U2"]
+
+
+def test_spans_not_recording_cost_nothing(names):
+    span = Span(recording=False)
+    set_user_attributes(span, CLIENT, "U2")
+    assert span.attributes == {"app.user": "U2"}
+    assert not names.lookups
+
+
+def test_failed_lookups_dont_stop_the_worker(names):
+    resolver = enrichment.RESOLVER
+    resolver.resolve(CLIENT, "UBROKEN")
+    resolver.resolve(CLIENT, "U3")
+    wait_for_lookups(resolver)
+    assert names.lookups == ["UBROKEN", "U3"]
+    assert names.cached["U3"] == "u3"
+
+
+def test_lookups_are_bounded_and_not_repeated(names):
+    resolver = NameResolver(max_pending=2)
+    # pylint: disable-next=protected-access
+    assert resolver._claim(("xoxb-test", "U2"))
+    # pylint: disable-next=protected-access
+    assert not resolver._claim(("xoxb-test", "U2"))
+    # pylint: disable-next=protected-access
+    assert resolver._claim(("xoxb-test", "U3"))
+    resolver.resolve(CLIENT, "U4")
+    assert resolver.dropped == 1
+    assert not names.lookups
+
+
+def test_async_lookups_run_as_tasks(names):
+    async def main():
+        set_user_attributes_async(Span(), CLIENT, "U2")
+        set_user_attributes_async(Span(), CLIENT, "U2")
+        # pylint: disable-next=protected-access
+        await asyncio.gather(*enrichment.RESOLVER._tasks)
+        span = Span()
+        set_user_attributes_async(span, CLIENT, "U2")
+        return span
+
+    span = asyncio.run(main())
+    assert span.attributes["app.user_display_name"] == "u2"
+    assert names.lookups == ["U2"]
@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from producer_bot.features import Feature, FeatureRouter, Message
+from producer_bot.matcher import Matcher
+from producer_bot.throttle import Throttle
+
+RULE = "test:pizza"
+
+
+def plugin(name, feature, handled):
+    async def on_message_async(message):
+        handled.append((name, message.channel))
+
+    module = SimpleNamespace(
+        on_message=lambda message: handled.append((name, message.channel)),
+        on_message_async=on_message_async,
+    )
+    return SimpleNamespace(
+        name=name,
+        matcher=Matcher([(RULE, "pizza")]),
+        features=[feature],
+        load=lambda: module,
+    )
+
+
+def pizza_message(channel="C1", user="U1", **data):
+    return Message(
+        web_client=None,
+        data={"channel": channel, "ts": "1.0", "user": user, **data},
+        text="pizza",
+        matches=frozenset({RULE}),
+        mentioned=False,
+    )
+
+
+@pytest.fixture(name="handled")
+def fixture_handled():
+    return []
+
+
+def router(handled, **feature):
+    return FeatureRouter(
+        [
+            plugin(
+                "test",
+                Feature(
+                    "on_message",
+                    "on_message_async",
+                    triggered=True,
+                    throttled=True,
+                    **feature,
+                ),
+                handled,
+            )
+        ],
+        Throttle(rule=0, channel=60, user=0),
+    )
+
+
+def test_routes_by_rule(handled):
+    routes = router(handled)
+    routes.dispatch(pizza_message())
+    routes.dispatch(
+        Message(None, {"channel": "C1", "ts": "2.0"}, "nope", frozenset(), False)
+    )
+    assert handled == [("test", "C1")]
+
+
+def test_throttled_per_channel(handled):
+    routes = router(handled)
+    for channel in ["C1", "C1", "C2"]:
+        routes.dispatch(pizza_message(channel))
+    assert handled == [("test", "C1"), ("test", "C2")]
+    assert routes.throttle.suppressed == {RULE: 1}
+
+
+@pytest.mark.parametrize(
+    "feature, ignored",
+    [
+        ({"skip_bots": True}, {"bot_id": "B1"}),
+        ({"channels": frozenset({"C1"})}, {"channel": "C2"}),
+    ],
+)
+def test_ignored_messages_dont_start_a_cooldown(handled, feature, ignored):
+    routes = router(handled, **feature)
+    routes.dispatch(pizza_message(**ignored))
+    assert not handled
+    routes.dispatch(pizza_message())
+    assert handled == [("test", "C1")]
+    assert not routes.throttle.suppressed
+
+
+def test_dispatch_async(handled):
+    routes = router(handled, skip_bots=True)
+
+    async def main():
+        await routes.dispatch_async(pizza_message(bot_id="B1"))
+        await routes.dispatch_async(pizza_message())
+        await routes.dispatch_async(pizza_message())
+
+    asyncio.run(main())
+    assert handled == [("test", "C1")]
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+from slack_sdk.signature import SignatureVerifier
+
+from producer_bot import ingest
+from producer_bot.dedup import SeenEvents
+from producer_bot.ingest import EVENTS_PATH, HttpEventsSource, Ingestor, event_source
+
+SECRET = "test-secret"
+MESSAGE = {"type": "message", "channel": "C1", "ts": "1.0", "text": "hi"}
+
+
+@pytest.fixture(name="dedup")
+def fixture_dedup(monkeypatch):
+    dedup = SeenEvents()
+    monkeypatch.setattr(ingest, "DEDUP", dedup)
+    return dedup
+
+
+@pytest.fixture(name="source")
+def fixture_source(dedup):  # pylint: disable=unused-argument
+    # never started, so events stay queued
+    source = HttpEventsSource(Ingestor({}, None, None, maxsize=1), SECRET, port=0)
+    thread = threading.Thread(target=source.server.serve_forever, daemon=True)
+    thread.start()
+    yield source
+    source.stop()
+    source.server.server_close()
+
+
+def post(source, body: bytes, secret: str = SECRET) -> int:
+    timestamp = str(int(time.time()))
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{source.port}{EVENTS_PATH}",
+        body,
+        {
+            "Content-Type": "application/json",
+            "X-Slack-Request-Timestamp": timestamp,
+            "X-Slack-Signature": SignatureVerifier(secret).generate_signature(
+                timestamp=timestamp, body=body
+            ),
+        },
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def callback(event) -> bytes:
+    return json.dumps({"type": "event_callback", "event": event}).encode()
+
+
+def test_submit_drops_duplicates(dedup):
+    ingestor = Ingestor({}, None, None, maxsize=10)
+    assert ingestor.submit(MESSAGE)
+    assert ingestor.submit(MESSAGE)
+    assert ingestor.stats == {"queued": 1, "duplicate": 1}
+    assert len(dedup) == 1
+
+
+def test_submit_forgets_a_refused_event(dedup):
+    ingestor = Ingestor({}, None, None, maxsize=1)
+    assert ingestor.submit(MESSAGE)
+    refused = {**MESSAGE, "ts": "2.0"}
+    assert not ingestor.submit(refused)
+    assert ingestor.stats == {"queued": 1, "dropped": 1}
+    # so Slack's retry isn't taken for a duplicate
+    assert not dedup.duplicate("message", refused)
+
+
+def test_handle():
+    handled = []
+    ingestor = Ingestor(
+        {"message": lambda data, **kwargs: handled.append(data)}, None, None
+    )
+    ingestor.handle(MESSAGE)
+    ingestor.handle({"type": "unknown"})
+    assert handled == [{"channel": "C1", "ts": "1.0", "text": "hi"}]
+    assert ingestor.stats == {"handled": 1, "unhandled": 1}
+
+
+def test_http_needs_a_signing_secret():
+    with pytest.raises(ValueError):
+        HttpEventsSource(Ingestor({}, None, None), "", port=0)
+
+
+def test_http_rejects_a_bad_signature(source):
+    assert post(source, callback(MESSAGE), secret="wrong") == 401
+    assert not source.ingestor.stats
+
+
+def test_http_queues_events_until_full(source):
+    assert post(source, callback(MESSAGE)) == 200
+    assert post(source, callback({**MESSAGE, "ts": "2.0"})) == 503
+    assert source.ingestor.stats == {"queued": 1, "dropped": 1}
+
+
+@pytest.mark.parametrize(
+    "body", [b"{not json", b"[]", b'{"type": "event_callback", "event": 1}']
+)
+def test_http_rejects_a_malformed_body(source, body):
+    assert post(source, body) == 400
+
+
+def test_url_verification(source):
+    assert source.respond(b'{"type": "url_verification", "challenge": "c"}') == (
+        200,
+        b'{"challenge": "c"}',
+    )
+
+
+def test_event_source():
+    with pytest.raises(ValueError):
+        event_source("carrier pigeon", Ingestor({}, None, None))
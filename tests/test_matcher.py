@@ -0,0 +1,67 @@
+import re
+
+import pytest
+
+from producer_bot import corrector, parrot, reposter, triggered_reactions
+from producer_bot.matcher import NO_MATCHES, Matcher
+from producer_bot.profiler import RuleProfile
+
+RULES = [
+    *triggered_reactions.rules_for(triggered_reactions.PHRASES),
+    *corrector.rules_for(corrector.CORRECT_PHRASES),
+    *reposter.rules_for(reposter.REPOST_PHRASES),
+    *parrot.rules_for(parrot.TRIGGERED_EMOJI),
+    # overlapping, and anchored, rules
+    ("test:cat", r"cat"),
+    ("test:catalog", r"\bcatalog\b"),
+    ("test:start", r"^hello"),
+    ("test:end", r"bye$"),
+    ("test:group", r"(a|b)+c"),
+]
+
+TEXTS = [
+    "",
+    "nothing to see here",
+    "the catalog has a cat in it",
+    "hello world, bye",
+    "say hello, then bye bye",
+    "abababc",
+    "I parked in the garage and checked a box",
+    "covid quarantine :rip: :wave:",
+    "CLICKOPS click ops clickops",
+    "delete everything in prod",
+]
+
+
+def expected(rules, text):
+    return frozenset(rule_id for rule_id, pattern in rules if re.search(pattern, text))
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_match_is_per_pattern_search(text):
+    assert Matcher(RULES).match(text) == expected(RULES, text)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_profiled_match_is_per_pattern_search(text):
+    matcher = Matcher(RULES)
+    matcher.profile = RuleProfile()
+    assert matcher.match(text) == expected(RULES, text)
+    assert all(stats.evaluations == 1 for stats in matcher.profile.rules.values())
+
+
+def test_every_rule_can_match():
+    # each rule on its own, so the combined scan can't hide any of them
+    matcher = Matcher(RULES)
+    for rule_id, pattern in [("test:cat", "cat"), ("test:group", "bc")]:
+        assert rule_id in matcher.match(f"x {pattern} x")
+    assert expected(RULES, "garage") <= matcher.match("garage")
+
+
+def test_no_rules():
+    assert Matcher([]).match("anything") is NO_MATCHES
+
+
+def test_add():
+    combined = Matcher([("a", "apple")]) + Matcher([("b", "banana")])
+    assert combined.match("apple banana") == {"a", "b"}
@@ -0,0 +1,29 @@
+import urllib.request
+
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from producer_bot import metrics
+from producer_bot.metrics import serve_metrics, serve_prometheus
+
+
+def test_nothing_is_served_on_import():
+    assert metrics.READER is None
+    assert serve_metrics() is None
+
+
+def test_serve_prometheus_locally():
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter(__name__)
+    meter.create_counter("test.calls").add(2, {"method": "users.info"})
+
+    server = serve_prometheus(reader, 0)
+    try:
+        host, port = server.server_address
+        assert host == "127.0.0.1"
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert 'test_calls_total{method="users.info"} 2' in body
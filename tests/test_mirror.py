@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+import pytest
+
+from producer_bot import mirror
+from producer_bot.mirror import ReactionMirror, TypingLimiter
+
+
+class FakeTimer:
+    """Started timers wait here, until a test fires them"""
+
+    started = []
+
+    def __init__(self, interval, function, args):
+        self.interval = interval
+        self.function = function
+        self.args = args
+        self.daemon = False
+
+    def start(self):
+        self.started.append(self)
+
+    def fire(self):
+        self.function(*self.args)
+
+
+@pytest.fixture(name="sent")
+def fixture_sent(monkeypatch):
+    sent = []
+
+    def add_reactions(web_client, channel, timestamp, chains):
+        sent.append((web_client.token, "add", channel, timestamp, chains))
+        return []
+
+    def remove_reactions(web_client, item, names):
+        sent.append((web_client.token, "remove", item["channel"], item["ts"], names))
+        return []
+
+    monkeypatch.setattr(mirror, "add_reactions", add_reactions)
+    monkeypatch.setattr(mirror, "remove_reactions", remove_reactions)
+    monkeypatch.setattr(mirror.threading, "Timer", FakeTimer)
+    FakeTimer.started = []
+    return sent
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(mirror.time, "monotonic", lambda: clock[0])
+    return clock
+
+
+def client(token):
+    return SimpleNamespace(token=token)
+
+
+def test_mirror_batches_and_cancels(sent):
+    reaction_mirror = ReactionMirror(window=2)
+    web_client = client("a")
+    reaction_mirror.add(web_client, "C1", "1.0", "wave")
+    reaction_mirror.add(web_client, "C1", "1.0", "rip")
+    reaction_mirror.remove(web_client, "C1", "1.0", "rip")
+    assert len(FakeTimer.started) == 1
+    FakeTimer.started[0].fire()
+    assert sent == [("a", "add", "C1", "1.0", [["wave"]])]
+    assert reaction_mirror.stats == {"cancelled": 2, "sent": 1, "batches": 1}
+
+
+def test_mirror_keeps_workspaces_apart(sent):
+    reaction_mirror = ReactionMirror(window=2)
+    reaction_mirror.add(client("a"), "C1", "1.0", "wave")
+    reaction_mirror.add(client("b"), "C2", "2.0", "wave")
+    reaction_mirror.remove(client("b"), "C2", "3.0", "rip")
+    assert len(FakeTimer.started) == 2
+
+    FakeTimer.started[1].fire()
+    assert sent == [
+        ("b", "add", "C2", "2.0", [["wave"]]),
+        ("b", "remove", "C2", "3.0", ["rip"]),
+    ]
+    FakeTimer.started[0].fire()
+    assert sent[2:] == [("a", "add", "C1", "1.0", [["wave"]])]
+
+
+def test_mirror_without_a_window(sent):
+    reaction_mirror = ReactionMirror(window=0)
+    reaction_mirror.add(client("a"), "C1", "1.0", "wave")
+    assert sent == [("a", "add", "C1", "1.0", [["wave"]])]
+    assert not FakeTimer.started
+
+
+def test_typing_limiter(clock):
+    limiter = TypingLimiter(interval=3)
+    assert limiter.allow("C1")
+    assert not limiter.allow("C1")
+    assert limiter.allow("C2")
+    clock[0] = 3.0
+    assert limiter.allow("C1")
+    assert limiter.stats == {"sent": 3, "skipped": 1}
+
+
+def test_typing_limiter_forgets_quiet_channels(clock):
+    limiter = TypingLimiter(interval=3)
+    for number in range(100):
+        assert limiter.allow(f"C{number}")
+    clock[0] = 2.0
+    assert limiter.allow("C100")
+    clock[0] = 4.0
+    assert limiter.allow("C101")
+    # pylint: disable-next=protected-access
+    assert list(limiter._last_sent) == ["C100", "C101"]
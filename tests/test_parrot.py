@@ -0,0 +1,212 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from producer_bot import parrot
+from producer_bot.features import Message
+from producer_bot.parrot import (
+    COUNT_KEY,
+    TARGET_KEY,
+    Parrot,
+    Target,
+    nominee,
+    reaction_outcome,
+    stop_reply,
+)
+from producer_bot.state import MemoryStore, SQLiteStore
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(parrot.time, "time", lambda: clock[0])
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def fixture_max_targets(monkeypatch):
+    monkeypatch.setattr(parrot, "PARROT_MAX_TARGETS", 2)
+
+
+def test_emoji_only_start_as_many_as_there_are_slots():
+    store = MemoryStore()
+    replicas = [Parrot(None, store), Parrot(None, store)]
+    assert replicas[0].start_parroting("U1")
+    assert not replicas[1].start_parroting("U1")
+    assert replicas[1].start_parroting("U2")
+    assert not replicas[0].start_parroting("U3")
+    # nominations aren't limited
+    assert replicas[0].start_parroting("U3", "U9")
+    assert [target.user for target in replicas[1].targets()] == ["U1", "U2", "U3"]
+
+
+def test_replicas_racing_stay_within_the_limit(tmp_path):
+    path = str(tmp_path / "state.db")
+    replicas = [Parrot(None, SQLiteStore(path)) for _ in range(4)]
+    with ThreadPoolExecutor(8) as executor:
+        started = list(
+            executor.map(
+                lambda number: replicas[number % 4].start_parroting(f"U{number}"),
+                range(20),
+            )
+        )
+    assert started.count(True) == 2
+    assert len(replicas[0].targets()) == 2
+
+
+def test_stopping_frees_the_slot_and_the_count():
+    bird = Parrot(None, MemoryStore())
+    assert bird.start_parroting("U1")
+    assert bird.start_parroting("U2")
+    bird.count_message("U1")
+    assert bird.stop_parroting("U1")
+    assert not bird.stop_parroting("U1")
+    assert bird.store.get(COUNT_KEY.format(user="U1")) is None
+    assert bird.start_parroting("U3")
+
+
+def test_expiry_frees_the_slot_and_the_count(clock):
+    bird = Parrot(None, MemoryStore())
+    assert bird.start_parroting("U1")
+    assert bird.start_parroting("U2")
+    bird.count_message("U1")
+    clock[0] += parrot.PARROT_EXPIRY
+    assert bird.start_parroting("U3")
+    # taking over U1's slot cleared up after them
+    assert bird.store.get(TARGET_KEY + "U1") is None
+    assert bird.store.get(COUNT_KEY.format(user="U1")) is None
+    assert bird.target("U2") is None
+    assert [target.user for target in bird.targets()] == ["U3"]
+
+
+def test_stop_asked_stops_who_is_named():
+    bird = Parrot(None, MemoryStore())
+    assert bird.stop_asked("<@ubot> stop it") is None
+    bird.start_parroting("U1")
+    bird.start_parroting("U2")
+    assert bird.stop_asked("<@ubot> stop it <@u2>") == ["U2"]
+    bird.start_parroting("U3", "U9")
+    # no one named is being parroted, so everyone's stopped
+    assert bird.stop_asked("<@ubot> stop it <@u2>") == ["U1", "U3"]
+    assert stop_reply("U9", []) == "<@U9> OK. :pouting_cat:"
+
+
+def test_nominee():
+    assert nominee("<@ubot> parrot <@u1>") == "U1"
+    assert nominee("<@ubot> parrot status") is None
+
+
+def test_reaction_outcome(monkeypatch):
+    monkeypatch.setattr(parrot, "random", lambda: 0.5)
+    assert reaction_outcome(Target("U1", 0), "thumbsup") == "mirror"
+    assert reaction_outcome(None, "thumbsup") is None
+    assert reaction_outcome(None, "wave") is None
+    assert reaction_outcome(None, "rip") == "parrot"
+
+
+def test_count_parroted():
+    bird = Parrot(None, MemoryStore())
+    bird.start_parroting("U1")
+    counted = [bird.count_parroted("U1") for _ in range(parrot.PARROT_LIMIT)]
+    assert [mock for mock, _ in counted].count(True) == (
+        parrot.PARROT_LIMIT // parrot.MOCK_FREQUENCY
+    )
+    assert [stopped for _, stopped in counted] == [False] * (
+        parrot.PARROT_LIMIT - 1
+    ) + [True]
+    assert bird.target("U1") is None
+
+
+class WebClient:
+    def __init__(self):
+        self.posted = []
+
+    def chat_postMessage(self, **kwargs):  # pylint: disable=invalid-name
+        self.posted.append(kwargs)
+
+
+def chat(user, text="hello", ts="1.0"):
+    return Message(
+        web_client=WebClient(),
+        data={"channel": "C1", "ts": ts, "user": user},
+        text=text,
+        matches=frozenset(),
+        mentioned=False,
+    )
+
+
+def test_targets_are_counted_and_expire_apart(clock, monkeypatch):
+    monkeypatch.setattr(parrot, "is_user_a_bot", lambda web_client, user: False)
+    bird = Parrot(None, MemoryStore())
+    assert bird.start_parroting("U1")
+    clock[0] += 60
+    assert bird.start_parroting("U2", "U9")
+
+    mocked = []
+    for number in range(parrot.MOCK_FREQUENCY):
+        for user in ("U1", "U2") if number % 2 else ("U1",):
+            message = chat(user, f"message {number}")
+            bird.on_message(message)
+            mocked.extend(post["blocks"] for post in message.web_client.posted)
+    # only U1 sent enough messages to be mocked
+    assert mocked == [parrot.mock_blocks(f"message {parrot.MOCK_FREQUENCY - 1}")]
+    assert bird.store.get(COUNT_KEY.format(user="U2")) == str(
+        parrot.MOCK_FREQUENCY // 2
+    )
+
+    targets = bird.targets()
+    assert [(target.user, target.nominated_by) for target in targets] == [
+        ("U1", None),
+        ("U2", "U9"),
+    ]
+    assert targets[1].expires - targets[0].expires == 60
+    clock[0] += parrot.PARROT_EXPIRY - 30
+    assert bird.target("U1") is None
+    assert bird.target("U2") is not None
+
+
+def test_reactions_only_mirror_targets(monkeypatch):
+    monkeypatch.setattr(parrot, "is_user_a_bot", lambda web_client, user: False)
+    bird = Parrot(None, MemoryStore())
+    mirrored = []
+    monkeypatch.setattr(
+        bird.mirror, "add", lambda web_client, *args: mirrored.append(args)
+    )
+    bird.start_parroting("U1")
+    bird.start_parroting("U2")
+    for user in ("U1", "U2", "U3"):
+        bird.on_reaction_added(WebClient(), "thumbsup", "C1", "1.0", user)
+    assert mirrored == [("C1", "1.0", "thumbsup"), ("C1", "1.0", "thumbsup")]
+
+
+class ThreadRecordingStore:
+    """A store which isn't in memory, as far as Parrot knows"""
+
+    def __init__(self):
+        self.store = MemoryStore()
+        self.threads = set()
+
+    def __getattr__(self, name):
+        self.threads.add(threading.get_ident())
+        return getattr(self.store, name)
+
+
+class RTMClient:
+    def __init__(self):
+        self.typing_in = []
+
+    async def typing(self, channel: str):
+        self.typing_in.append(channel)
+
+
+def test_async_lookups_are_off_the_event_loop():
+    store = ThreadRecordingStore()
+    bird = Parrot(None, store)
+    bird.start_parroting("U1", "U9")
+    store.threads.clear()
+    rtm_client = RTMClient()
+    asyncio.run(bird.on_user_typing(rtm_client, "C1", "U1"))
+    assert rtm_client.typing_in == ["C1"]
+    assert store.threads and threading.get_ident() not in store.threads
@@ -0,0 +1,51 @@
+from producer_bot import plugins
+from producer_bot.features import Feature
+from producer_bot.plugins import PLUGINS, VACCINATION_NUMBERS, Plugin, startup_report
+
+FEATURES = [Feature("on_message", "on_message_async", triggered=True)]
+
+
+def test_plugins_with_rules_load_on_first_use(monkeypatch):
+    imported = []
+    monkeypatch.setattr(
+        plugins.importlib,
+        "import_module",
+        lambda name: imported.append(name) or name,
+    )
+    plugin = Plugin("vaccinations", FEATURES, rules=[("test:vax", VACCINATION_NUMBERS)])
+    assert not plugin.loaded and not imported
+    assert plugin.matcher.match("all vax numbers please") == {"test:vax"}
+
+    assert plugin.load() == "producer_bot.vaccinations"
+    plugin.load()
+    assert imported == ["producer_bot.vaccinations"]
+    assert plugin.loaded and plugin.import_seconds is not None
+
+
+def test_plugins_without_rules_load_straight_away():
+    plugin = Plugin("dice_roller", FEATURES)
+    assert plugin.loaded
+    assert plugin.matcher is plugin.load().MATCHER
+
+
+def test_startup_report(monkeypatch):
+    loaded = Plugin("dice_roller", FEATURES)
+    loaded.import_seconds = 0.0123
+    monkeypatch.setattr(
+        plugins,
+        "PLUGINS",
+        {
+            "dice_roller": loaded,
+            "vaccinations": Plugin("vaccinations", FEATURES, rules=[]),
+        },
+    )
+    report = startup_report()
+    assert report.startswith("Started in ")
+    assert "MiB" in report
+    assert report.endswith(
+        "Plugin imports: dice_roller 12.3ms, vaccinations (not loaded)"
+    )
+
+
+def test_vaccinations_arent_imported_until_asked_for():
+    assert not PLUGINS["vaccinations"].loaded
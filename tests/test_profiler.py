@@ -0,0 +1,31 @@
+from producer_bot.profiler import RuleProfile
+
+
+def profiled() -> RuleProfile:
+    profile = RuleProfile()
+    profile.record([("test:fast", True, 0.001), ("test:slow", False, 0.004)])
+    profile.record([("test:fast", False, 0.001), ("test:slow", False, 0.002)])
+    profile.record([("test:never", False, 0.0005)])
+    return profile
+
+
+def test_report_slowest_first():
+    assert profiled().report().split("\n") == [
+        "`test:slow` 6.0ms over 2 messages (3000.0µs each), 0 matches",
+        "`test:fast` 2.0ms over 2 messages (1000.0µs each), 1 matches",
+        "`test:never` 0.5ms over 1 messages (500.0µs each), 0 matches",
+        "Never matched: test:never, test:slow",
+    ]
+
+
+def test_report_limit():
+    lines = profiled().report(limit=1).split("\n")
+    assert lines[0].startswith("`test:slow`")
+    # every rule which never matched is still listed
+    assert lines[1:] == ["Never matched: test:never, test:slow"]
+
+
+def test_report_when_empty_or_reset():
+    profile = profiled()
+    assert profile.reset() == "Rule profile reset"
+    assert profile.report() == "No rules have been profiled, is RULE_PROFILING set?"
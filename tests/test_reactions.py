@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import slack_sdk
+
+from producer_bot import reactions
+from producer_bot.reactions import (
+    MAX_CONCURRENT_REACTIONS,
+    ReactionLog,
+    ReactionResult,
+    add_reactions,
+    add_reactions_async,
+)
+
+
+def recent(seconds_ago: float = 1) -> str:
+    return f"{time.time() - seconds_ago:.6f}"
+
+
+def test_log_covers_recent_messages():
+    log = ReactionLog(window=60, maxsize=10)
+    log.started -= 60
+    timestamp = recent()
+    assert log.get("C1", timestamp) == set()
+    log.add("C1", timestamp, "wave")
+    log.add("C1", timestamp, "rip")
+    log.discard("C1", timestamp, "rip")
+    assert log.get("C1", timestamp) == {"wave"}
+    # too old to be sure of
+    assert log.get("C1", recent(120)) is None
+
+
+def test_log_doesnt_cover_messages_from_before_it_started():
+    log = ReactionLog(window=60, maxsize=10)
+    assert log.get("C1", recent()) is None
+
+
+def test_log_stops_covering_what_it_drops():
+    log = ReactionLog(window=60, maxsize=2)
+    log.started -= 60
+    timestamps = [recent(seconds_ago) for seconds_ago in (3, 2, 1)]
+    for timestamp in timestamps:
+        log.add("C1", timestamp, "wave")
+    assert log.get("C1", timestamps[0]) is None
+    assert log.get("C1", timestamps[2]) == {"wave"}
+
+
+def test_log_without_a_window_covers_nothing():
+    log = ReactionLog(window=0, maxsize=10)
+    log.started -= 60
+    timestamp = recent()
+    log.add("C1", timestamp, "wave")
+    assert log.get("C1", timestamp) is None
+
+
+def api_error(error: str) -> slack_sdk.errors.SlackApiError:
+    # only the response's error is read
+    return slack_sdk.errors.SlackApiError(error, {"ok": False, "error": error})
+
+
+class WebClient:
+    """Records the reactions added, and how many were being added at once"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.added = []
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _start(self, name: str):
+        with self._lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+            self.added.append(name)
+
+    def _finish(self, name: str):
+        with self._lock:
+            self.in_flight -= 1
+        if name in self.errors:
+            raise api_error(self.errors[name])
+
+    def reactions_add(
+        self, channel, timestamp, name
+    ):  # pylint: disable=unused-argument
+        self._start(name)
+        time.sleep(0.01)
+        self._finish(name)
+
+
+class AsyncWebClient(WebClient):
+    async def reactions_add(
+        self, channel, timestamp, name
+    ):  # pylint: disable=invalid-overridden-method,unused-argument
+        self._start(name)
+        await asyncio.sleep(0.01)
+        self._finish(name)
+
+
+@pytest.fixture(name="log")
+def fixture_log(monkeypatch):
+    log = ReactionLog(window=60, maxsize=10)
+    log.started -= 60
+    monkeypatch.setattr(reactions, "BOT_REACTIONS", log)
+    return log
+
+
+CHAINS = [["one", "one-again"], ["tp"], ["one", "yikes"], []]
+EXPECTED = [
+    ReactionResult("one", True, None),
+    ReactionResult("one-again", False, "already_reacted"),
+    ReactionResult("tp", False, "invalid_name"),
+    ReactionResult("yikes", True, None),
+]
+
+
+def check_added(web_client, log, timestamp):
+    # each chain in order, without repeating a reaction
+    assert sorted(web_client.added) == ["one", "one-again", "tp", "yikes"]
+    assert web_client.added.index("one") < web_client.added.index("one-again")
+    # the bot's reaction is there either way, but not one that failed
+    assert log.get("C1", timestamp) == {"one", "one-again", "yikes"}
+
+
+def test_add_reactions(log):
+    web_client = WebClient({"one-again": "already_reacted", "tp": "invalid_name"})
+    timestamp = recent()
+    assert add_reactions(web_client, "C1", timestamp, CHAINS) == EXPECTED
+    check_added(web_client, log, timestamp)
+
+
+def test_add_reactions_async(log):
+    web_client = AsyncWebClient({"one-again": "already_reacted", "tp": "invalid_name"})
+    timestamp = recent()
+    assert (
+        asyncio.run(add_reactions_async(web_client, "C1", timestamp, CHAINS))
+        == EXPECTED
+    )
+    check_added(web_client, log, timestamp)
+
+
+@pytest.mark.parametrize("client", [WebClient, AsyncWebClient])
+def test_concurrent_reactions_are_capped(
+    log, client
+):  # pylint: disable=unused-argument
+    web_client = client()
+    chains = [[f"emoji-{number}"] for number in range(MAX_CONCURRENT_REACTIONS * 3)]
+    if client is WebClient:
+        results = add_reactions(web_client, "C1", recent(), chains)
+    else:
+        results = asyncio.run(add_reactions_async(web_client, "C1", recent(), chains))
+    assert all(result.ok for result in results)
+    assert 1 < web_client.most_in_flight <= MAX_CONCURRENT_REACTIONS
@@ -0,0 +1,170 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from producer_bot import corrector, rules, ruleset, triggered_reactions
+from producer_bot.matcher import Matcher
+from producer_bot.rules import RuleError, RuleReloader, read_rule_file
+
+CORRECTION = {"match": "garage", "message": "garbage", "emoji": "x", "name": "g"}
+REPOST = {
+    "match": "pizza",
+    "channel": "C1",
+    "description": "food",
+    "emoji": "pizza",
+}
+
+
+def write(tmp_path, data, name="rules.json"):
+    path = tmp_path / name
+    path.write_text(json.dumps(data) if name.endswith(".json") else data)
+    return str(path)
+
+
+def test_read_json_and_toml(tmp_path):
+    data = {"triggered_reactions": [{"match": "pizza", "emoji": "pineapple"}]}
+    assert read_rule_file(write(tmp_path, data)) == data
+    toml = '[[triggered_reactions]]\nmatch = "pizza"\nemoji = "pineapple"\n'
+    assert read_rule_file(write(tmp_path, toml, "rules.toml")) == data
+
+
+@pytest.mark.parametrize(
+    "name, content",
+    [
+        ("rules.json", "{not json"),
+        ("rules.json", "[]"),
+        ("rules.json", '{"unknown": []}'),
+        ("rules.ini", "{}"),
+    ],
+)
+def test_read_bad_file(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content)
+    with pytest.raises(RuleError):
+        read_rule_file(str(path))
+
+
+@pytest.mark.parametrize(
+    "entries",
+    [
+        {"match": "pizza"},
+        [{"match": "pizza"}],
+        [{"match": "(", "emoji": "x"}],
+        [{"match": "", "emoji": "x"}],
+        [{"match": "pizza", "emoji": 1}],
+        [{"match": "pizza", "emoji": []}],
+        [{"match": "pizza", "emoji": ["x", 1]}],
+    ],
+)
+def test_parse_phrases_rejects(entries):
+    with pytest.raises(RuleError):
+        rules.parse_phrases(entries)
+
+
+@pytest.mark.parametrize(
+    "pattern", [r"(o)\1", r"(?i)pizza", r"(?P<food>pizza)", r"(x)(?(1)a|b)"]
+)
+def test_parse_phrases_rejects_what_cant_be_matched_together(pattern):
+    with pytest.raises(RuleError):
+        rules.parse_phrases([{"match": pattern, "emoji": "x"}])
+
+
+@pytest.mark.parametrize("pattern", [r"a\\1", r"(?i:pizza)", r"(?<=a)b", r"(a|b)+c"])
+def test_parse_phrases_allows(pattern):
+    assert rules.parse_phrases([{"match": pattern, "emoji": "x"}])
+
+
+def test_parse_phrases():
+    assert rules.parse_phrases(
+        [{"match": "pizza", "emoji": "pineapple"}, {"match": "a", "emoji": ["b"]}]
+    ) == [("pizza", "pineapple"), ("a", ["b"])]
+
+
+@pytest.mark.parametrize("field", ["match", "message", "emoji", "name"])
+def test_parse_corrections_needs_every_field(field):
+    entry = dict(CORRECTION)
+    del entry[field]
+    with pytest.raises(RuleError):
+        rules.parse_corrections([entry])
+
+
+def test_parse_reposts():
+    (phrase,) = rules.parse_reposts([REPOST])
+    assert phrase.channel == "C1"
+    assert not phrase.ephemeral
+
+
+@pytest.mark.parametrize("ephemeral", ["false", 1, None])
+def test_parse_rejects_an_ephemeral_which_isnt_a_bool(ephemeral):
+    with pytest.raises(RuleError):
+        rules.parse_reposts([{**REPOST, "ephemeral": ephemeral}])
+    with pytest.raises(RuleError):
+        rules.parse_corrections([{**CORRECTION, "ephemeral": ephemeral}])
+
+
+def test_parse_reposts_allows_a_description_matching_itself():
+    # the reposter skips bots, so its reply doesn't trigger it again
+    assert rules.parse_reposts([{**REPOST, "description": "pizza places"}])
+
+
+@pytest.mark.parametrize("entries", [[], {"rip": 2}, {"rip": -0.1}, {"rip": "1"}])
+def test_parse_emoji_chances_rejects(entries):
+    with pytest.raises(RuleError):
+        rules.parse_emoji_chances(entries)
+
+
+@pytest.fixture(name="reloader")
+def fixture_reloader(tmp_path):
+    path = tmp_path / "rules.json"
+    plugins = [
+        SimpleNamespace(name=name, matcher=table.module.MATCHER)
+        for name, table in rules.TABLES.items()
+    ]
+    router = SimpleNamespace(refresh=lambda: None)
+    reloader = RuleReloader(plugins, Matcher([]), router, path=str(path))
+    yield reloader
+    ruleset.LOADED = None
+
+
+def test_reload(reloader):
+    with open(reloader.path, "w", encoding="utf-8") as rule_file:
+        json.dump(
+            {"triggered_reactions": [{"match": "pizza", "emoji": "x"}]}, rule_file
+        )
+    assert reloader.reload().startswith("Loaded")
+    assert ruleset.table_for("triggered_reactions", None) == [("pizza", "x")]
+    assert ruleset.matcher_for("triggered_reactions", None).match("pizza") == {
+        "producer_bot.triggered_reactions:pizza"
+    }
+    combined = ruleset.combined(reloader.matcher)
+    assert "producer_bot.triggered_reactions:pizza" in combined.match("pizza")
+    assert list(triggered_reactions.reactions_for("pizza")) == [["x"]]
+    # the other tables are the built-in ones
+    assert ruleset.table_for("corrector", None) is corrector.CORRECT_PHRASES
+    assert combined.match("garage")
+    assert not reloader.changed()
+
+
+def test_reload_keeps_the_rules_when_rejected(reloader):
+    with open(reloader.path, "w", encoding="utf-8") as rule_file:
+        json.dump({"corrector": [CORRECTION, {"match": "("}]}, rule_file)
+    assert reloader.reload().startswith("Kept the current rules")
+    assert ruleset.LOADED is None
+    assert reloader.stats == {"rejected": 1}
+
+
+def test_reload_keeps_the_loaded_rules_when_rejected(reloader):
+    with open(reloader.path, "w", encoding="utf-8") as rule_file:
+        json.dump({"corrector": [CORRECTION]}, rule_file)
+    reloader.reload()
+    loaded = ruleset.LOADED
+    with open(reloader.path, "w", encoding="utf-8") as rule_file:
+        json.dump({"corrector": [{**CORRECTION, "ephemeral": "false"}]}, rule_file)
+    assert reloader.reload().startswith("Kept the current rules")
+    assert ruleset.LOADED is loaded
+
+
+def test_reload_without_a_file():
+    reloader = RuleReloader([], Matcher([]), None, path="")
+    assert "no RULES_FILE" in reloader.reload()
@@ -0,0 +1,263 @@
+# the bucket and waiter accounting is checked directly
+# pylint: disable=protected-access
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import slack_sdk
+
+from producer_bot import scheduler
+from producer_bot.events import off_loop
+from producer_bot.scheduler import OutboundScheduler, TokenBucket
+
+UNLIMITED = 1e9
+
+
+def test_bucket_bursts_then_refills():
+    bucket = TokenBucket(rate=60, capacity=2)
+    now = bucket.updated
+    assert bucket.reserve(now) == 0
+    assert bucket.reserve(now) == 0
+    # one token a second
+    assert bucket.reserve(now) == pytest.approx(1)
+    assert bucket.reserve(now + 0.5) == pytest.approx(0.5)
+    assert bucket.reserve(now + 1) == 0
+
+
+def test_bucket_default_capacity():
+    assert TokenBucket(rate=20).capacity == 2
+    assert TokenBucket(rate=1).capacity == 1
+
+
+def test_bucket_pause():
+    bucket = TokenBucket(rate=60, capacity=5)
+    now = bucket.updated
+    bucket.pause(now, 3)
+    assert bucket.reserve(now + 1) == pytest.approx(2)
+    assert bucket.reserve(now + 3) == 0
+    assert bucket.reserve(now + 3) > 0
+    assert not bucket.is_idle(now + 3)
+
+
+def test_buckets_are_per_method_and_per_channel_for_messages():
+    outbound = OutboundScheduler(limits={}, default_limit=UNLIMITED)
+    assert outbound._bucket("users.info", "C1") is outbound._bucket("users.info", "C2")
+    assert outbound._bucket("chat.postMessage", "C1") is not outbound._bucket(
+        "chat.postMessage", "C2"
+    )
+
+
+def test_idle_buckets_are_dropped(monkeypatch):
+    monkeypatch.setattr(scheduler, "MAX_BUCKETS", 3)
+    outbound = OutboundScheduler(limits={}, default_limit=UNLIMITED)
+    for channel in ("C1", "C2", "C3", "C4"):
+        outbound._bucket("chat.postMessage", channel)
+    assert list(outbound._buckets) == [("chat.postMessage", "C4")]
+
+
+def test_calls_are_paced():
+    outbound = OutboundScheduler(limits={"users.info": 600}, default_limit=UNLIMITED)
+    started = time.monotonic()
+    # a burst of 60, then one every 0.1s
+    for _ in range(62):
+        outbound.call("users.info", lambda: None, {})
+    assert time.monotonic() - started >= 0.15
+    assert outbound.stats.requests == 62
+
+
+def test_in_flight_is_limited():
+    outbound = OutboundScheduler(max_in_flight=2, limits={}, default_limit=UNLIMITED)
+    most = []
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            most.append(outbound.stats.in_flight)
+        time.sleep(0.01)
+
+    threads = [
+        threading.Thread(target=outbound.call, args=("users.info", request, {}))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert max(most) == 2
+    assert outbound.stats.in_flight == 0
+    assert outbound.stats.queued == {"interactive": 0, "lookup": 0, "cosmetic": 0}
+
+
+def test_slots_go_to_the_highest_priority():
+    outbound = OutboundScheduler(max_in_flight=1, limits={}, default_limit=UNLIMITED)
+    release = threading.Event()
+    order = []
+    holder = threading.Thread(
+        target=outbound.call, args=("users.info", lambda: release.wait(5), {})
+    )
+    holder.start()
+    while not outbound.stats.in_flight:
+        time.sleep(0.001)
+
+    threads = []
+    for method in ("reactions.add", "users.info", "chat.postMessage"):
+        threads.append(
+            threading.Thread(
+                target=outbound.call,
+                args=(method, lambda method=method: order.append(method), {}),
+            )
+        )
+        threads[-1].start()
+        while len(outbound._waiters) < len(threads):
+            time.sleep(0.001)
+    release.set()
+    for thread in [holder, *threads]:
+        thread.join(5)
+    assert order == ["chat.postMessage", "users.info", "reactions.add"]
+
+
+def rate_limited():
+    response = slack_sdk.web.SlackResponse(
+        client=None,
+        http_verb="POST",
+        api_url="",
+        req_args={},
+        data={"ok": False, "error": "ratelimited"},
+        headers={"Retry-After": "0.01"},
+        status_code=429,
+    )
+    return slack_sdk.errors.SlackApiError("ratelimited", response)
+
+
+def test_rate_limits_are_retried():
+    outbound = OutboundScheduler(limits={}, default_limit=UNLIMITED)
+    attempts = []
+
+    def request():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise rate_limited()
+        return "ok"
+
+    assert outbound.call("users.info", request, {}) == "ok"
+    assert outbound.stats.rate_limited == 2
+    assert outbound.stats.in_flight == 0
+
+
+def test_retries_give_up(monkeypatch):
+    monkeypatch.setattr(scheduler, "MAX_RETRIES", 1)
+    outbound = OutboundScheduler(limits={}, default_limit=UNLIMITED)
+
+    def request():
+        raise rate_limited()
+
+    with pytest.raises(slack_sdk.errors.SlackApiError):
+        outbound.call("users.info", request, {})
+    assert outbound.stats.failed == 1
+    assert outbound.stats.in_flight == 0
+
+
+def test_async_in_flight_is_limited():
+    outbound = OutboundScheduler(max_in_flight=2, limits={}, default_limit=UNLIMITED)
+    most = []
+
+    async def request():
+        most.append(outbound.stats.in_flight)
+        await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(
+            *(outbound.call_async("users.info", request, {}) for _ in range(8))
+        )
+
+    asyncio.run(main())
+    assert max(most) == 2
+    assert outbound.stats.in_flight == 0
+
+
+def test_cancelled_async_waiter_gives_its_slot_back():
+    outbound = OutboundScheduler(max_in_flight=1, limits={}, default_limit=UNLIMITED)
+
+    async def main():
+        holder = asyncio.ensure_future(
+            outbound.call_async("users.info", lambda: asyncio.sleep(0.02), {})
+        )
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(
+            outbound.call_async("users.info", lambda: asyncio.sleep(0), {})
+        )
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(holder, waiter, return_exceptions=True)
+
+    asyncio.run(main())
+    assert outbound.stats.in_flight == 0
+    assert not outbound._waiters
+
+
+def test_blocking_handlers_dont_block_the_loop():
+    # a blocking handler waits for the slot a coroutine holds on the same loop
+    outbound = OutboundScheduler(max_in_flight=1, limits={}, default_limit=UNLIMITED)
+
+    def handler(**_kwargs):
+        outbound.call("users.info", lambda: None, {})
+
+    async def main():
+        holder = asyncio.ensure_future(
+            outbound.call_async("users.info", lambda: asyncio.sleep(0.01), {})
+        )
+        await asyncio.sleep(0)
+        await asyncio.wait_for(off_loop(handler)(data={}), 5)
+        await holder
+
+    asyncio.run(main())
+    assert outbound.stats.requests == 2
+
+
+def test_blocking_and_async_calls_queue_together():
+    outbound = OutboundScheduler(max_in_flight=1, limits={}, default_limit=UNLIMITED)
+    release = threading.Event()
+    order = []
+    holder = threading.Thread(
+        target=outbound.call, args=("users.info", lambda: release.wait(5), {})
+    )
+    holder.start()
+    while not outbound.stats.in_flight:
+        time.sleep(0.001)
+
+    async def main():
+        cosmetic = asyncio.ensure_future(
+            outbound.call_async(
+                "reactions.add", lambda: asyncio.sleep(0, order.append("async")), {}
+            )
+        )
+        interactive = threading.Thread(
+            target=outbound.call,
+            args=("chat.postMessage", lambda: order.append("blocking"), {}),
+        )
+        interactive.start()
+        while len(outbound._waiters) < 2:
+            await asyncio.sleep(0.001)
+        release.set()
+        await cosmetic
+        interactive.join(5)
+
+    asyncio.run(main())
+    holder.join(5)
+    assert order == ["blocking", "async"]
+    assert outbound.stats.in_flight == 0
+
+
+def test_one_scheduler_per_token(monkeypatch):
+    monkeypatch.setattr(scheduler, "SCHEDULERS", {})
+    barrier = threading.Barrier(8)
+
+    def get():
+        barrier.wait()
+        return scheduler.get_scheduler("xoxb-test")
+
+    with ThreadPoolExecutor(8) as executor:
+        schedulers = list(executor.map(lambda _: get(), range(8)))
+    assert all(found is schedulers[0] for found in schedulers)
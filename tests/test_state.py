@@ -0,0 +1,112 @@
+import threading
+
+import fakeredis
+import pytest
+
+from producer_bot import state
+
+
+@pytest.fixture(name="redis_server")
+def fixture_redis_server(monkeypatch):
+    """A Redis stand-in, which every RedisStore connects to whatever its URL"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        state.redis.Redis,
+        "from_url",
+        lambda url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs),
+    )
+    return server
+
+
+@pytest.fixture(name="store", params=["memory", "sqlite", "redis"])
+def fixture_store(request, tmp_path):
+    if request.param == "memory":
+        return state.MemoryStore()
+    if request.param == "sqlite":
+        return state.SQLiteStore(str(tmp_path / "state.db"))
+    request.getfixturevalue("redis_server")
+    return state.RedisStore("redis://localhost:6379/0")
+
+
+def test_get_set_delete(store):
+    assert store.get("key") is None
+    store.set("key", "value")
+    assert store.get("key") == "value"
+    store.delete("key")
+    assert store.get("key") is None
+    store.delete("key")
+
+
+def test_compare_and_set(store):
+    assert store.compare_and_set("key", None, "first")
+    assert not store.compare_and_set("key", None, "second")
+    assert not store.compare_and_set("key", "second", "third")
+    assert store.get("key") == "first"
+
+    assert store.compare_and_set("key", "first", "second")
+    assert store.get("key") == "second"
+    assert store.compare_and_set("key", "second", None)
+    assert store.get("key") is None
+    assert not store.compare_and_set("key", "second", None)
+
+
+def test_compare_and_set_empty_string(store):
+    # the Redis script is given "" for None, which mustn't be confused with it
+    assert not store.compare_and_set("key", "", "value")
+    store.set("key", "")
+    assert not store.compare_and_set("key", None, "value")
+    assert store.compare_and_set("key", "", "value")
+
+
+def test_incr(store):
+    assert store.incr("counter") == 1
+    assert store.incr("counter", 5) == 6
+    assert store.incr("counter", -2) == 4
+    assert store.get("counter") == "4"
+
+
+def test_scan(store):
+    store.set("parrot:C1", "U1")
+    store.set("parrot:C2", "U2")
+    store.set("other", "x")
+    assert store.scan("parrot:") == {"parrot:C1": "U1", "parrot:C2": "U2"}
+    assert store.scan("missing:") == {}
+
+
+def test_compare_and_set_is_atomic(store):
+    # every thread tries to claim the key, and exactly one can
+    claimed = []
+    threads = [
+        threading.Thread(
+            target=lambda n=n: claimed.append(store.compare_and_set("key", None, n))
+        )
+        for n in map(str, range(20))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert claimed.count(True) == 1
+
+
+def test_redis_stores_share_state(redis_server):  # pylint: disable=unused-argument
+    first = state.RedisStore("redis://localhost:6379/0")
+    second = state.RedisStore("redis://localhost:6379/0")
+    assert first.compare_and_set("key", None, "first")
+    assert not second.compare_and_set("key", None, "second")
+    assert second.get("key") == "first"
+
+
+def test_state_store(tmp_path, redis_server):  # pylint: disable=unused-argument
+    assert isinstance(state.state_store("memory://"), state.MemoryStore)
+    assert isinstance(state.state_store("bogus://"), state.MemoryStore)
+    assert isinstance(
+        state.state_store(f"sqlite:///{tmp_path}/state.db"), state.SQLiteStore
+    )
+    assert isinstance(state.state_store("redis://localhost/0"), state.RedisStore)
+
+
+def test_state_store_without_redis(monkeypatch):
+    monkeypatch.setattr(state, "redis", None)
+    with pytest.raises(RuntimeError):
+        state.state_store("redis://localhost/0")
@@ -0,0 +1,59 @@
+import pytest
+
+from producer_bot import throttle
+from producer_bot.throttle import Throttle
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: clock[0])
+    return clock
+
+
+def test_channel_cooldown(clock):
+    limiter = Throttle(rule=0, channel=60, user=0)
+    assert limiter.allow({"a", "b"}, "C1", "U1") == {"a", "b"}
+    assert limiter.allow({"a"}, "C1", "U2") == set()
+    assert limiter.allow({"a"}, "C2", "U1") == {"a"}
+    clock[0] = 60
+    assert limiter.allow({"a"}, "C1", "U2") == {"a"}
+    assert limiter.suppressed == {"a": 1}
+
+
+def test_user_cooldown(clock):
+    limiter = Throttle(rule=0, channel=0, user=10)
+    assert limiter.allow({"a"}, "C1", "U1") == {"a"}
+    assert limiter.allow({"a"}, "C2", "U1") == set()
+    assert limiter.allow({"a"}, "C2", "U2") == {"a"}
+    clock[0] = 10
+    assert limiter.allow({"a"}, "C2", "U1") == {"a"}
+
+
+def test_rule_cooldown(clock):  # pylint: disable=unused-argument
+    limiter = Throttle(rule=30, channel=0, user=0)
+    assert limiter.allow({"a"}, "C1", "U1") == {"a"}
+    assert limiter.allow({"a", "b"}, "C2", "U2") == {"b"}
+
+
+def test_suppressed_triggers_dont_restart_the_cooldown(clock):
+    limiter = Throttle(rule=0, channel=60, user=0)
+    limiter.allow({"a"}, "C1", "U1")
+    clock[0] = 59
+    limiter.allow({"a"}, "C1", "U1")
+    clock[0] = 60
+    assert limiter.allow({"a"}, "C1", "U1") == {"a"}
+
+
+def test_no_cooldowns():
+    limiter = Throttle(rule=0, channel=0, user=0)
+    for _ in range(3):
+        assert limiter.allow({"a"}, "C1", "U1") == {"a"}
+    assert not any(limiter.state().values())
+
+
+def test_state(clock):
+    limiter = Throttle(rule=0, channel=60, user=10)
+    limiter.allow({"a"}, "C1", "U1")
+    clock[0] = 15
+    assert limiter.state() == {"rule": {}, "channel": {("a", "C1"): 45}, "user": {}}
@@ -0,0 +1,67 @@
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, Decision, ParentBased
+from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+
+from producer_bot.tracing import RuleSampler, parse_rules, sampler, span_exporter
+
+TRACE_ID = 0x5CE0E9A56015FEC5AADFA328AE398115
+
+
+def sampled(chosen, name, parent=None) -> bool:
+    result = chosen.should_sample(parent, TRACE_ID, name)
+    return result.decision == Decision.RECORD_AND_SAMPLE
+
+
+def parent_context(is_sampled: bool):
+    span_context = SpanContext(
+        trace_id=TRACE_ID,
+        span_id=0x1,
+        is_remote=False,
+        trace_flags=TraceFlags(
+            TraceFlags.SAMPLED if is_sampled else TraceFlags.DEFAULT
+        ),
+    )
+    return trace.set_span_in_context(NonRecordingSpan(span_context))
+
+
+def test_parse_rules():
+    assert parse_rules(" on_user_typing=0.01, on_hello = 1,,") == {
+        "on_user_typing": 0.01,
+        "on_hello": 1.0,
+    }
+    assert not parse_rules("")
+
+
+def test_rule_sampler():
+    rules = RuleSampler({"on_user_typing": 0.0}, default=1.0)
+    assert not sampled(rules, "on_user_typing")
+    assert sampled(rules, "on_message")
+    assert rules.get_description() == "RuleSampler{on_user_typing=0.0,default=1.0}"
+
+
+def test_rules_sampler_follows_the_handler_span():
+    rules = sampler("rules", 1.0, {"on_user_typing": 0.0})
+    assert isinstance(rules, ParentBased)
+    assert not sampled(rules, "on_message", parent_context(False))
+    # a child span is sampled with its parent, whatever its name
+    assert sampled(rules, "on_user_typing", parent_context(True))
+
+
+@pytest.mark.parametrize(
+    "name, ratio, expected",
+    [("always_off", 1.0, False), ("ratio", 0.0, False), ("parent_ratio", 1.0, True)],
+)
+def test_samplers(name, ratio, expected):
+    assert sampled(sampler(name, ratio, {}), "on_message") == expected
+
+
+def test_unknown_sampler_samples_everything():
+    assert sampler("sometimes", 0.0, {}) is ALWAYS_ON
+
+
+def test_span_exporter():
+    assert isinstance(span_exporter("console"), ConsoleSpanExporter)
+    assert span_exporter("none") is None
+    assert span_exporter("carrier pigeon") is None
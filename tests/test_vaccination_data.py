@@ -0,0 +1,54 @@
+import pandas as pd
+
+from producer_bot.vaccination_data import FixtureFetcher, VaccinationCache, parse_report
+
+
+def report(rows) -> str:
+    cells = "".join(f"<tr><td>{date}</td><td>{net}</td></tr>" for date, net in rows)
+    return (
+        '<table class="DAILY-VACCINATIONS">'
+        f"<tr><th>DATE</th><th>NET</th></tr>{cells}</table>"
+    )
+
+
+def write_fixture(directory, rows):
+    directory.mkdir()
+    (directory / "vic.html").write_text(report(rows), encoding="utf-8")
+    return FixtureFetcher(str(directory))
+
+
+FIRST = [("17 Feb 21", "200"), ("16 Feb 21", "100"), ("15 Feb 21", "-")]
+# a new day, and the day before it revised
+SECOND = [("18 Feb 21", "300"), ("17 Feb 21", "250")] + FIRST[1:]
+
+
+def test_fetches_new_and_revised_days(tmp_path):
+    cache = VaccinationCache(
+        str(tmp_path / "cache"),
+        ttl=0,
+        fetcher=write_fixture(tmp_path / "first", FIRST),
+        refresh_days=1,
+    )
+    assert cache.doses("vic").tolist() == [0, 100, 200]
+
+    cache.fetcher = write_fixture(tmp_path / "second", SECOND)
+    doses = cache.doses("vic")
+    pd.testing.assert_series_equal(doses, parse_report(report(SECOND)).sort_index())
+    # and it was cached that way
+    cache.ttl = 3600
+    pd.testing.assert_series_equal(cache.doses("vic"), doses)
+
+
+def test_revisions_outside_the_window_are_kept(tmp_path):
+    cache = VaccinationCache(
+        str(tmp_path / "cache"),
+        ttl=0,
+        fetcher=write_fixture(tmp_path / "first", FIRST),
+        refresh_days=1,
+    )
+    cache.doses("vic")
+    cache.fetcher = write_fixture(
+        tmp_path / "second",
+        [("18 Feb 21", "300"), ("17 Feb 21", "250"), ("16 Feb 21", "999")],
+    )
+    assert cache.doses("vic").tolist() == [0, 100, 250, 300]
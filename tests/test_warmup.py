@@ -0,0 +1,74 @@
+import logging
+
+import pytest
+import slack_sdk
+
+from producer_bot import warmup
+from producer_bot.cache import TTLCache
+from producer_bot.warmup import PAGE_SIZE, paginate, warm_caches
+
+USERS = [{"id": f"U{number}"} for number in range(5)]
+CHANNELS = [{"id": "C1"}, {"id": "D1"}]
+
+
+def pages(key, items, size=2):
+    """A cursor-paginated method listing the items, and the calls made to it"""
+    calls = []
+
+    def method(limit, cursor, **kwargs):
+        calls.append({"limit": limit, "cursor": cursor, **kwargs})
+        start = int(cursor or 0)
+        response = {key: items[start : start + size]}
+        if start + size < len(items):
+            response["response_metadata"] = {"next_cursor": str(start + size)}
+        return response
+
+    return method, calls
+
+
+def failing(**_kwargs):
+    raise slack_sdk.errors.SlackClientError("connection reset")
+
+
+class WebClient:
+    def __init__(self):
+        self.users_list, self.user_calls = pages("members", USERS)
+        self.conversations_list, self.channel_calls = pages("channels", CHANNELS)
+
+
+@pytest.fixture(name="caches")
+def fixture_caches(monkeypatch):
+    caches = {
+        "users": TTLCache("users", maxsize=4, ttl=60),
+        "channels": TTLCache("channels", maxsize=10, ttl=60),
+    }
+    monkeypatch.setattr(warmup, "caches_for", lambda web_client: caches)
+    return caches
+
+
+def test_paginate_follows_the_cursor():
+    method, calls = pages("members", USERS)
+    assert list(paginate(method, "members", presence=False)) == [
+        USERS[:2],
+        USERS[2:4],
+        USERS[4:],
+    ]
+    assert [call["cursor"] for call in calls] == [None, "2", "4"]
+    assert calls[0] == {"limit": PAGE_SIZE, "cursor": None, "presence": False}
+
+
+def test_warm_caches_stops_when_full(caches):
+    web_client = WebClient()
+    assert warm_caches(web_client) == {"users": 4, "channels": 2}
+    assert "U3" in caches["users"] and "U4" not in caches["users"]
+    assert "D1" in caches["channels"]
+    assert web_client.channel_calls[0]["exclude_archived"]
+
+
+def test_warm_caches_logs_failures(caches, caplog):
+    web_client = WebClient()
+    web_client.conversations_list = failing
+    with caplog.at_level(logging.ERROR, logger=warmup.__name__):
+        assert warm_caches(web_client) == {"users": 4}
+    assert "Cache warm-up failed" in caplog.text
+    assert "U0" in caches["users"]